@@ -0,0 +1,99 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, json, hashlib, threading, traceback
+
+# From custom modules
+from config_handler import ConfigHandler
+import state_store
+
+# Increase whenever the file analysis prompts change, so that results from the old prompts are not reused
+PROMPT_VERSION = 1
+
+class AnalysisCache:
+    # Results of file part analyses, kept on disk so that analysing the same (or an appended) file again
+    # only sends new or changed parts to the LLM.
+    lock = threading.Lock()
+    cache = None
+    cache_dir = ""
+    size_limit = 0
+    fingerprints = {}   # (model path, size, mtime): model fingerprint, as fingerprinting reads 32MB of the model file
+    hits = 0
+    misses = 0
+
+def default_cache_dir():
+    return os.path.join(ConfigHandler.dirname, "cache", "analysis")
+
+def get_cache():
+    # Returns the diskcache.Cache set in config.ini, or None if disabled. Reopened if its size was changed.
+    if ConfigHandler.cp["AI"]["analysis_cache"] != "on":
+        return None
+    size_limit = int(ConfigHandler.cp["AI"]["analysis_cache_size_mb"]) << 20
+    with AnalysisCache.lock:
+        if AnalysisCache.cache is None or AnalysisCache.size_limit != size_limit:
+            import diskcache    # Imported here so that it is only loaded when a file is analysed
+            if AnalysisCache.cache is not None:
+                AnalysisCache.cache.close()
+            AnalysisCache.cache_dir = default_cache_dir()
+            AnalysisCache.size_limit = size_limit
+            # Least recently used results are evicted once size_limit is exceeded
+            AnalysisCache.cache = diskcache.Cache(AnalysisCache.cache_dir, size_limit = size_limit, eviction_policy = "least-recently-used")
+        return AnalysisCache.cache
+
+def model_id(llm):
+    stat = os.stat(llm.model_path)
+    file_key = (os.path.abspath(llm.model_path), stat.st_size, stat.st_mtime)
+    with AnalysisCache.lock:
+        fingerprint = AnalysisCache.fingerprints.get(file_key)
+    if fingerprint is None:
+        fingerprint = state_store.model_fingerprint(llm.model_path)
+        with AnalysisCache.lock:
+            AnalysisCache.fingerprints[file_key] = fingerprint
+    return fingerprint
+
+def cache_key(messages, llm, sampling):
+    # Content-addressed key: the exact prompt (which holds the part's text), the model file, context size, KV cache types,
+    # flash attention, prompt template, sampling settings and prompt version. A change to any of them gives a different key.
+    # A quantized KV cache (see 'Performance' config) changes what the LLM replies, so its results are kept apart from f16's.
+    key = json.dumps({"messages": messages, "model": model_id(llm), "n_ctx": llm.n_ctx(), "chat_format": str(llm.chat_format),
+                      "kv_cache": state_store.kv_cache_types(llm), "flash_attn": bool(llm.context_params.flash_attn),
+                      "sampling": sampling, "prompt_version": PROMPT_VERSION}, sort_keys = True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def get(key):
+    # Returns the cached result, or None if there is none (or the cache is disabled)
+    cache = get_cache()
+    if cache is None:
+        return None
+    try:
+        result = cache.get(key)
+    except:
+        traceback.print_exc()
+        result = None
+    with AnalysisCache.lock:
+        if result is None:
+            AnalysisCache.misses += 1
+        else:
+            AnalysisCache.hits += 1
+    return result
+
+def put(key, result):
+    cache = get_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(key, result)
+    except:
+        traceback.print_exc()
+
+def reset_stats():
+    with AnalysisCache.lock:
+        AnalysisCache.hits = 0
+        AnalysisCache.misses = 0
+
+def stats():
+    # Short text for the status line, or "" if the cache is disabled
+    if ConfigHandler.cp["AI"]["analysis_cache"] != "on":
+        return ""
+    return " Cache: "+str(AnalysisCache.hits)+" reused, "+str(AnalysisCache.misses)+" new."
@@ -0,0 +1,292 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, sys, json, time, uuid, argparse, threading, traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# From custom modules
+from config_handler import ConfigHandler
+import ui_bridge
+import tokenizer_service
+from chat_session import ChatSession
+import core_funcs
+from core_funcs import LlmProcess
+import session_engine
+import headless
+
+# Serves the LLM in config.ini to other programs on this computer, with an OpenAI-compatible API:
+#   python main.py --serve [--host 127.0.0.1] [--port 8080]
+# - GET  /v1/models                              The loaded LLM
+# - POST /v1/chat/completions                    Reply to "messages", streamed as server-sent events if "stream" is true
+# - POST /v1/chat/completions/<id>/cancel        Stop a reply in progress. Closing the connection of a streamed reply also stops it.
+# A reply's id is the request's X-Request-Id header if the client sent one (so that it can cancel a reply that is not streamed before
+# it has ended), or else a new "chatcmpl-..." id, and is sent back in the response's X-Request-Id header. A cancelled reply ends with
+# finish_reason "stop", with the text generated so far.
+# Replies are generated on session_slots contexts of the LLM (see session_engine), so several clients are replied to at the same time
+# without using the chat window's LLM context or LlmProcess.is_running. Requests wait for a free slot, up to api_queue_size of them.
+# Beyond that, requests are turned away with 429 (Too Many Requests) so that clients back off instead of piling up.
+# Requests without a system message get SOLAIRIA's personality. Requests with the same "user" go back to the same slot where possible,
+# so their earlier turns are reused from the slot's KV cache.
+
+class ApiServer:
+    lock = threading.Lock()
+    admitted = 0    # Requests that are being replied to or waiting for a slot
+    cancels = {}    # Request id: threading.Event that stops its reply
+
+class RequestError(Exception):
+    # Invalid request, returned to the client as an OpenAI-style error with status
+    def __init__(self, status, message, error_type = "invalid_request_error"):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+def queue_limit():
+    return session_engine.slot_count() + max(0, int(ConfigHandler.cp["AI"]["api_queue_size"]))
+
+def admit(request_id):
+    # Returns the cancel Event of the request, or None if too many requests are already queued
+    with ApiServer.lock:
+        if request_id in ApiServer.cancels:
+            raise RequestError(409, "A reply with id "+request_id+" is already in progress.")
+        if ApiServer.admitted >= queue_limit():
+            return None
+        ApiServer.admitted += 1
+        cancel = threading.Event()
+        ApiServer.cancels[request_id] = cancel
+        return cancel
+
+def finish(request_id):
+    with ApiServer.lock:
+        ApiServer.admitted -= 1
+        ApiServer.cancels.pop(request_id, None)
+
+def client_request_id(value):
+    # The request id a client chose for its reply, or None if it did not send one
+    if value is None or not value.strip():
+        return None
+    value = value.strip()
+    if len(value) > 128 or not all(c.isalnum() or c in "-_.:" for c in value):
+        raise RequestError(400, "X-Request-Id must be up to 128 letters, digits, '-', '_', '.' or ':'.")
+    return value
+
+def model_name():
+    return os.path.basename(LlmProcess.llm.model_path) if LlmProcess.llm is not None else ""
+
+def message_text(content):
+    # Content can be text, or a list of parts (only text parts are used)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text")
+    raise RequestError(400, "Message content must be text or a list of text parts.")
+
+def parse_request(body):
+    # Returns (messages, generation settings) of a chat completion request
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not messages:
+        raise RequestError(400, "'messages' must be a non-empty list.")
+    chat = []
+    for message in messages:
+        if not isinstance(message, dict) or message.get("role") not in ("system", "user", "assistant"):
+            raise RequestError(400, "Each message needs a 'role' of system, user or assistant.")
+        chat.append({"role": message["role"], "content": message_text(message.get("content", ""))})
+    if chat[0]["role"] != "system":
+        chat.insert(0, {"role": "system", "content": ChatSession.default_sys_prompt or "You are an AI Assistant."})
+
+    settings = {"max_tokens": 0}
+    max_tokens = body.get("max_completion_tokens", body.get("max_tokens"))
+    if max_tokens is not None:
+        settings["max_tokens"] = max_tokens
+    for name in ("temperature", "top_p", "repeat_penalty"):
+        if body.get(name) is not None:
+            settings[name] = body[name]
+    for name, value in settings.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+            raise RequestError(400, "'"+name+"' must be a number of 0 or more.")
+    settings["max_tokens"] = int(settings["max_tokens"])
+    stop = body.get("stop")
+    if stop is not None:
+        # Added to SOLAIRIA's own stopwords, which stop the LLM from talking to itself
+        default_stop = core_funcs.generation_settings()["stop"]
+        settings["stop"] = default_stop + ([stop] if isinstance(stop, str) else [word for word in stop if isinstance(word, str)])
+    return chat, settings
+
+def generate(owner, messages, settings, cancel, on_text):
+    # Replies to messages on a free slot. on_text(text) is called with each piece of the reply. Returns (reply, finish reason).
+    index, llm = session_engine.acquire_slot(owner)
+    start_time = time.perf_counter()
+    reply = ""
+    finish_reason = "stop"
+    try:
+        for item in core_funcs.generate_text_from_prompt(messages, llm = llm, **settings):
+            if cancel.is_set():
+                finish_reason = "stop"  # OpenAI clients only know the finish reasons of the API
+                break
+            choice = item['choices'][0]
+            if choice.get('finish_reason'):
+                finish_reason = choice['finish_reason']
+            content = choice['delta'].get('content')
+            if content:
+                reply += content
+                on_text(content)    # Raises OSError if a streaming client has gone away
+    finally:
+        session_engine.release_slot(index, core_funcs.count_tokens(reply) if reply else 0, time.perf_counter() - start_time)
+    return reply, finish_reason
+
+def usage(messages, reply):
+    prompt_tokens = tokenizer_service.count_chat_tokens(messages)
+    completion_tokens = core_funcs.count_tokens(reply) if reply else 0
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "SOLAIRIA"
+
+    def log_message(self, format, *args):
+        print("[API] "+self.address_string()+" "+(format % args), file = sys.stderr)
+
+    def send_json(self, status, data, headers = {}):
+        payload = json.dumps(data, ensure_ascii = False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_error_json(self, status, message, error_type = "invalid_request_error", headers = {}):
+        self.send_json(status, {"error": {"message": message, "type": error_type}}, headers)
+
+    def send_event(self, data):
+        self.wfile.write(("data: "+(data if isinstance(data, str) else json.dumps(data, ensure_ascii = False))+"\n\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            self.send_json(200, {"object": "list", "data": [{"id": model_name(), "object": "model", "created": 0, "owned_by": "solairia"}]})
+        else:
+            self.send_error_json(404, "Unknown path "+self.path, "not_found_error")
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path.startswith("/v1/chat/completions/") and path.endswith("/cancel"):
+            request_id = path[len("/v1/chat/completions/"):-len("/cancel")]
+            with ApiServer.lock:
+                cancel = ApiServer.cancels.get(request_id)
+            if cancel is None:
+                self.send_error_json(404, "No reply in progress with id "+request_id, "not_found_error")
+            else:
+                cancel.set()
+                self.send_json(200, {"id": request_id, "cancelled": True})
+            return
+        if path != "/v1/chat/completions":
+            self.send_error_json(404, "Unknown path "+self.path, "not_found_error")
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(body, dict):
+                raise RequestError(400, "Request body must be a JSON object.")
+            messages, settings = parse_request(body)
+        except ValueError as e:
+            self.send_error_json(400, "Request body is not valid JSON: "+str(e))
+            return
+        except RequestError as e:
+            self.send_error_json(e.status, str(e), e.error_type)
+            return
+
+        try:
+            request_id = client_request_id(self.headers.get("X-Request-Id")) or "chatcmpl-"+uuid.uuid4().hex
+            cancel = admit(request_id)
+        except RequestError as e:
+            self.send_error_json(e.status, str(e), e.error_type)
+            return
+        if cancel is None:
+            self.send_error_json(429, "SOLAIRIA is busy with other requests. Please retry shortly.", "rate_limit_error", {"Retry-After": "1"})
+            return
+        try:
+            if body.get("stream"):
+                self.stream_reply(request_id, body, messages, settings, cancel)
+            else:
+                self.whole_reply(request_id, body, messages, settings, cancel)
+        finally:
+            finish(request_id)
+
+    def whole_reply(self, request_id, body, messages, settings, cancel):
+        try:
+            reply, finish_reason = generate(str(body.get("user") or request_id), messages, settings, cancel, lambda text: None)
+        except ValueError as e:
+            self.send_error_json(400, "Messages do not fit into the LLM's context: "+str(e))
+            return
+        except:
+            traceback.print_exc()
+            self.send_error_json(500, "Reply failed. See SOLAIRIA's console for details.", "server_error")
+            return
+        self.send_json(200, {"id": request_id, "object": "chat.completion", "created": int(time.time()), "model": model_name(),
+                             "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": finish_reason}],
+                             "usage": usage(messages, reply)}, {"X-Request-Id": request_id})
+
+    def stream_reply(self, request_id, body, messages, settings, cancel):
+        created = int(time.time())
+
+        def chunk(delta, finish_reason = None):
+            return {"id": request_id, "object": "chat.completion.chunk", "created": created, "model": model_name(),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Request-Id", request_id)   # For /v1/chat/completions/<id>/cancel
+        self.end_headers()
+        self.close_connection = True    # The end of the stream is marked by closing the connection
+        try:
+            self.send_event(chunk({"role": "assistant"}))
+            try:
+                # Writing blocks while the client is not reading, which holds up generating too, so slow clients get tokens at their own pace
+                reply, finish_reason = generate(str(body.get("user") or request_id), messages, settings, cancel,
+                                                lambda text: self.send_event(chunk({"content": text})))
+            except ValueError as e:
+                self.send_event({"error": {"message": "Messages do not fit into the LLM's context: "+str(e), "type": "invalid_request_error"}})
+                return
+            self.send_event(chunk({}, finish_reason))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self.send_event({"id": request_id, "object": "chat.completion.chunk", "created": created, "model": model_name(),
+                                 "choices": [], "usage": usage(messages, reply)})
+            self.send_event("[DONE]")
+        except OSError:
+            cancel.set()    # Client closed the connection, so the rest of the reply is not needed
+        except:
+            traceback.print_exc()
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog = "main.py --serve", description = "Serve the LLM in config.ini with an OpenAI-compatible API.")
+    parser.add_argument("--serve", action = "store_true")
+    parser.add_argument("--host", default = ConfigHandler.cp["AI"]["api_host"], help = "Address to listen on (default: api_host in config.ini).")
+    parser.add_argument("--port", type = int, default = int(ConfigHandler.cp["AI"]["api_port"]), help = "Port to listen on (default: api_port in config.ini).")
+    args, _ = parser.parse_known_args(argv)
+
+    ui_bridge.set_sink(headless.HeadlessSink(sys.stderr, stream = False))
+    with LlmProcess.lock:
+        LlmProcess.is_running = False
+    if not headless.load_llm():
+        return 2
+    if not session_engine.start():
+        return 2
+    if args.host not in ("127.0.0.1", "localhost", "::1"):
+        print("Warning: the API has no authentication, and "+args.host+" may be reachable from other computers.", file = sys.stderr)
+    server = ThreadingHTTPServer((args.host, args.port), ApiHandler)
+    server.daemon_threads = True
+    print("SOLAIRIA API is serving "+model_name()+" at http://"+args.host+":"+str(args.port)+"/v1 with "+str(session_engine.slot_count())
+          +" slots. Press Ctrl+C to stop.", file = sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with ApiServer.lock:
+            for cancel in ApiServer.cancels.values():
+                cancel.set()
+        session_engine.stop()
+    return 0
@@ -0,0 +1,186 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, sys, time, datetime, traceback
+
+# From custom modules
+from config_handler import ConfigHandler
+import config_handler
+import ui_bridge
+import model_pool
+
+# Finds the fastest thread counts and batch size for the loaded LLM on this computer (File > Tune performance, /tune, or
+# python main.py --tune), and keeps them in config.ini's [TUNE:<LLM file path>] section, which is used whenever that LLM is loaded.
+# - Threads (n_threads): Tokens/s when generating a reply, one token at a time. Limited by memory bandwidth, so more threads than
+#   the fast cores (e.g. performance cores of a hybrid CPU) often make it slower.
+# - Batch Threads (n_threads_batch) and Batch (n_batch): Tokens/s when evaluating a prompt, many tokens at a time. Limited by compute.
+# Each setting is measured on the loaded LLM itself, so nothing is loaded again. Batch sizes are tried up to the Batch it was loaded with.
+
+GEN_PROMPT_TOKENS = 32  # Prompt evaluated before generating
+GEN_TOKENS = 16         # Tokens generated for each thread count
+PROMPT_TOKENS = 128     # Prompt evaluated for each batch thread count
+BATCH_PROMPT_TOKENS = 512   # Prompt evaluated for each batch size (up to half of the context)
+REPEATS = 2             # Each setting is measured this many times, and its fastest run is kept
+SAMPLE_TEXT = ("SOLAIRIA runs large language models offline on your own computer. It reads logs, tables and notes, "
+               "explains what they contain, and answers questions about them without sending anything over the internet. ")
+
+class TuneStopped(Exception):
+    pass
+
+def thread_candidates(cpu_count = None):
+    # Up to 8 thread counts from 1/8 of the CPU's threads to all of them, e.g. 2, 5, 7, 10, 12, 15, 17, 20 for 20 threads
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return sorted({max(1, cpu_count*step//8) for step in range(1, 9)})
+
+def batch_candidates(max_batch):
+    return [size for size in (32, 64, 128, 256, 512, 1024, 2048) if size <= max_batch] or [max_batch]
+
+def prompt_tokens(llm, count):
+    tokens = llm.tokenize(SAMPLE_TEXT.encode("utf-8"), add_bos = False)
+    while len(tokens) < count:
+        tokens += tokens
+    return tokens[:count]
+
+def set_threads(llm, n_threads, n_threads_batch):
+    import llama_cpp    # Already loaded along with the LLM
+    llama_cpp.llama_set_n_threads(llm.ctx, n_threads, n_threads_batch)
+    llm.n_threads = n_threads
+    llm.n_threads_batch = n_threads_batch
+
+def measure_prompt(llm, tokens, should_stop):
+    # Tokens/s evaluating tokens in batches of llm.n_batch
+    best = 0.0
+    for _ in range(REPEATS):
+        if should_stop():
+            raise TuneStopped()
+        llm.reset()
+        start_time = time.perf_counter()
+        llm.eval(tokens)
+        best = max(best, len(tokens)/(time.perf_counter() - start_time))
+    return best
+
+def measure_generation(llm, tokens, should_stop):
+    # Tokens/s generating GEN_TOKENS tokens one at a time (greedy, so every run generates the same tokens) after evaluating tokens
+    best = 0.0
+    for _ in range(REPEATS):
+        if should_stop():
+            raise TuneStopped()
+        llm.reset()
+        llm.eval(tokens)
+        start_time = time.perf_counter()
+        for _ in range(GEN_TOKENS):
+            llm.eval([llm.sample(top_k = 1, temp = 0.0)])
+        best = max(best, GEN_TOKENS/(time.perf_counter() - start_time))
+    return best
+
+def sweep(name, candidates, measure, on_progress):
+    # Returns the candidate with the highest tokens/s, and its tokens/s
+    results = {}
+    for candidate in candidates:
+        results[candidate] = measure(candidate)
+        on_progress(name+" "+str(candidate)+": "+str(round(results[candidate], 1))+" tokens/s")
+    best = max(results, key = results.get)
+    return best, results[best]
+
+def tune(llm, on_progress, should_stop):
+    # Measures llm over thread counts and batch sizes, and leaves it set to the fastest. Returns the results, or None if stopped.
+    # Measuring replaces the LLM's KV cache, so its state from before (e.g. the personality snapshot or chat history) is restored afterwards.
+    original = (llm.n_threads, llm.n_threads_batch, llm.n_batch)
+    state = llm.save_state()
+    threads = thread_candidates()
+    gen_prompt = prompt_tokens(llm, GEN_PROMPT_TOKENS)
+    prompt = prompt_tokens(llm, PROMPT_TOKENS)
+    batch_prompt = prompt_tokens(llm, max(1, min(BATCH_PROMPT_TOKENS, llm.n_ctx()//2)))
+
+    def generation_with_threads(count):
+        set_threads(llm, count, original[1])
+        return measure_generation(llm, gen_prompt, should_stop)
+
+    def prompt_with_threads(count):
+        set_threads(llm, n_threads, count)
+        return measure_prompt(llm, prompt, should_stop)
+
+    def prompt_with_batch(size):
+        llm.n_batch = size  # Prompts are evaluated in batches of llm.n_batch tokens, up to the n_batch the context was created with
+        return measure_prompt(llm, batch_prompt, should_stop)
+
+    try:
+        # Settings the LLM was loaded with, measured first (which also warms up the LLM), to compare against
+        baseline_generation = measure_generation(llm, gen_prompt, should_stop)
+        baseline_prompt = measure_prompt(llm, batch_prompt, should_stop)
+        on_progress("Current settings: "+str(round(baseline_generation, 1))+" tokens/s generating, "+str(round(baseline_prompt, 1))+" tokens/s reading prompts")
+
+        n_threads, generation_speed = sweep("Threads", threads, generation_with_threads, on_progress)
+        n_threads_batch, _ = sweep("Batch Threads", threads, prompt_with_threads, on_progress)
+        set_threads(llm, n_threads, n_threads_batch)
+        n_batch, prompt_speed = sweep("Batch", batch_candidates(original[2]), prompt_with_batch, on_progress)
+        llm.n_batch = n_batch
+    except TuneStopped:
+        set_threads(llm, original[0], original[1])
+        llm.n_batch = original[2]
+        return None
+    finally:
+        llm.load_state(state)
+    return {"n_threads": n_threads, "n_threads_batch": n_threads_batch, "n_batch": n_batch,
+            "generation_tokens_per_s": round(generation_speed, 2), "prompt_tokens_per_s": round(prompt_speed, 2),
+            "baseline_generation_tokens_per_s": round(baseline_generation, 2), "baseline_prompt_tokens_per_s": round(baseline_prompt, 2)}
+
+def save_result(llm_path, result):
+    # Keeps the result in config.ini. Only the tunables (n_threads, n_threads_batch, n_batch) are used when loading; the rest is for reference.
+    section = config_handler.tune_section(llm_path)
+    ConfigHandler.cp[section] = {key: str(value) for key, value in result.items()}
+    ConfigHandler.cp.set(section, "cpu_count", str(os.cpu_count()))
+    ConfigHandler.cp.set(section, "tuned_on", datetime.date.today().isoformat())
+    with open("config.ini", "w", encoding = "utf-8") as cfg_file:
+        ConfigHandler.cp.write(cfg_file)
+
+def tune_loaded_llm():
+    # Tunes the loaded LLM and saves the result. Run from the 'Send' thread (or --tune), with LlmProcess.is_running set, so that
+    # setting it to False (e.g. [Esc]) stops tuning.
+    from core_funcs import LlmProcess   # Imported here, as core_funcs imports this module when /tune is sent
+    llm = LlmProcess.llm
+    if llm is None:
+        ui_bridge.post_chat("\n---No LLM is loaded to tune.---", "tag_info")
+        return None
+    ui_bridge.post_chat("\n---Tuning "+os.path.basename(llm.model_path)+" for this computer ("+str(os.cpu_count())+" CPU threads). "
+                        +"This may take a few minutes.---", "tag_info")
+    with LlmProcess.lock:
+        LlmProcess.llm_status = "Tuning (press [Esc] to stop)"
+    ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+    try:
+        result = tune(llm, lambda text: ui_bridge.post_chat("\n"+text, "tag_info"), lambda: LlmProcess.is_running == False)
+    except:
+        traceback.print_exc()
+        result = None
+    with LlmProcess.lock:
+        LlmProcess.llm_status = "Idle"
+    ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+    if result is None:
+        ui_bridge.post_chat("\n---Tuning was stopped. Settings are unchanged.---", "tag_info")
+        return None
+    save_result(llm.model_path, result)
+    # The LLM is already running with the tuned settings, so it is kept in the model pool under them instead of being loaded again
+    model_pool.rekey(llm, model_pool.pool_key(llm.model_path, ConfigHandler.cp["AI"]["context_size"], ConfigHandler.cp["AI"]["prompt_template"]))
+    ui_bridge.post_chat("\n---Tuned: Threads "+str(result["n_threads"])+", Batch Threads "+str(result["n_threads_batch"])+", Batch "+str(result["n_batch"])
+                        +". Generating "+str(result["baseline_generation_tokens_per_s"])+" -> "+str(result["generation_tokens_per_s"])+" tokens/s, reading prompts "
+                        +str(result["baseline_prompt_tokens_per_s"])+" -> "+str(result["prompt_tokens_per_s"])+" tokens/s. "
+                        +"Saved to config.ini ["+config_handler.tune_section(llm.model_path)+"] and used whenever this LLM is loaded.---", "tag_info")
+    return result
+
+def main(argv):
+    # python main.py --tune: tunes the LLM in config.ini without the Tk window
+    import headless
+    from core_funcs import LlmProcess
+    ui_bridge.set_sink(headless.HeadlessSink(sys.stderr, stream = False))
+    with LlmProcess.lock:
+        LlmProcess.is_running = False
+    if not headless.load_llm():
+        return 2
+    with LlmProcess.lock:
+        LlmProcess.is_running = True
+    try:
+        result = tune_loaded_llm()
+    except KeyboardInterrupt:
+        result = None
+    return 0 if result is not None else 1
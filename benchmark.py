@@ -0,0 +1,418 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, re, sys, json, time, random, shutil, hashlib, argparse, datetime, platform, statistics, tempfile, traceback
+
+# From custom modules
+from config_handler import ConfigHandler
+import config_handler
+import ui_bridge
+import tokenizer_service
+from chat_session import ChatSession
+import core_funcs
+from core_funcs import LlmProcess
+import headless
+from version import version
+
+# Measures SOLAIRIA's chat, context compression and file analysis paths on fixed corpora, so releases and configs can be compared:
+#   python main.py --benchmark [--stub] [--scenarios tokenizer,chunker,chat,summary,file_analysis] [--repeats 3] [--out results.json]
+# - tokenizer:     Token counting of the corpus lines (batch with an empty and a full LRU, and line by line as file_text_chunker() does)
+# - chunker:       file_text_chunker() over a text file and a log file
+# - chat:          Chat turns through send(), the same as the 'Send' button
+# - summary:       periodic_summary compression of a full chat history through send()
+# - file_analysis: '/f <file>' through send(), i.e. file_text_chunker() and the whole analysis pipeline
+# The corpora are generated from a fixed seed, so every run reads the same text (their sha256 is in the results).
+# Each LLM call records its time to first token, and the prompt tokens evaluated and tokens generated with llama.cpp's own timings,
+# from which prompt eval and generation tokens/s are worked out. Every run also records its wall time and the peak RSS so far.
+# With --stub, a stand-in LLM is used instead of the .gguf file in config.ini, so the tokenizer and chunker (and the Python side of the
+# other paths) are measured without any model file. Its replies are made up from the prompt's words, so only its timings mean anything.
+# Results are written as JSON to stdout (or --out). The analysis cache is turned off while benchmarking, so repeats are not cache hits.
+# Nothing is written to config.ini.
+
+SCENARIOS = ["tokenizer", "chunker", "chat", "summary", "file_analysis"]
+LLM_SCENARIOS = ("chat", "summary", "file_analysis")
+SEED = 1801
+CHAT_PROMPTS = ["Hi! Please call me Sam. What can you help me with?",
+                "Explain what a context window is in two sentences.",
+                "Give me three tips for writing clear log messages.",
+                "What is the difference between a process and a thread?",
+                "Summarise why caching makes programs faster.",
+                "What was the name I asked you to call me?"]
+WORDS = ("the", "server", "request", "user", "file", "memory", "cache", "model", "token", "context", "reply", "analysis",
+         "report", "error", "warning", "system", "network", "disk", "queue", "worker", "thread", "process", "value", "table",
+         "column", "record", "time", "result", "summary", "update", "config", "setting", "backup", "job", "schedule", "check",
+         "is", "was", "has", "will", "can", "should", "after", "before", "with", "without", "during", "because", "and", "or",
+         "slow", "fast", "large", "small", "new", "old", "failed", "completed", "missing", "changed", "daily", "weekly")
+LOG_LINES = ("INFO [worker-{a}] Request {b} completed in {c} ms",
+             "INFO [scheduler] Job backup-{a} started for user{b}",
+             "WARN [cache] Hit rate dropped to {c}% on shard {a}",
+             "ERROR [db] Query {b} failed after {c} ms: connection reset by peer",
+             "INFO [auth] User user{b} logged in from 10.0.{a}.{c}",
+             "DEBUG [queue] {c} items waiting, {a} workers busy")
+
+class Benchmark:
+    llm = None  # TimedLlm that LlmProcess.llm is set to while benchmarking
+
+class StubLlm:
+    # Stand-in for a loaded Llama, with the parts of it that SOLAIRIA uses. Words and punctuation are tokens.
+    # Prompt eval and generation run as fast as Python allows, or at prompt_tps/gen_tps tokens/s if set, to mimic a slower LLM.
+    def __init__(self, context_size, reply_tokens = 48, prompt_tps = 0.0, gen_tps = 0.0):
+        self.model_path = "stub.gguf"
+        self.chat_format = "stub"
+        self.metadata = {}
+        self.verbose = False
+        self.cache = None
+        self.context_size = context_size
+        self.reply_tokens = reply_tokens
+        self.prompt_tps = prompt_tps
+        self.gen_tps = gen_tps
+        self.counters = [0, 0.0, 0, 0.0]    # Same as perf_counters(): prompt tokens, prompt eval ms, generated tokens, generation ms
+
+    def n_ctx(self):
+        return self.context_size
+
+    def tokenize(self, text, add_bos = False, special = False):
+        return [len(token) for token in re.findall(rb"\w+|[^\w\s]", text)]
+
+    def wait(self, start_time, tokens, tokens_per_s):
+        if tokens_per_s > 0:
+            time.sleep(max(0.0, start_time + tokens/tokens_per_s - time.perf_counter()))
+
+    def create_chat_completion(self, messages, max_tokens = 0, stream = True, **kwargs):
+        # A generator, like llama-cpp-python's, so a prompt that does not fit raises ValueError once iterated
+        start_time = time.perf_counter()
+        prompt_tokens = sum(len(self.tokenize(item["content"].encode("utf-8"))) + 4 for item in messages)
+        if prompt_tokens >= self.context_size:
+            raise ValueError("Requested tokens ("+str(prompt_tokens)+") exceed context window of "+str(self.context_size))
+        self.wait(start_time, prompt_tokens, self.prompt_tps)
+        self.counters[0] += prompt_tokens
+        self.counters[1] += (time.perf_counter() - start_time)*1000
+
+        words = re.findall(r"\w+", messages[-1]["content"]) or ["ok"]
+        reply_tokens = min(self.reply_tokens, self.context_size - prompt_tokens)
+        if max_tokens > 0:
+            reply_tokens = min(reply_tokens, max_tokens)
+        yield {"choices": [{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}]}
+        for index in range(reply_tokens):
+            token_time = time.perf_counter()
+            self.wait(token_time, 1, self.gen_tps)
+            self.counters[2] += 1
+            self.counters[3] += (time.perf_counter() - token_time)*1000
+            yield {"choices": [{"index": 0, "delta": {"content": (" " if index else "")+words[index % len(words)]}, "finish_reason": None}]}
+        yield {"choices": [{"index": 0, "delta": {}, "finish_reason": "length" if reply_tokens == max_tokens else "stop"}]}
+
+    def close(self):
+        pass
+
+class TimedLlm:
+    # Passes everything on to llm, and times each create_chat_completion() call on it into calls
+    def __init__(self, llm):
+        self.llm = llm
+        self.calls = []
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def create_chat_completion(self, *args, **kwargs):
+        return self.timed_stream(self.llm.create_chat_completion(*args, **kwargs))
+
+    def timed_stream(self, model_output):
+        start_time = time.perf_counter()
+        before = perf_counters(self.llm)
+        first_token_time = None
+        try:
+            for item in model_output:
+                if first_token_time is None and item['choices'][0]['delta'].get('content'):
+                    first_token_time = time.perf_counter()
+                yield item
+        finally:
+            # Also recorded when the caller stops early (e.g. [Esc]) or the prompt did not fit
+            after = perf_counters(self.llm)
+            call = {"wall_s": time.perf_counter() - start_time, "ttft_s": None if first_token_time is None else first_token_time - start_time}
+            if before is not None and after is not None:
+                if after[0] < before[0]:
+                    before = (0, 0.0, 0, 0.0)   # Timings were reset during the call
+                call.update(zip(("prompt_tokens", "prompt_ms", "gen_tokens", "gen_ms"), (end - start for start, end in zip(before, after))))
+            self.calls.append(call)
+
+def perf_counters(llm):
+    # (prompt tokens evaluated, prompt eval ms, tokens generated, generation ms) so far on llm's context, or None if not available.
+    # Prompt tokens found in the KV cache are not evaluated again, so they are not counted.
+    if isinstance(llm, StubLlm):
+        return tuple(llm.counters)
+    try:
+        import llama_cpp    # Already loaded along with the LLM
+        data = llama_cpp.llama_perf_context(llm.ctx)
+        return (data.n_p_eval, data.t_p_eval_ms, data.n_eval, data.t_eval_ms)
+    except Exception:
+        return None
+
+def peak_rss_mb():
+    # Peak resident memory of this process so far, or None if it cannot be read on this OS
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak/(1 << 20 if sys.platform == "darwin" else 1 << 10), 1)  # Bytes on macOS, KB on Linux
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD), ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t), ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return round(counters.PeakWorkingSetSize/(1 << 20), 1)
+    return None
+
+def corpus_text(size_kb, seed):
+    # Paragraphs of made-up sentences, the same for the same size and seed
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < size_kb*1024:
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+            sentences.append(" ".join(words).capitalize()+rng.choice((".", ".", ".", "!", "?")))
+        paragraphs.append(" ".join(sentences))
+        size += len(paragraphs[-1]) + 2
+    return "\n\n".join(paragraphs)+"\n"
+
+def corpus_log(size_kb, seed):
+    # Log lines from a few templates with changing values, one second apart, the same for the same size and seed
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 18, 9, 0, 0)
+    lines = []
+    size = 0
+    while size < size_kb*1024:
+        line = ((start + datetime.timedelta(seconds = len(lines))).strftime("%Y-%m-%d %H:%M:%S")+" "
+                +rng.choice(LOG_LINES).format(a = rng.randint(1, 16), b = rng.randint(1000, 99999), c = rng.randint(1, 999)))
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)+"\n"
+
+def write_corpora(folder, corpus_kb, analysis_kb):
+    # Returns {name: path} of the corpora, written into folder
+    texts = {"text": corpus_text(corpus_kb, SEED), "log": corpus_log(corpus_kb, SEED), "analysis": corpus_text(analysis_kb, SEED + 1)}
+    paths = {}
+    for name, text in texts.items():
+        paths[name] = os.path.join(folder, "benchmark_"+name+(".log" if name == "log" else ".txt"))
+        with open(paths[name], "w", encoding = "utf-8", newline = "\n") as corpus_file:
+            corpus_file.write(text)
+    return paths
+
+def file_sha256(path):
+    with open(path, "rb") as corpus_file:
+        return hashlib.sha256(corpus_file.read()).hexdigest()
+
+def rate(tokens, seconds):
+    return round(tokens/seconds, 2) if seconds > 0 else None
+
+def call_stats(calls):
+    # Time to first token and tokens/s over the LLM calls of a run
+    ttfts = [call["ttft_s"] for call in calls if call["ttft_s"] is not None]
+    stats = {"llm_calls": len(calls),
+             "ttft_s": round(statistics.median(ttfts), 4) if ttfts else None,
+             "ttft_max_s": round(max(ttfts), 4) if ttfts else None}
+    timed = [call for call in calls if "prompt_tokens" in call]
+    if timed:
+        prompt_tokens = sum(call["prompt_tokens"] for call in timed)
+        gen_tokens = sum(call["gen_tokens"] for call in timed)
+        stats.update({"prompt_eval_tokens": prompt_tokens, "prompt_eval_tokens_per_s": rate(prompt_tokens, sum(call["prompt_ms"] for call in timed)/1000),
+                      "generated_tokens": gen_tokens, "generation_tokens_per_s": rate(gen_tokens, sum(call["gen_ms"] for call in timed)/1000)})
+    return stats
+
+def bench_tokenizer(paths):
+    lines = []
+    for name in ("text", "log"):
+        with open(paths[name], "r", encoding = "utf-8") as corpus_file:
+            lines += [line for line in corpus_file if line.strip()]
+    tokenizer_service.clear_cache()
+    start_time = time.perf_counter()
+    tokens = sum(tokenizer_service.count_tokens_batch(lines))
+    batch_s = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    tokenizer_service.count_tokens_batch(lines)
+    cached_s = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    for line in lines:
+        tokenizer_service.count_tokens_uncached(line)
+    line_s = time.perf_counter() - start_time
+    return {"counter": tokenizer_service.active_mode(), "lines": len(lines), "tokens": tokens,
+            "batch_s": round(batch_s, 4), "batch_tokens_per_s": rate(tokens, batch_s),
+            "batch_cached_s": round(cached_s, 4), "batch_cached_tokens_per_s": rate(tokens, cached_s),
+            "per_line_s": round(line_s, 4), "per_line_tokens_per_s": rate(tokens, line_s)}
+
+def bench_chunker(paths):
+    result = {}
+    for name in ("text", "log"):
+        size_mb = os.path.getsize(paths[name])/(1 << 20)
+        start_time = time.perf_counter()
+        chunks = list(core_funcs.file_text_chunker(paths[name]))
+        seconds = time.perf_counter() - start_time
+        result[name] = {"chunks": len(chunks), "seconds": round(seconds, 4), "mb_per_s": round(size_mb/seconds, 2) if seconds > 0 else None}
+    return result
+
+def send_turn(prompt):
+    if core_funcs.send(prompt) == False:
+        core_funcs.send(prompt) # Context/memory was compressed first, so the prompt still needs a reply
+
+def bench_chat(turns):
+    ChatSession.msglist.clear()
+    for index in range(turns):
+        send_turn(CHAT_PROMPTS[index % len(CHAT_PROMPTS)])
+    return {"turns": turns, "history_tokens": ChatSession.msglist.total_tokens}
+
+def bench_summary(paths):
+    # Fills the chat history past half of the context with turns of the text corpus, so that the next prompt is compressed first
+    context_size = int(ConfigHandler.cp["AI"]["context_size"])
+    context_mgmt = ConfigHandler.cp["AI"]["context_mgmt"]
+    ChatSession.msglist.clear()
+    with open(paths["analysis"], "r", encoding = "utf-8") as corpus_file:
+        paragraphs = [paragraph for paragraph in corpus_file.read().split("\n\n") if paragraph.strip()]
+    index = 0
+    while ChatSession.msglist.fits(int(context_size*0.5)):
+        ChatSession.msglist.append("user" if index % 2 == 0 else "assistant", paragraphs[index % len(paragraphs)])
+        index += 1
+    history_tokens = ChatSession.msglist.total_tokens
+    ConfigHandler.cp["AI"]["context_mgmt"] = "periodic_summary"
+    try:
+        compressed = core_funcs.send(CHAT_PROMPTS[0]) == False
+    finally:
+        ConfigHandler.cp["AI"]["context_mgmt"] = context_mgmt
+    return {"history_turns": index, "history_tokens": history_tokens, "compressed": compressed,
+            "summary_tokens": ChatSession.msglist.total_tokens if compressed else None}
+
+def bench_file_analysis(paths, parts):
+    ChatSession.msglist.clear()
+    core_funcs.send("/f "+paths["analysis"])
+    return {"file_kb": round(os.path.getsize(paths["analysis"])/1024, 1), "parts": parts,
+            "analysis_workers": int(ConfigHandler.cp["AI"]["analysis_workers"])}
+
+def run_scenario(name, bench, repeats, sink):
+    # Runs bench() repeats times. LLM calls made with worker contexts (analysis_workers above 1) are only in the wall time.
+    runs = []
+    for _ in range(repeats):
+        if Benchmark.llm is not None:
+            Benchmark.llm.calls = []
+        print("Benchmarking "+name+" (run "+str(len(runs) + 1)+"/"+str(repeats)+")", file = sys.stderr)
+        start_time = time.perf_counter()
+        try:
+            result = bench()
+        except:
+            traceback.print_exc()
+            result = {"error": "Failed. See the console for details."}
+            with LlmProcess.lock:
+                LlmProcess.is_running = False
+                LlmProcess.llm_status = "Idle"
+        result["wall_s"] = round(time.perf_counter() - start_time, 4)
+        if name in LLM_SCENARIOS and Benchmark.llm is not None:
+            result.update(call_stats(Benchmark.llm.calls))
+        result["notes"] = sink.take()[1]
+        result["peak_rss_mb"] = peak_rss_mb()   # Of the whole process so far, so it can only grow from run to run
+        runs.append(result)
+    return {"median_wall_s": round(statistics.median(run["wall_s"] for run in runs), 4), "runs": runs}
+
+def use_stub(args):
+    context_size = int(ConfigHandler.cp["AI"]["context_size"])
+    stub = StubLlm(context_size, args.stub_reply_tokens, args.stub_prompt_tps, args.stub_gen_tps)
+    with LlmProcess.lock:
+        LlmProcess.llm = stub
+    tokenizer_service.set_model(stub)
+    core_funcs.set_personality()
+    if LlmProcess.snapshot_thread is not None:
+        LlmProcess.snapshot_thread.join()
+
+def main(argv, out):
+    # out is the real stdout. main.py points sys.stdout at stderr before importing this module, so only the results are written to out.
+    parser = argparse.ArgumentParser(prog = "main.py --benchmark", description = "Benchmark SOLAIRIA's chat, summary and file analysis paths on fixed corpora.")
+    parser.add_argument("--benchmark", action = "store_true")
+    parser.add_argument("--stub", action = "store_true", help = "Use a stand-in LLM instead of the .gguf file in config.ini.")
+    parser.add_argument("--scenarios", default = ",".join(SCENARIOS), help = "Comma-separated scenarios to run (default: all of "+", ".join(SCENARIOS)+").")
+    parser.add_argument("--repeats", type = int, default = 3, help = "Runs of each scenario (default: 3).")
+    parser.add_argument("--turns", type = int, default = len(CHAT_PROMPTS), help = "Chat turns per chat run (default: "+str(len(CHAT_PROMPTS))+").")
+    parser.add_argument("--corpus-kb", type = int, default = 512, help = "Size of the tokenizer and chunker corpora (default: 512).")
+    parser.add_argument("--analysis-kb", type = int, default = 16, help = "Size of the file that is analysed, and of the summary history (default: 16).")
+    parser.add_argument("--stub-reply-tokens", type = int, default = 48, help = "Tokens in each reply of the stand-in LLM (default: 48).")
+    parser.add_argument("--stub-prompt-tps", type = float, default = 0.0, help = "Prompt eval tokens/s of the stand-in LLM (default: 0, as fast as possible).")
+    parser.add_argument("--stub-gen-tps", type = float, default = 0.0, help = "Generation tokens/s of the stand-in LLM (default: 0, as fast as possible).")
+    parser.add_argument("--out", help = "File to write the JSON results to, instead of stdout.")
+    args, _ = parser.parse_known_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown or not scenarios or args.repeats < 1 or args.turns < 1:
+        parser.error("--scenarios must be some of "+", ".join(SCENARIOS)+", and --repeats and --turns at least 1")
+
+    sink = headless.HeadlessSink(sys.stderr, stream = False)
+    ui_bridge.set_sink(sink)
+    with LlmProcess.lock:
+        LlmProcess.is_running = False
+    config = dict(ConfigHandler.cp["AI"])
+    config.pop("personality", None)    # Can be personal, and is not a performance setting
+    # Only kept in memory for this run: analysis results must not come from the cache, and the stand-in LLM has no worker contexts
+    overrides = {"analysis_cache": "off"}
+    if args.stub:
+        overrides["analysis_workers"] = "1"
+    for key, value in overrides.items():
+        ConfigHandler.cp["AI"][key] = value
+    if args.stub:
+        use_stub(args)
+    elif any(name in LLM_SCENARIOS for name in scenarios):
+        if not headless.load_llm():
+            return 2
+    if LlmProcess.llm is not None:
+        Benchmark.llm = TimedLlm(LlmProcess.llm)
+        with LlmProcess.lock:
+            LlmProcess.llm = Benchmark.llm
+
+    model_path = ConfigHandler.cp["AI"]["model_path"]
+    results = {"benchmark": 1, "solairia_version": version, "created": datetime.datetime.now().isoformat(timespec = "seconds"),
+               "platform": {"system": platform.system(), "release": platform.release(), "machine": platform.machine(),
+                            "python": platform.python_version(), "cpu_count": os.cpu_count()},
+               "llm": {"stub": args.stub, "model": "stub" if args.stub else os.path.basename(model_path),
+                       "n_ctx": LlmProcess.llm.n_ctx() if LlmProcess.llm is not None else None,
+                       "tunables": None if args.stub or not model_path else config_handler.model_tunables(model_path)},
+               "config": config, "overrides": overrides, "repeats": args.repeats, "scenarios": {}}
+
+    folder = tempfile.mkdtemp(prefix = "solairia_benchmark_")
+    try:
+        paths = write_corpora(folder, args.corpus_kb, args.analysis_kb)
+        results["corpus"] = {"seed": SEED, "corpus_kb": args.corpus_kb, "analysis_kb": args.analysis_kb,
+                             "sha256": {name: file_sha256(path) for name, path in paths.items()}}
+        benches = {"tokenizer": lambda: bench_tokenizer(paths),
+                   "chunker": lambda: bench_chunker(paths),
+                   "chat": lambda: bench_chat(args.turns),
+                   "summary": lambda: bench_summary(paths),
+                   "file_analysis": lambda: bench_file_analysis(paths, analysis_parts)}
+        if "file_analysis" in scenarios:
+            analysis_parts = sum(1 for _ in core_funcs.file_text_chunker(paths["analysis"]))   # Counted beforehand, so it is not in the wall time
+        for name in scenarios:
+            if name in LLM_SCENARIOS and LlmProcess.llm is None:
+                results["scenarios"][name] = {"error": "No LLM is loaded."}
+                continue
+            results["scenarios"][name] = run_scenario(name, benches[name], args.repeats, sink)
+    finally:
+        shutil.rmtree(folder, ignore_errors = True)
+        if Benchmark.llm is not None:
+            with LlmProcess.lock:
+                LlmProcess.llm = Benchmark.llm.llm
+
+    text = json.dumps(results, indent = 2, ensure_ascii = False)
+    if args.out:
+        with open(args.out, "w", encoding = "utf-8") as results_file:
+            results_file.write(text+"\n")
+        print("Benchmark results written to "+args.out, file = sys.stderr)
+    else:
+        out.write(text+"\n")
+        out.flush()
+    for name, scenario in results["scenarios"].items():
+        print(name+": "+("error" if "error" in scenario else str(scenario["median_wall_s"])+"s (median wall time)"), file = sys.stderr)
+    return 1 if any("error" in scenario or any("error" in run for run in scenario["runs"]) for scenario in results["scenarios"].values()) else 0
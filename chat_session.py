@@ -0,0 +1,28 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From custom modules
+from config_handler import ConfigHandler
+from context_window import ContextWindow
+
+class ChatSession:
+    # State of the conversation, shared by the GUI and headless mode (neither core_funcs nor headless mode need the Tk window for it)
+    msglist = ContextWindow()   # Chat history (context/memory) with per-turn token counts
+    default_sys_prompt = None   # Personality, set by core_funcs.set_personality()
+    context_char_limit = 0
+    personality_limit = 0
+    my_prompt_limit = 0
+
+def update_limits(context_size):
+    # Formula for context character limit
+    # 1 token = ~4 to 4.5 characters
+    # This helps inform User if their prompts are too long in terms of characters, since informing with token count is not easily understood and remedied.
+    ChatSession.context_char_limit = int(context_size)*4
+
+    # Formulas for personality and prompt limit
+    # Context size allocation: 0.1 to personality, 0.2 to my_prompt (user prompt), 0.25 to output (set in generate_text_from_prompt() function). Remaining in prev_prompts and buffer.
+    # This gives buffer for summarisation to keep within context_size.
+    ChatSession.personality_limit = int(ChatSession.context_char_limit*0.1)
+    ChatSession.my_prompt_limit = int(ChatSession.context_char_limit*0.2)
+
+update_limits(ConfigHandler.cp["AI"]["context_size"])
@@ -5,6 +5,82 @@
 import os, sys, traceback
 import configparser
 
+# Performance tunables in [AI]. Each is passed to Llama() under the same name when an LLM is loaded (see model_loader.llama_kwargs()).
+# Key: (default, label in the Config window, allowed values, or (min, max) for whole numbers)
+LLM_TUNABLES = {"n_gpu_layers": ("-1", "GPU Layers", (-1, 999)),  # -1 = all layers
+                "offload_kqv": ("True", "KV on GPU", ["True", "False"]),
+                "n_threads": ("0", "Threads", (0, 512)),  # 0 = llama.cpp's default (half of the CPU cores)
+                "n_threads_batch": ("0", "Batch Threads", (0, 512)),  # 0 = llama.cpp's default (all CPU cores)
+                "n_batch": ("512", "Batch", (1, 8192)),
+                "n_ubatch": ("512", "Micro-batch", (1, 8192)),
+                "type_k": ("f16", "K Cache", ["f16", "q8_0", "q4_0"]),
+                "type_v": ("f16", "V Cache", ["f16", "q8_0", "q4_0"]),
+                "flash_attn": ("False", "Flash Attention", ["True", "False"]),
+                "use_mmap": ("True", "mmap", ["True", "False"]),
+                "use_mlock": ("False", "mlock", ["True", "False"])}
+
+def tunable_values(section):
+    # Performance tunables of a config section (e.g. ConfigHandler.cp["AI"]), with defaults for missing ones (e.g. in older exported profiles)
+    return {key: section.get(key, tunable[0]) for key, tunable in LLM_TUNABLES.items()}
+
+def speculative_settings(section):
+    # Speculative decoding settings of a config section that an LLM is loaded with (see speculative.py)
+    mode = section.get("speculative", "off")
+    if mode == "off":
+        return (mode,)
+    return (mode, section.get("spec_ngram_size", "2"), section.get("spec_draft_tokens", "10"),
+            section.get("spec_draft_model_path", "") if mode == "draft_model" else "")
+
+def tune_section(llm_path):
+    # Section of config.ini with the auto_tuner's results for an LLM file. Keyed on the full path, as LLMs in different folders
+    # can have the same file name.
+    return "TUNE:"+os.path.normcase(os.path.abspath(llm_path))
+
+def model_tunables(llm_path, tunables = None):
+    # Performance tunables to load llm_path with: tunables ([AI]'s if None), with the thread counts and batch size that
+    # auto_tuner found for this LLM file on this computer ([TUNE:<LLM file path>] section), if it has been tuned
+    values = dict(tunables) if tunables is not None else tunable_values(ConfigHandler.cp["AI"])
+    section = tune_section(llm_path)
+    if ConfigHandler.cp.has_section(section):
+        tuned = dict(values)
+        tuned.update({key: value for key, value in ConfigHandler.cp[section].items() if key in LLM_TUNABLES})
+        try:
+            tuned["n_ubatch"] = str(min(int(tuned["n_ubatch"]), int(tuned["n_batch"])))
+        except ValueError:
+            pass
+        if not tunables_error(tuned):
+            values = tuned
+    return values
+
+def tunables_errors(values):
+    # Returns (keys, why) for every reason llama.cpp could not load an LLM with these performance tunables, where keys are the
+    # tunables at fault. Tunables that must match each other are only checked once each of them is valid on its own.
+    errors = []
+    for key, value in values.items():
+        default, label, allowed = LLM_TUNABLES[key]
+        if isinstance(allowed, list):
+            if value not in allowed:
+                errors.append(([key], label+" ("+key+") must be one of: "+", ".join(allowed)+"."))
+        else:
+            try:
+                number = int(value)
+            except ValueError:
+                errors.append(([key], label+" ("+key+") must be a whole number."))
+                continue
+            if not allowed[0] <= number <= allowed[1]:
+                errors.append(([key], label+" ("+key+") must be from "+str(allowed[0])+" to "+str(allowed[1])+"."))
+    invalid = {key for keys, _ in errors for key in keys}
+    if not invalid & {"type_v", "flash_attn"} and values["type_v"] != "f16" and values["flash_attn"] != "True":
+        errors.append((["type_v", "flash_attn"], "A quantized V Cache (type_v) needs Flash Attention (flash_attn) to be enabled."))
+    if not invalid & {"n_batch", "n_ubatch"} and int(values["n_ubatch"]) > int(values["n_batch"]):
+        errors.append((["n_batch", "n_ubatch"], "Micro-batch (n_ubatch) cannot be larger than Batch (n_batch)."))
+    return errors
+
+def tunables_error(values):
+    # Returns why llama.cpp could not load an LLM with these performance tunables, or "" if they are valid
+    errors = tunables_errors(values)
+    return errors[0][1] if errors else ""
+
 class ConfigHandler:
     dirname = ""
 
@@ -22,7 +98,15 @@ class ConfigHandler:
     #cp = configparser.ConfigParser(allow_no_value=True, comment_prefixes='/')
     cp = configparser.ConfigParser()
     default_cfg_ai = {"model_path": "", "context_size": "2048", "personality": "", "history_option": "on", "context_mgmt": "sliding_window",
-                      "prompt_template": "auto", "llm_stats_enable": "False"}
+                      "prompt_template": "auto", "llm_stats_enable": "False", "token_counter": "llm",
+                      "prompt_cache": "ram", "prompt_cache_size_mb": "1024", "prompt_cache_dir": "",
+                      "personality_snapshot": "on", "pool_max_models": "1", "pool_budget_mb": "0", "pool_pin": "",
+                      "analysis_workers": "1", "log_dedup": "off",
+                      "analysis_cache": "on", "analysis_cache_size_mb": "256",
+                      "follow_interval_s": "5", "csv_profile": "on",
+                      "session_slots": "2", "api_host": "127.0.0.1", "api_port": "8080", "api_queue_size": "8",
+                      "speculative": "off", "spec_ngram_size": "2", "spec_draft_tokens": "10", "spec_draft_model_path": ""}
+    default_cfg_ai.update({key: tunable[0] for key, tunable in LLM_TUNABLES.items()})
     default_cfg_gui = {"bg_grey": "#ABB2B9", "bg_colour": "#2C3E50", "font_size": "13", "font_type": "Verdana",
                        "font_colour_user": "#EAECEE", "font_colour_asst": "#EAECEE"}
     if not os.path.exists("config.ini"):
@@ -33,13 +117,35 @@ class ConfigHandler:
         print("No config.ini found. New config.ini has been created with default settings.")
     else:
         cp.read("config.ini", encoding = "utf-8")
-        if dict(cp.items("AI")).keys() !=  default_cfg_ai.keys() or dict(cp.items("GUI")).keys() !=  default_cfg_gui.keys():
-            # If some keys are not present = .ini file has different structure. Hence, overwrite with default config.ini. 
-            cp["AI"] = default_cfg_ai
-            cp["GUI"] = default_cfg_gui
+        # Keys that are not present (e.g. config.ini is from an older version of SOLAIRIA) are added with their defaults.
+        # The user's existing settings are kept.
+        missing_keys = []
+        for section, default_cfg in (("AI", default_cfg_ai), ("GUI", default_cfg_gui)):
+            if not cp.has_section(section):
+                cp.add_section(section)
+            for key, value in default_cfg.items():
+                if not cp.has_option(section, key):
+                    cp.set(section, key, value)
+                    missing_keys.append(key)
+        if missing_keys:
             with open("config.ini", "w", encoding = "utf-8") as cfg_file:
                cp.write(cfg_file)
-            print("Some config.ini keys are MISSING. New config.ini has been created with default settings.")
+            print("Some config.ini keys were MISSING. They have been added with default settings: "+", ".join(missing_keys))
         else:
             # All keys are present = .ini file has same structure. Hence, do nothing
             print("All config.ini keys are PRESENT.")
+        # Performance tunables that an LLM cannot be loaded with are reset to their defaults, so that the LLM still loads.
+        # Only the tunables at fault are reset. Repeated, as a reset tunable may not match another one (e.g. n_ubatch and n_batch).
+        tunables_reset = []
+        tunables_invalid = tunables_errors(tunable_values(cp["AI"]))
+        while tunables_invalid:
+            for keys, reason in tunables_invalid:
+                print("Invalid performance setting in config.ini: "+reason)
+                for key in keys:
+                    cp.set("AI", key, LLM_TUNABLES[key][0])
+                    tunables_reset.append(key)
+            tunables_invalid = tunables_errors(tunable_values(cp["AI"]))
+        if tunables_reset:
+            with open("config.ini", "w", encoding = "utf-8") as cfg_file:
+               cp.write(cfg_file)
+            print("Default performance settings have been restored for: "+", ".join(dict.fromkeys(tunables_reset)))
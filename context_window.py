@@ -0,0 +1,80 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+from collections import deque
+
+# From custom modules
+import tokenizer_service
+
+class ContextWindow:
+    # Holds the chat history (context/memory) with each turn's token count cached alongside it, plus a running total.
+    # Trimming from the front is a popleft() and a subtraction, so no text is re-encoded when the window slides.
+    def __init__(self):
+        self.turns = deque()    # Chat messages in {"role": ..., "content": ...} format, oldest first
+        self.token_counts = deque() # Token count of each item in self.turns, in the same order
+        self.total_tokens = 0
+
+    def __len__(self):
+        return len(self.turns)
+
+    def __iter__(self):
+        return iter(self.turns)
+
+    def messages(self):
+        # List copy of the turns, for passing to create_chat_completion()
+        return list(self.turns)
+
+    def append(self, role, content):
+        count = tokenizer_service.count_tokens(content)
+        self.turns.append({"role": role, "content": content})
+        self.token_counts.append(count)
+        self.total_tokens += count
+
+    def update_last(self, content):
+        # Replace content of the last turn (e.g. assistant's reply once streaming has completed)
+        count = tokenizer_service.count_tokens(content)
+        self.turns[-1]["content"] = content
+        self.total_tokens += count - self.token_counts[-1]
+        self.token_counts[-1] = count
+
+    def pop_oldest(self):
+        self.total_tokens -= self.token_counts.popleft()
+        return self.turns.popleft()
+
+    def clear(self):
+        self.turns.clear()
+        self.token_counts.clear()
+        self.total_tokens = 0
+
+    def replace(self, messages):
+        # Replace all turns with messages (e.g. with the summary produced by periodic_summary)
+        self.clear()
+        for item in messages:
+            self.append(item["role"], item["content"])
+
+    def recount(self):
+        # Re-count all turns in one batch call. Needed when the tokenizer used for counting changes.
+        self.token_counts = deque(tokenizer_service.count_tokens_batch([item["content"] for item in self.turns]))
+        self.total_tokens = sum(self.token_counts)
+
+    def fits(self, token_limit):
+        return self.total_tokens < token_limit
+
+    def turns_to_drop(self, token_limit):
+        # Number of oldest turns that must be dropped for total_tokens to fall below token_limit. Uses cached counts only.
+        excess = self.total_tokens - token_limit
+        drop = 0
+        for count in self.token_counts:
+            if excess < 0:
+                break
+            excess -= count
+            drop += 1
+        return drop
+
+    def trim_to(self, token_limit):
+        # Drop oldest turns until total_tokens is below token_limit. Returns number of turns dropped.
+        drop = self.turns_to_drop(token_limit)
+        for _ in range(drop):
+            self.pop_oldest()
+        return drop
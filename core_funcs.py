@@ -2,19 +2,25 @@
 # First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
 
 # From built-in libraries
-import datetime, time, traceback, math
-import tkinter as tk
+import datetime, time, traceback, math, os, hashlib, ast, queue, itertools, inspect
 import threading
-from tkinter import filedialog as fd, END
 from threading import Thread
 
-# From external libraries
-import sentencepiece
-from llama_cpp import Llama
-
 # From custom modules
 from config_handler import ConfigHandler
-import gui
+import config_handler
+import tokenizer_service
+import state_store
+import ui_bridge
+import model_loader
+import model_pool
+import parallel_analysis
+import file_reader
+import log_miner
+import analysis_cache
+import log_follower
+import csv_profiler
+from chat_session import ChatSession
 
 class LlmProcess:
     lock = threading.Lock()
@@ -22,140 +28,243 @@ class LlmProcess:
     thread_list = []    # List to store 'Send' threads, so they can be joined later if a new 'Send' thread needs to be created.
     llm = None
     llm_status = "Idle"
+    is_loading = False  # True while an LLM is being loaded in the background
+    load_cancel = threading.Event() # Set to cancel the LLM that is being loaded
+    snapshot_lock = threading.Lock() # Ensures only one background state restore (personality snapshot or session replay) runs at a time
+    snapshot_thread = None  # Latest personality snapshot thread, so headless mode can wait for it before its first prompt
+
+def post_gui_call(func_name, *args):
+    # Runs gui.<func_name>(*args) on the Tk main thread. Skipped in headless mode, where gui.py (and its Tk window) is never imported.
+    if ui_bridge.is_headless():
+        return
+    import gui  # Already imported, as gui.py imports this module
+    ui_bridge.post_call(getattr(gui, func_name), *args)
 
-def load_model(llm_path, ct_size, prompt_template):    
+def load_model(llm_path, ct_size, prompt_template, on_done = None, tunables = None):
+    # Loads the LLM in a background thread, so the GUI stays responsive. on_done(success) is called on the Tk main thread once finished.
+    # tunables are the performance tunables to load it with (config.ini's if None). Returns False if loading could not be started.
+    if LlmProcess.is_loading == True:
+        ui_bridge.show_error("Error",  "SOLAIRIA is still loading an LLM file. Please wait for it to finish, or cancel it before trying again.")
+        return False
     if LlmProcess.is_running == False:
         if llm_path.endswith(".gguf"):
+            tunables = config_handler.model_tunables(llm_path, tunables)   # With the settings auto_tuner found for this LLM, if it has been tuned
+            key = model_pool.pool_key(llm_path, ct_size, prompt_template, tunables)
+            llm = model_pool.get(key)
+            if llm is not None:
+                # LLM is still resident in the model pool, so switch to it without loading it again.
+                # It already has the draft model for the current speculative decoding settings, as they are part of its pool key.
+                print("Switching to LLM in model pool: "+os.path.basename(llm_path))
+                import speculative  # Already loaded along with the LLM
+                speculative.reset_stats()
+                finish_load_model(llm, key, "", on_done)
+                return True
             if prompt_template == "auto":
                 prompt_template = None
+            with LlmProcess.lock:
+                LlmProcess.llm = None
+                LlmProcess.is_loading = True
+            tokenizer_service.set_model(None)
             try:
-                print("Now loading the LLM model...")
-                # LOAD THE MODEL
-                # n_gpu_layers = -1 to offload all layers to GPU
-                # offload_kqv = True to offload kqv to GPU. Else, output will be rubbish when on CUBLAS/GPU
-                
-                with LlmProcess.lock:
-                    LlmProcess.llm = Llama(model_path = llm_path, n_ctx = int(ct_size),
-                            n_gpu_layers = -1, offload_kqv = True, chat_format = prompt_template, kv_overrides = {"add_bos_token":False})
-                gui.lbl_llm_name_var.set("LLM Loaded: "+LlmProcess.llm.metadata["general.name"])
-                return True
-            except ValueError:
-                tk.messagebox.showinfo("Error",  "Please set a valid LLM file, or check that your file path is correct.")
-                return False
-            except:
-                traceback.print_exc()
-                tk.messagebox.showinfo("Error",  "Unable to load the LLM file. Please try another.")
-                return False
+                # Unload least recently used LLMs first. This step is needed for GPU-bound version, because if existing LLM + new LLM
+                # needs more VRAM than what GPU has, then loading a new LLM without unloading previous one will exceed GPU VRAM and cause
+                # new LLM to load partially in GPU VRAM, resulting in partial/full usage of CPU processing for GPU-bound version.
+                model_pool.make_room(model_pool.estimate_bytes(llm_path, ct_size, tunables = tunables))
+            except OSError:
+                pass    # LLM file does not exist. Llama() reports this when loading
+            LlmProcess.load_cancel.clear()
+            post_gui_call("set_model_loading", True)
+            Thread(target = load_model_worker, args = (llm_path, ct_size, prompt_template, tunables, key, on_done), daemon = True).start()
+            return True
         elif len(llm_path) == 0 or llm_path.isspace():
             with LlmProcess.lock:
                 LlmProcess.llm = None
-            gui.lbl_llm_name_var.set("LLM Loaded: None")
+            model_pool.release_unpinned()
+            tokenizer_service.set_model(None)
+            ChatSession.msglist.recount()
+            post_gui_call("set_llm_name", "LLM Loaded: None")
+            if on_done is not None:
+                on_done(True)
             return True
         else:
-            tk.messagebox.showinfo("Error",  "Please load a valid LLM file (.gguf format).")
+            ui_bridge.show_error("Error",  "Please load a valid LLM file (.gguf format).")
             return False
     else:
-        tk.messagebox.showinfo("Error",  "You are trying to load another LLM file while SOLAIRIA is replying. "
+        ui_bridge.show_error("Error",  "You are trying to load another LLM file while SOLAIRIA is replying. "
                                +"Please wait for SOLAIRIA to finish before trying again.")
         return False
 
+def load_model_worker(llm_path, ct_size, prompt_template, tunables, key, on_done):
+    last_percent = -1
+
+    def on_progress(progress):
+        nonlocal last_percent
+        percent = int(progress*100)
+        if percent != last_percent:    # llama.cpp reports progress very often, so only post when the shown percentage changes
+            last_percent = percent
+            post_gui_call("set_load_progress", percent)
+        return not LlmProcess.load_cancel.is_set()  # Returning False makes llama.cpp stop loading
+
+    llm = None
+    error = ""
+    try:
+        print("Now loading the LLM model...")
+        # LOAD THE MODEL
+        # Performance tunables (see 'Performance' config). By default:
+        # n_gpu_layers = -1 to offload all layers to GPU
+        # offload_kqv = True to offload kqv to GPU. Else, output will be rubbish when on CUBLAS/GPU
+        # type_k/type_v = q8_0 or q4_0 quantize the KV cache, so a larger context fits into the same memory
+        # Imported here so that llama_cpp is only loaded in this thread, after the window is shown
+        from llama_cpp import Llama
+        import prompt_cache
+        import speculative
+        # Speculative decoding's draft model is set when the LLM is created (see speculative.py)
+        draft_model, draft_error = speculative.prepare(int(ct_size))
+        with model_loader.progress_callback(on_progress):
+            llm = Llama(model_path = llm_path, n_ctx = int(ct_size), draft_model = draft_model,
+                    chat_format = prompt_template, kv_overrides = {"add_bos_token":False}, **model_loader.llama_kwargs(tunables))
+        # Attach prompt cache so that a new turn only evaluates the tokens appended after the longest cached prefix
+        llm.set_cache(prompt_cache.create_prompt_cache(llm_path, ct_size, tunables))
+        draft_error = draft_error or speculative.check_draft_llm(llm)
+        if draft_error:
+            print(draft_error)
+            ui_bridge.post_chat("\n---Speculative decoding is off: "+draft_error+"---", "tag_info")
+    except ValueError:
+        llm = None
+        error = "Please set a valid LLM file, or check that your file path is correct."
+    except:
+        traceback.print_exc()
+        llm = None
+        error = "Unable to load the LLM file. Please try another."
+    ui_bridge.post_call(finish_load_model, llm, key, error, on_done)
+
+def finish_load_model(llm, key, error, on_done):
+    # Runs on the Tk main thread once load_model_worker() is done, or straight away if the LLM was resident in the model pool
+    with LlmProcess.lock:
+        LlmProcess.is_loading = False
+        if llm is not None:
+            LlmProcess.llm = llm
+    post_gui_call("set_model_loading", False)
+    if llm is not None:
+        model_pool.add(key, llm)
+        print("LLMs in model pool: "+", ".join(model_pool.resident_names()))
+        llm.verbose = ast.literal_eval(ConfigHandler.cp["AI"]["llm_stats_enable"])    # Turns on or off display of LLM stats
+        tokenizer_service.set_model(llm)    # Count tokens with the loaded LLM's own tokenizer from now on
+        ChatSession.msglist.recount()
+        post_gui_call("set_llm_name", "LLM Loaded: "+llm.metadata["general.name"])
+        if ChatSession.default_sys_prompt is not None:
+            # On first launch, this may be done by set_personality() instead, if personality has not been set yet
+            thread_personality_snapshot()
+    elif LlmProcess.load_cancel.is_set():
+        post_gui_call("set_llm_name", "LLM Loaded: None (loading was cancelled)")
+    else:
+        post_gui_call("set_llm_name", "LLM Loaded: None")
+        ui_bridge.show_error("Error",  error)
+    if on_done is not None:
+        on_done(llm is not None)
+
+def cancel_load_model():
+    LlmProcess.load_cancel.set()
+
 def set_personality():
     personality = ConfigHandler.cp["AI"]["personality"]
-    if len(personality) <= gui.root.personality_limit:
+    if len(personality) <= ChatSession.personality_limit:
         if len(personality) != 0:
-            gui.root.default_sys_prompt = personality
+            ChatSession.default_sys_prompt = personality
         else:
-            gui.root.default_sys_prompt = "You are an AI Assistant."
+            ChatSession.default_sys_prompt = "You are an AI Assistant."
+        thread_personality_snapshot()
     else:
-        str_error = "Your input for Personality was "+str(len(personality))+" characters long. Please keep within "+str(gui.root.personality_limit)+" characters. This limit depends on Context Size"
-        tk.messagebox.showinfo("Error",  str_error)
-        gui.open_config()
+        str_error = "Your input for Personality was "+str(len(personality))+" characters long. Please keep within "+str(ChatSession.personality_limit)+" characters. This limit depends on Context Size"
+        ui_bridge.show_error("Error",  str_error)
+        post_gui_call("open_config")
 
 def send(msg):
+    # Replies to msg (or runs it if it is a '/' command), with the chat history as context. Used by the 'Send' thread and headless mode.
+    # Returns False if the context/memory had to be compressed first instead, in which case msg was not replied to.
     with LlmProcess.lock:
         LlmProcess.is_running = True
     my_prompt = msg
+    replied = True
     final_result = ""
     context_size_limit = 0
     max_token_limit = 0
     context_size = int(ConfigHandler.cp["AI"]["context_size"])
-    prev_prompts = "\n".join([item["content"] for item in gui.root.msglist])
-    match(ConfigHandler.cp["AI"]["context_mgmt"]):
-        case "sliding_window":  # Truncate prev_prompts in a "sliding window" manner
-            context_size_limit = context_size
-            max_token_limit = 0
-            
-            while count_tokens(prev_prompts) >= context_size_limit*0.7: # Truncate prev_prompts when it's more than 70% of context_size_limit
-                del gui.root.msglist[0] # Delete oldest/first item in gui.root.msglist
-                prev_prompts = "\n".join([item["content"] for item in gui.root.msglist])                
-        case "periodic_summary":    # Set limits to facilitate "periodic summary" later
-            context_size_limit = int(context_size*0.5)  # Equivalent to 0.5 OF context_size
-            max_token_limit = context_size//4    # Equivalent to 0.25 of whole context_size
+    context_size_limit, max_token_limit = context_limits(ChatSession.msglist, ConfigHandler.cp["AI"]["context_mgmt"], context_size)
 
-    # Check if previous_prompts is less than context_size_limit
-    if count_tokens(prev_prompts) < context_size_limit:
-        gui.txt_user.delete("1.0", "end")
-        gui.lbl_input_counter.config(text = "Total characters: 0")
+    # Check if context/memory is less than context_size_limit
+    if ChatSession.msglist.fits(context_size_limit):
+        post_gui_call("clear_user_input")
 
         match(my_prompt):
             case "/r":  # Resets prev_prompts (context memory) to blank
-                gui.reset_memory()
+                post_gui_call("reset_memory")
                 return
             case "/clear":  # Clears chat window
-                gui.clear_chat()
+                post_gui_call("clear_chat")
+                return
+            case "/f" | "/follow" if ui_bridge.is_headless():   # These choose a file in a dialog, which needs the SOLAIRIA window
+                ui_bridge.post_chat("\n---'"+my_prompt+"' needs the SOLAIRIA window to choose a file. Use '/f <path>' to analyse a file instead.---", "tag_info")
+                with LlmProcess.lock:
+                    LlmProcess.is_running = False
+                    LlmProcess.llm_status = "Idle"
+                ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
                 return
             case "/f":  # Analyse text file
                 analyse_text_file()
                 return
+            case "/follow":  # Follow a growing log file and analyse new lines as they are appended
+                follow_log_file()
+                return
+            case "/tune":   # Find the fastest thread counts and batch size for the loaded LLM on this computer
+                import auto_tuner   # Imported here, as it is only needed when tuning
+                auto_tuner.tune_loaded_llm()
+                with LlmProcess.lock:
+                    LlmProcess.is_running = False
+                return
+            case _ if my_prompt.startswith("/f "):   # Analyse the text file at the given path, without choosing it in a dialog
+                analyse_file(my_prompt[3:].strip())
+                return
             case _: # Do this if user input is not any of the above '/' commands
-                if gui.chat_box.compare("end-1c", "!=", "1.0"):
-                    # Insert new line 'separator' if textbox is not empty (i.e. conversation is ongoing)
-                    gui.chat_box.insert(END, "\n")
-                gui.chat_box.insert(END, "User -> " + my_prompt, "tag_user")
-                gui.chat_box.see("end")
+                post_gui_call("insert_user_message", my_prompt)
                 
-        gui.root.msglist.append({"role": "user", "content": my_prompt})  # Add my_prompt to gui.root.msglist
+        ChatSession.msglist.append("user", my_prompt)  # Add my_prompt to ChatSession.msglist
         
+        if ConfigHandler.cp["AI"]["context_mgmt"] == "sliding_window":
+            fit_to_context(ChatSession.msglist, ChatSession.default_sys_prompt, max_token_limit)
+
         # Generate response to user's input, with chat history as prior context.
         # Use llama-cpp-python's auto-detected preset prompt templates for generation
-        llm_response = generate_text_from_prompt([{"role": "system", "content": gui.root.default_sys_prompt}] + gui.root.msglist, max_tokens = max_token_limit)
+        llm_response = generate_text_from_prompt([{"role": "system", "content": ChatSession.default_sys_prompt}] + ChatSession.msglist.messages(), max_tokens = max_token_limit)
         
         with LlmProcess.lock:
             LlmProcess.llm_status = "Thinking"
-        gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
-        gui.chat_box.insert(END, "\nAsst -> ", "tag_asst")
-        gui.chat_box.see("end")
-        gui.root.msglist.append({"role": "assistant", "content": ""})   # Add an empty assistant response. Content will be updated later.
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        ui_bridge.post_chat("\nAsst -> ", "tag_asst")
+        ChatSession.msglist.append("assistant", "")   # Add an empty assistant response. Content will be updated later.
         
         # Stream and print the AI's output
         try:
             for item in llm_response:
                 if LlmProcess.is_running == False:
                     if ConfigHandler.cp["AI"]["history_option"] == "on":
-                        gui.root.msglist[-1]["content"] = final_result  # Update "content" of last item (which corresponds to assistant's response added earlier)
+                        ChatSession.msglist.update_last(final_result)  # Update "content" of last item (which corresponds to assistant's response added earlier)
                     else:
-                        gui.root.msglist = []   # Clear gui.root.msglist if history_option is disabled
+                        ChatSession.msglist.clear()   # Clear ChatSession.msglist if history_option is disabled
                     #raise KeyboardInterrupt
                     return
                 else:
                     if not LlmProcess.llm_status.startswith("Replying"):
                         with LlmProcess.lock:
                             LlmProcess.llm_status = "Replying (press [Esc] to stop)"
-                        gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+                        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
                     response_content = ""
                     try:
                         response_content = item['choices'][0]['delta']['content']
-                        if gui.root.winfo_exists():
-                            gui.chat_box.insert(END, response_content, "tag_asst")
-                            gui.chat_box.see("end")                    
+                        ui_bridge.post_chat(response_content, "tag_asst")   # Drained and coalesced by the Tk main loop
                     except KeyError:
                         # Because (1) first and last key's of the ['delta'] dict is not 'content', and (2) 'content' key only appears on second for... interation, this exception is needed
                         pass
-                    except tk.TclError as ex:
-                        if str(ex) == "can't invoke \"winfo\" command: application has been destroyed":
-                            pass
-                        else:
-                            traceback.print_exc()
                     except:
                         traceback.print_exc()
                     final_result += response_content
@@ -164,60 +273,54 @@ def send(msg):
             print("\n\nYou interrupted the response.")
             return
         except ValueError:
-            gui.chat_box.insert(END, "\n---Context/memory exceeded. Wiping context/memory. SOLAIRIA will not be able to reference earlier parts of the conversation.---", "tag_info")
-            gui.chat_box.see("end")
-            gui.root.msglist = []
+            ui_bridge.post_chat("\n---Context/memory exceeded. Wiping context/memory. SOLAIRIA will not be able to reference earlier parts of the conversation.---", "tag_info")
+            ChatSession.msglist.clear()
             with LlmProcess.lock:
                 LlmProcess.llm_status = "Idle"
-            gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+            ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
             return
         except:
             traceback.print_exc()
         
         with LlmProcess.lock:    
             LlmProcess.llm_status = "Idle"
-        gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
 
         if ConfigHandler.cp["AI"]["history_option"] == "on":
-            gui.root.msglist[-1]["content"] = final_result  # Update "content" of last item (which corresponds to assistant's response added earlier)
+            ChatSession.msglist.update_last(final_result)  # Update "content" of last item (which corresponds to assistant's response added earlier)
         else:
-            gui.root.msglist = []   # Clear gui.root.msglist if history_option is disabled
+            ChatSession.msglist.clear()   # Clear ChatSession.msglist if history_option is disabled
                 
     # CHECK IF PREVIOUS PROMPTS IS 1/2 OF CONTEXT SIZE (which increases possibility of next user prompt exceeding limit)
     ####final_result = (llm_response['choices'][0]['message']['content'])  #this response format is for non-streaming output.
-    elif ConfigHandler.cp["AI"]["context_mgmt"] == "periodic_summary" and count_tokens(prev_prompts) >= context_size_limit :
-        gui.chat_box.insert(END, "\n---Context/memory limit reached. Compressing context/memory...---", "tag_info")
-        gui.chat_box.see("end")
+    elif ConfigHandler.cp["AI"]["context_mgmt"] == "periodic_summary" and not ChatSession.msglist.fits(context_size_limit):
+        ui_bridge.post_chat("\n---Context/memory limit reached. Compressing context/memory...---", "tag_info")
 
         # Duration is based on desktop test rig benchmark. Desktop test rig specs can be found on SOLAIRIA's GitHub page.
         # With 1024 context size, duration is ~60-300secs on CPU, and ~3-5secs on GPU.
+        # Run 'python main.py --benchmark --scenarios summary' to measure it on another computer or LLM.
         duration_cpu_min = round(60 * (context_size/1024))
         duration_cpu_max = round(300 * (context_size/1024))
         duration_gpu_min = round(3 * (context_size/1024))
         duration_gpu_max = round(5 * (context_size/1024))
 
-        gui.chat_box.insert(END,
-                            f"\nThis may take around {duration_cpu_min}-{duration_cpu_max}secs (CPU version)/{duration_gpu_min}-{duration_gpu_max}secs (CUDA GPU version) for {context_size} tokens context size. Please hold on...",
+        ui_bridge.post_chat(f"\nThis may take around {duration_cpu_min}-{duration_cpu_max}secs (CPU version)/{duration_gpu_min}-{duration_gpu_max}secs (CUDA GPU version) for {context_size} tokens context size. Please hold on...",
                             "tag_info")
-        gui.chat_box.see("end")
 
         final_summary = ""
 
         # Generate internal summary of conversation
-        gui.root.msglist.append({"role": "user", "content": "Summarise our conversation using less than "+str(gui.root.context_char_limit//4)
-                    +" characters.Use short paragraph style."})
         # Use llama-cpp-python's auto-detected preset prompt templates for generation
-        llm_summary = generate_text_from_prompt([{"role": "system", "content": "You're a text summariser.Don't reveal your role.You never forget my name and the name I call you."}]
-                                                 + gui.root.msglist, max_tokens = context_size - count_tokens(prev_prompts), temperature = 0.2)    # Set a lower temperature for more standardised and less creative replies
+        summary_messages, summary_max_tokens = summary_prompt(ChatSession.msglist, context_size)
+        llm_summary = generate_text_from_prompt(summary_messages, max_tokens = summary_max_tokens, temperature = 0.2)    # Set a lower temperature for more standardised and less creative replies
         with LlmProcess.lock:
             LlmProcess.llm_status = "Compressing memory"
-        gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
         # Stream the AI's output as an internal summary
         try:
             for item in llm_summary:
                 if LlmProcess.is_running == False:
-                    gui.chat_box.insert(END, "\n---Context/memory compression interrupted. SOLAIRIA may not be able to reference some parts of the earlier conversation.---", "tag_info")
-                    gui.chat_box.see("end")
+                    ui_bridge.post_chat("\n---Context/memory compression interrupted. SOLAIRIA may not be able to reference some parts of the earlier conversation.---", "tag_info")
                     return
                 else:
                     response_content = ""
@@ -230,37 +333,114 @@ def send(msg):
                         traceback.print_exc()
                     final_summary += response_content
         except ValueError:
-            gui.chat_box.insert(END, "\n---Context/memory exceeded. Wiping context/memory. SOLAIRIA will not be able to reference earlier parts of the conversation.---", "tag_info")
-            gui.chat_box.see("end")
-            gui.root.msglist = []
+            ui_bridge.post_chat("\n---Context/memory exceeded. Wiping context/memory. SOLAIRIA will not be able to reference earlier parts of the conversation.---", "tag_info")
+            ChatSession.msglist.clear()
             with LlmProcess.lock:
                 LlmProcess.llm_status = "Idle"
-            gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+            ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
             return
         except:
             traceback.print_exc()
             
-        if(count_tokens(final_summary)<5 or final_summary.isspace() or len(final_summary)==0):
-            gui.chat_box.insert(END, "\n" + "---Failed context/memory compression (could be due to LLM getting confused with the preset/custom prompt template). "
+        if is_failed_summary(final_summary):
+            ui_bridge.post_chat("\n" + "---Failed context/memory compression (could be due to LLM getting confused with the preset/custom prompt template). "
                             +"SOLAIRIA will not be able to reference earlier parts of the conversation.---.", "tag_info")
-            gui.chat_box.see("end")
             with LlmProcess.lock:
                 LlmProcess.llm_status = "Idle"
-            gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+            ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
         else:
-            gui.chat_box.insert(END, "\n---Completed context/memory compression. Some details of the earlier conversation may be lost due to compression.---", "tag_info")
-            gui.chat_box.see("end")
+            ui_bridge.post_chat("\n---Completed context/memory compression. Some details of the earlier conversation may be lost due to compression.---", "tag_info")
             with LlmProcess.lock:
                 LlmProcess.llm_status = "Idle"
-            gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+            ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
 
         if ConfigHandler.cp["AI"]["history_option"] == "on":
-            gui.root.msglist = [{"role": "assistant", "content": final_summary}]
+            ChatSession.msglist.replace([{"role": "assistant", "content": final_summary}])
         else:
-            gui.root.msglist = []
+            ChatSession.msglist.clear()
+        replied = False
     with LlmProcess.lock:        
         LlmProcess.is_running = False
+    return replied
     
+def personality_snapshot():
+    # Restores the evaluated personality (system prompt + prompt template header) KV state from disk, so the first reply
+    # does not need to process the personality again. If there is no snapshot yet, evaluates it once and saves it.
+    with LlmProcess.snapshot_lock:
+        llm = LlmProcess.llm
+        if llm is None or ConfigHandler.cp["AI"]["personality_snapshot"] != "on" or LlmProcess.is_running == True:
+            return
+        sys_prompt = ChatSession.default_sys_prompt
+        prefix = tokenizer_service.render_chat_prompt([{"role": "system", "content": sys_prompt}], add_generation_prompt = False)
+        if prefix is None:
+            return  # Preset prompt templates can't be rendered here, so there is nothing to snapshot
+
+        with LlmProcess.lock:
+            LlmProcess.llm_status = "Loading personality"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        try:
+            # Snapshot key = model file + context size + KV cache types + prompt template + personality. A change in any of them needs a new snapshot.
+            model_key = state_store.model_fingerprint(llm.model_path)[:16]
+            settings_key = hashlib.sha256("|".join([str(llm.n_ctx()), state_store.kv_cache_types(llm), str(llm.chat_format),
+                                                    llm.metadata.get("tokenizer.chat_template", ""), sys_prompt]).encode("utf-8")).hexdigest()[:16]
+            snapshot_dir = os.path.join(ConfigHandler.dirname, "cache", "snapshots")
+            snapshot_path = os.path.join(snapshot_dir, model_key+"-"+settings_key+".state")
+            if os.path.exists(snapshot_path):
+                header, state = state_store.read_state(snapshot_path)
+                llm.load_state(state)
+                print("Restored personality snapshot: "+snapshot_path)
+            else:
+                llm.reset()
+                llm.eval(llm.tokenize(prefix.encode("utf-8"), add_bos = False, special = True))
+                # Remove this model's snapshots of previous personalities/settings, as they have been invalidated
+                for file_name in os.listdir(snapshot_dir) if os.path.isdir(snapshot_dir) else []:
+                    if file_name.startswith(model_key+"-"):
+                        os.remove(os.path.join(snapshot_dir, file_name))
+                state_store.write_state(snapshot_path, llm.save_state(), {"kind": "personality", "model_path": llm.model_path})
+                print("Saved personality snapshot: "+snapshot_path)
+        except:
+            traceback.print_exc()
+        with LlmProcess.lock:
+            if LlmProcess.llm_status == "Loading personality":
+                LlmProcess.llm_status = "Idle"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+
+# Thread for personality_snapshot() function, so that the GUI is not blocked while the personality is evaluated
+def thread_personality_snapshot():
+    LlmProcess.snapshot_thread = Thread(target = personality_snapshot, daemon = True)
+    LlmProcess.snapshot_thread.start()
+
+def replay_history():
+    # Evaluates personality + chat history (e.g. of a loaded session whose saved state can't be restored as-is),
+    # so that the next reply only needs to process the new prompt.
+    with LlmProcess.snapshot_lock:
+        llm = LlmProcess.llm
+        if llm is None or LlmProcess.is_running == True:
+            return
+        prompt = tokenizer_service.render_chat_prompt([{"role": "system", "content": ChatSession.default_sys_prompt}] + ChatSession.msglist.messages(),
+                                                      add_generation_prompt = False)
+        if prompt is None:
+            return  # Preset prompt templates can't be rendered here. History will be processed with the next reply instead.
+
+        with LlmProcess.lock:
+            LlmProcess.llm_status = "Restoring session"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        try:
+            tokens = llm.tokenize(prompt.encode("utf-8"), add_bos = False, special = True)
+            if len(tokens) < llm.n_ctx():
+                llm.reset()
+                llm.eval(tokens)
+        except:
+            traceback.print_exc()
+        with LlmProcess.lock:
+            if LlmProcess.llm_status == "Restoring session":
+                LlmProcess.llm_status = "Idle"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+
+# Thread for replay_history() function
+def thread_replay_history():
+    Thread(target = replay_history, daemon = True).start()
+
 # Thread for send() function
 def thread_send(msg):
     with LlmProcess.lock:
@@ -279,34 +459,30 @@ def evt_send(event, msg):
     if LlmProcess.llm is not None:
         match(LlmProcess.llm_status):
             case "Thinking":
-                gui.chat_box.insert(END, "\n---Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.---\n", "tag_info")
-                gui.chat_box.see("end")
+                ui_bridge.post_chat("\n---Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.---\n", "tag_info")
                 return "break"  # Need this to prevent default "Enter" key new line behaviour in text box
             case "Reading file":
-                gui.chat_box.insert(END, "\n---Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.---\n", "tag_info")
-                gui.chat_box.see("end")
+                ui_bridge.post_chat("\n---Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.---\n", "tag_info")
                 return "break"  # Need this to prevent default "Enter" key new line behaviour in text box
             case "Compressing memory":
-                gui.chat_box.insert(END, "\n---Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.---\n", "tag_info")
-                gui.chat_box.see("end")                
+                ui_bridge.post_chat("\n---Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.---\n", "tag_info")
+                return "break"  # Need this to prevent default "Enter" key new line behaviour in text box
+            case "Loading personality" | "Restoring session":
+                ui_bridge.post_chat("\n---Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.---\n", "tag_info")
                 return "break"  # Need this to prevent default "Enter" key new line behaviour in text box
             case _:
                 if len(msg) == 0 or msg.isspace():
                     if LlmProcess.is_running == False:
-                        if gui.chat_box.compare("end-1c", "!=", "1.0"):
-                            # Insert new line if textbox is not empty (i.e. not empty due to conversation ongoing)
-                            gui.chat_box.insert(END, "\n")
-                        gui.chat_box.insert(END, "User -> " + msg, "tag_user")
-                        gui.chat_box.see("end")
-                elif len(msg) > gui.root.my_prompt_limit:
-                    tk.messagebox.showinfo("Error", "Your input was "+str(len(msg))+" characters long. Please keep within "+str(gui.root.my_prompt_limit)+" characters.")
+                        post_gui_call("insert_user_message", msg)
+                elif len(msg) > ChatSession.my_prompt_limit:
+                    ui_bridge.show_error("Error", "Your input was "+str(len(msg))+" characters long. Please keep within "+str(ChatSession.my_prompt_limit)+" characters.")
                 else:
                     thread_send(msg)
                 return "break"  # Need this to prevent default "Enter" key new line behaviour in text box
     else:
-        tk.messagebox.showinfo("No LLM (.gguf) file loaded yet!",  "Please load an LLM file (.gguf format) first."
+        ui_bridge.show_error("No LLM (.gguf) file loaded yet!",  "Please load an LLM file (.gguf format) first."
                                +"\n\nRefer to the Help menu to find out where to download LLM files (.gguf format).")
-        gui.open_config()
+        post_gui_call("open_config")
         return "break"  # Need this to prevent default "Enter" key new line behaviour in text box
     
 def generate_text_from_prompt(user_prompt,
@@ -316,10 +492,21 @@ def generate_text_from_prompt(user_prompt,
                               top_p = 0.5,  # Initially was 0.1. Higher = wider range of response but may be less accurate in answers.
                               stream = True,    # Enables streaming of output
                               mirostat_mode = 2,
-                              stop = ["<user>", "</user>", "<|user", "<<USER>>", "[/INST]", "<history>", "</history>"] # stopwords to prevent LLM from talking to itself
+                              stop = ["<user>", "</user>", "<|user", "<<USER>>", "[/INST]", "<history>", "</history>"], # stopwords to prevent LLM from talking to itself
+                              llm = None    # LLM to generate with. Defaults to the loaded LLM, or a worker context in parallel file analysis
                               ):
+    if llm is None:
+        llm = LlmProcess.llm
+    if llm.verbose:
+        print_context_budget(context_budget(user_prompt, max_tokens))    # Shown together with the other LLM performance stats
+        import prompt_cache # Already loaded along with the LLM
+        print(prompt_cache.cache_stats(llm.cache))
+        import speculative  # Already loaded along with the LLM
+        if speculative.stats_text():
+            print(speculative.stats_text())
+
     # Define the parameters
-    model_output = LlmProcess.llm.create_chat_completion(
+    model_output = llm.create_chat_completion(
         user_prompt,
         max_tokens=max_tokens,
         temperature=temperature,
@@ -331,11 +518,79 @@ def generate_text_from_prompt(user_prompt,
         )
     return model_output
 
+def generation_settings(**overrides):
+    # Sampling settings that generate_text_from_prompt() generates with, given its keyword arguments. Used to key cached results.
+    settings = {name: parameter.default for name, parameter in inspect.signature(generate_text_from_prompt).parameters.items()
+                if parameter.default is not inspect.Parameter.empty and name not in ("stream", "llm")}
+    settings.update(overrides)
+    return settings
+
 def count_tokens(text):
-    # Using Llama tokenizer.model from https://huggingface.co/hf-internal-testing/llama-tokenizer/blob/main/tokenizer.model , dated 30 Mar 2023
-    sp = sentencepiece.SentencePieceProcessor(model_file = ConfigHandler.dirname+"/tokenizer/tokenizer.model")
-    prompt_tokens = sp.encode_as_ids(text)
-    return len(prompt_tokens)
+    # Tokenizer is loaded once and counts are memoised in tokenizer_service, so repeated calls on the same text are cheap
+    return tokenizer_service.count_tokens(text)
+
+def count_tokens_batch(texts):
+    # Counts a list of texts (e.g. whole chat history or list of file chunks) in one call
+    return tokenizer_service.count_tokens_batch(texts)
+
+def context_budget(messages, max_tokens):
+    # Splits the tokens of a chat completion request into system/history/prompt/template/output.
+    # Counted with the loaded LLM's tokenizer over its rendered prompt template (see 'Token Counting' config), so the
+    # context size ratios used in send() and file_text_chunker() can be checked against actual measurements.
+    if LlmProcess.llm is not None:
+        context_size = LlmProcess.llm.n_ctx()
+    else:
+        context_size = int(ConfigHandler.cp["AI"]["context_size"])
+    counts = count_tokens_batch([item["content"] for item in messages])
+    budget = {"counter": tokenizer_service.active_mode(), "context_size": context_size, "system": 0, "history": 0, "prompt": 0}
+    for index, (item, count) in enumerate(zip(messages, counts)):
+        if item["role"] == "system":
+            budget["system"] += count
+        elif index == len(messages) - 1:
+            budget["prompt"] += count   # Latest message, i.e. the one being replied to
+        else:
+            budget["history"] += count
+    budget["prompt_total"] = tokenizer_service.count_chat_tokens(messages)
+    budget["template"] = max(0, budget["prompt_total"] - sum(counts))
+    budget["output"] = max_tokens if max_tokens > 0 else max(0, context_size - budget["prompt_total"])
+    return budget
+
+# Context management shared by the chat window (send()) and sessions (session_engine.chat())
+def context_limits(msglist, context_mgmt, context_size):
+    # Returns (context size limit, max tokens of the reply) for context_mgmt. The history must fit within the limit before a new turn,
+    # or else it is summarised first (periodic_summary).
+    match(context_mgmt):
+        case "periodic_summary":    # Set limits to facilitate "periodic summary" later
+            return int(context_size*0.5), context_size//4   # Equivalent to 0.5 and 0.25 of whole context_size
+        case _:     # sliding_window: Truncate context/memory in a "sliding window" manner
+            # Truncate oldest turns while context/memory is more than 70% of context_size. Uses each turn's cached token count, so nothing is re-tokenized.
+            msglist.trim_to(context_size*0.7)
+            return context_size, 0
+
+def summary_prompt(msglist, context_size):
+    # Returns (messages, max tokens) that ask the LLM to summarise the conversation in msglist into one turn (periodic_summary)
+    messages = ([{"role": "system", "content": "You're a text summariser.Don't reveal your role.You never forget my name and the name I call you."}]
+                + msglist.messages()
+                + [{"role": "user", "content": "Summarise our conversation using less than "+str(context_size)+" characters.Use short paragraph style."}])
+    return messages, max(1, context_size - msglist.total_tokens)
+
+def is_failed_summary(summary):
+    # True if the LLM did not produce a usable summary (e.g. it got confused by the prompt template)
+    return count_tokens(summary) < 5 or summary.isspace() or len(summary) == 0
+
+def fit_to_context(msglist, sys_prompt, max_tokens):
+    # Drop further oldest turns if the full prompt (incl. personality and prompt template tokens) would not fit into the LLM's context.
+    # Otherwise create_chat_completion() raises ValueError, which wipes the whole context/memory.
+    budget = context_budget([{"role": "system", "content": sys_prompt}] + msglist.messages(), max_tokens)
+    while budget["prompt_total"] >= budget["context_size"] and len(msglist) > 1:
+        msglist.pop_oldest()
+        budget = context_budget([{"role": "system", "content": sys_prompt}] + msglist.messages(), max_tokens)
+
+def print_context_budget(budget):
+    context_size = budget["context_size"]
+    splits = ", ".join(key+"="+str(budget[key])+" ("+str(round(100*budget[key]/context_size, 1))+"%)"
+                       for key in ("system", "history", "prompt", "template", "output"))
+    print("Context budget ("+budget["counter"]+" tokenizer, "+str(context_size)+" tokens): "+splits)
 
 # Halves a String and splits it based on the newline, period or exclamation mark before the String's midpoint to capture the entire sentence/line.
 def text_halver(text):
@@ -348,185 +603,581 @@ def text_halver(text):
         split_chunks = text[:midpoint], text[midpoint:]
     return split_chunks
 
-def file_text_chunker(path):
+def file_text_chunker(path, start = None, end = None, first_line = 1, on_end = None):
+    # Yields [Line range, main text] chunks as soon as each one is full, so analysis can start before the whole file is read.
+    # start/end (byte offsets) chunk only part of the file, starting at line first_line. on_end(last line number) is called once read.
+    # Each line is tokenized once and added to a running token count of the chunk. This can differ slightly from counting
+    # the whole chunk at once (as tokens may merge across lines), which the file token limit leaves plenty of room for.
     # Formula for file token limit
     context_size = int(ConfigHandler.cp["AI"]["context_size"])
     file_token_limit = context_size * 0.65  # Set limit to 0.65 of context_size
-    chunk = ""
-    chunk_list = []
-    start_index = 1
-    last_index = 1
-    with LlmProcess.lock:
-        LlmProcess.llm_status = "Reading file"
-    gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
-        
-    # This With.. loop may have issues with some lines in UTF-16 text/log files.
-    with open(path) as file:
-        for index, line in enumerate(file, start = 1):
-            chunk += line
-            if count_tokens(chunk) < context_size:
-                if count_tokens(chunk) >= file_token_limit:
-                    chunk_list.append(["Ln "+str(start_index)+"-"+str(index), chunk])
-                    chunk = ""
-                    start_index = index + 1 # Set start_index to next line's index for next iteration
-            elif count_tokens(chunk) >= context_size:
+    carry = ""  # Second half of a chunk that was split in half, which starts the next chunk
+    chunk_texts = []    # Text of the chunk's records, with log deduplication (see below)
+    chunk_tokens = 0
+    start_index = None  # First and last line of the file covered by the chunk
+    end_index = 0
+    read_index = first_line # First line of the chunk that is read back from the file (after carry)
+    chunk_count = 0
+
+    # The file is memory-mapped and its encoding (UTF-8, UTF-16 or the system default) is detected from its BOM/contents
+    with file_reader.FileReader(path) as reader:
+        # Units of text to chunk: (first line, last line, text). Normally one per line. With log deduplication,
+        # repeated log lines are collapsed into one record per template, which covers the lines it was collapsed from.
+        lines = reader.lines(start, end, first_line)
+        units = ((index, index, line) for index, line in lines)
+        miner = None
+        if path.lower().endswith(".log") and ConfigHandler.cp["AI"]["log_dedup"] == "on":
+            miner = log_miner.LogTemplateMiner(block_chars = int(file_token_limit)*4)   # About one chunk of lines (~4 characters per token)
+            units = miner.records(lines)
+
+        def chunk_text():
+            # Lines are read back from the line-offset index, so they are not kept in memory while a chunk fills up.
+            # Records are not lines of the file, so their text is kept instead.
+            if miner is not None:
+                return carry+"".join(chunk_texts)
+            if end_index < read_index:
+                return carry    # No lines read since the chunk was split, or none at all
+            return carry+reader.read_lines(read_index, end_index)
+
+        for first_index, last_index, text in units:
+            if miner is not None:
+                chunk_texts.append(text)
+            chunk_tokens += tokenizer_service.count_tokens_uncached(text)  # Not cached, as each line is only counted once
+            start_index = first_index if start_index is None else min(start_index, first_index)
+            end_index = max(end_index, last_index)
+            if chunk_tokens < context_size:
+                if chunk_tokens >= file_token_limit:
+                    yield ["Ln "+str(start_index)+"-"+str(end_index), chunk_text()]
+                    chunk_count += 1
+                    carry = ""
+                    chunk_texts = []
+                    chunk_tokens = 0
+                    start_index = None
+                    end_index = 0
+                    read_index = last_index + 1
+            else:
                 # If the chunk's length in tokens exceeds context_size (due to text encoding issue or it's a really long line of text), split it in half
-                split_text = text_halver(chunk)
-                chunk_list.append(["Ln "+str(start_index)+"-"+str(index), split_text[0]])
-                chunk = ""+split_text[1]
-                start_index = index # Set start_index to current line's index, to continue from same line number in next iteration
-            last_index = index
-        chunk_list.append(["Ln "+str(start_index)+"-"+str(last_index), chunk])    # Append remaining chunk to chunk_list after completing the above For.. loop
-    return chunk_list
+                split_text = text_halver(chunk_text())
+                yield ["Ln "+str(start_index)+"-"+str(end_index), split_text[0]]
+                chunk_count += 1
+                carry = split_text[1]
+                chunk_texts = []
+                chunk_tokens = tokenizer_service.count_tokens_uncached(carry)
+                start_index = first_index   # Continue from the same line in the next chunk
+                end_index = last_index
+                read_index = last_index + 1
+        if start_index is not None or chunk_count == 0:
+            range_start = start_index or first_line
+            yield ["Ln "+str(range_start)+"-"+str(max(range_start, end_index)), chunk_text()]   # Remaining chunk after completing the above For.. loop
+        if on_end is not None:
+            on_end(reader.last_line())
+
+    if miner is not None:
+        ui_bridge.post_chat("\n---Log deduplication: "+str(miner.lines_in)+" lines were collapsed into templates, "
+                            +str(round(miner.reduction(), 1))+"x less text to analyse.---", "tag_info")
+
+class FileChunkReader:
+    # Runs file_text_chunker() in a background thread, so that the next parts of a file are read and tokenized
+    # while the LLM is analysing the current one. Iterate over it to get the chunks in line order.
+    def __init__(self, path, max_queued = 8, start = None, end = None, first_line = 1):
+        self.chunks = queue.Queue(maxsize = max_queued)   # Bounded, so reading stays only a few parts ahead of analysis
+        self.total = None   # Number of chunks, known once the whole file has been read
+        self.last_line = None   # Line number of the last line read, known once the whole file (or start-end range) has been read
+        self.error = None
+        self.closed = threading.Event()
+        Thread(target = self.read, args = (path, start, end, first_line), daemon = True).start()
+
+    def read(self, path, start, end, first_line):
+        count = 0
+        try:
+            for chunk in file_text_chunker(path, start, end, first_line, on_end = self.set_last_line):
+                if not self.put(chunk):
+                    return
+                count += 1
+            self.total = count
+        except Exception as e:
+            traceback.print_exc()
+            self.error = e
+        self.put(None)  # Marks the end of the file
+
+    def set_last_line(self, last_line):
+        self.last_line = last_line
+
+    def put(self, item):
+        # Returns False if the reader was closed while waiting for space in the queue
+        while not self.closed.is_set():
+            try:
+                self.chunks.put(item, timeout = 0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                if self.error is not None:
+                    raise self.error
+                return
+            if LlmProcess.is_running == False:
+                return  # Stop reading the rest of the file once analysis is stopped
+            yield chunk
+
+    def close(self):
+        self.closed.set()
+
+def collect_stream(model_output, on_complete = None):
+    # Returns the text streamed by generate_text_from_prompt(), or None if stopped.
+    # on_complete(text) is only called if the whole reply was streamed without errors.
+    text = ""
+    try:
+        for item in model_output:
+            if LlmProcess.is_running == False:
+                return None
+            else:
+                response_content = ""
+                try:
+                    response_content = item['choices'][0]['delta']['content']
+                except KeyError:
+                    # Because (1) first and last key's of the ['delta'] dict is not 'content', and (2) 'content' key only appears on second for... interation, this exception is needed
+                    pass
+                except:
+                    traceback.print_exc()
+                text += response_content
+    except KeyboardInterrupt:
+        raise
+    except:
+        traceback.print_exc()
+        return text
+    if on_complete is not None:
+        on_complete(text)
+    return text
+
+def analyse_part(index, chunk, context_size, llm = None):
+    # Returns the analysis of one part of a file ([Line range, main text]), or None if stopped.
+    # Analyses are cached on disk, so a part with the same text, LLM and settings as before is not analysed again.
+    chunked_text = chunk[1]
+    if llm is None:
+        llm = LlmProcess.llm
+    messages = [
+        {"role": "system", "content": "You are a File Analysis AI.Don't reveal your role.You reply with less than "+str(context_size - count_tokens(chunked_text))+" tokens."},
+        {
+            "role": "user",
+            "content": "Explain the text within [txt] and highlight important details."
+                        +"Be direct and concise.[txt][PART"+str(index)+"]\n"+chunked_text+"[txt]"
+        }
+    ]
+    sampling = generation_settings(max_tokens = context_size - count_tokens(chunked_text), temperature = 0.2)   # Set a lower temperature for more standardised and less creative replies
+
+    if analysis_cache.get_cache() is None:
+        # Cache is off, so no key is needed (working it out fingerprints the model file)
+        return collect_stream(generate_text_from_prompt(messages, llm = llm, **sampling))
+    key = analysis_cache.cache_key(messages, llm, sampling)
+    cached_analysis = analysis_cache.get(key)
+    if cached_analysis is not None:
+        return cached_analysis
+
+    # Generate analysis of text file
+    # Use llama-cpp-python's auto-detected preset prompt templates
+    llm_text_analysis = generate_text_from_prompt(messages, llm = llm, **sampling)
+    return collect_stream(llm_text_analysis, on_complete = lambda part_analysis: analysis_cache.put(key, part_analysis))
+
+def analyse_parts_parallel(worker_llms, chunks, context_size):
+    # Returns the analysis of every part in line order, each with its "[PARTn]Ln x-y:" heading, or None if stopped
+    start_time = time.time()
+
+    def analyse_with_heading(llm, index, chunk):
+        part_analysis = analyse_part(index, chunk, context_size, llm = llm)
+        if part_analysis is None:
+            return None
+        return "[PART"+str(index)+"]"+chunk[0]+":\n"+part_analysis
+
+
+    def on_part_done(parts_done, parts_total):
+        if parts_total is None:
+            status = "Done "+str(parts_done)+" (still reading file). Time left: Calculating..."
+        else:
+            # Formula for time left: (Time taken so far/num of completed parts) * (num of total parts - num of completed parts)
+            time_left = datetime.timedelta(seconds = int((time.time() - start_time)/parts_done * (parts_total - parts_done)))
+            status = "Done "+str(parts_done)+"/"+str(parts_total)+". Time left: "+str(time_left)+" (H:mm:ss)"
+        with LlmProcess.lock:
+            LlmProcess.llm_status = "Processing Parts ("+str(len(worker_llms))+" at a time). "+status+analysis_cache.stats()
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+
+    with LlmProcess.lock:
+        LlmProcess.llm_status = "Processing Parts ("+str(len(worker_llms))+" at a time). Done 0. Time left: Calculating..."
+    ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+    results = map_parts(worker_llms, chunks, analyse_with_heading, on_part_done)
+    if results is None or None in results:
+        return None
+    return results
+
+def map_parts(worker_llms, items, analyse, on_done):
+    # parallel_analysis.map_parts(), or None if a worker failed (e.g. its context ran out of memory).
+    # The analysis is then stopped with an error, as the parts that were already analysed can't be summarised without the failed ones.
+    try:
+        return parallel_analysis.map_parts(worker_llms, items, analyse, on_done)
+    except:
+        traceback.print_exc()
+        ui_bridge.post_chat("\n---An analysis worker failed, so the file analysis was stopped. Try again with fewer File Analysis Workers, "
+                            +"or see the console for details.---", "tag_info")
+        with LlmProcess.lock:
+            LlmProcess.is_running = False
+            LlmProcess.llm_status = "Idle"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        return None
+
+def summarise_analyses(text, context_size, llm = None):
+    # Returns a summary of text (one or more analyses), or None if stopped.
+    # Replies are kept within a quarter of context_size, so that at least two summaries fit into the next round of summarising.
+    max_tokens = min(context_size - count_tokens(text), context_size//4)
+
+    # Generate summary of analysis parts
+    # Use llama-cpp-python's auto-detected preset prompt templates
+    llm_text_analysis_summ = generate_text_from_prompt([
+        {"role": "system", "content": "You are a File Analysis AI.Don't reveal your role.You reply with less than "+str(max_tokens)+" tokens."},
+        {
+            "role": "user",
+            "content": "Summarise the analysis within [txt].Be direct and concise.[txt]"+text+"[txt]"
+        }
+    ], max_tokens = max_tokens, temperature = 0.2, llm = llm)   # Set a lower temperature for more standardised and less creative replies
+    return collect_stream(llm_text_analysis_summ)
+
+def batch_analyses(texts, token_limit):
+    # Groups texts, in order, into batches of up to token_limit tokens. Texts longer than token_limit are split first.
+    split_texts = []
+    pending = list(reversed(texts))
+    while pending:
+        text = pending.pop()
+        if count_tokens(text) > token_limit:
+            halves = text_halver(text)
+            pending.extend(reversed(halves))
+        else:
+            split_texts.append(text)
+
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for text in split_texts:
+        tokens = count_tokens(text)
+        if batch and batch_tokens + tokens > token_limit:
+            batches.append("\n\n".join(batch))
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append("\n\n".join(batch))
+    return batches
+
+def reduce_analyses(texts, context_size, worker_llms):
+    # Summarises texts in rounds until a single summary remains, and returns it (or None if stopped).
+    # Each round groups the previous round's summaries into batches that fit the context and summarises each batch.
+    # Summaries are at most a quarter of context_size, so every round at least halves the number of texts.
+    token_limit = int(context_size*0.6)   # Leaves room for the prompt and the summary within context_size
+    level = 1
+    while True:
+        batches = batch_analyses(texts, token_limit)
+        start_time = time.time()
+
+        def on_batch_done(batches_done, batches_total = None):
+            time_left = datetime.timedelta(seconds = int((time.time() - start_time)/batches_done * (len(batches) - batches_done)))
+            with LlmProcess.lock:
+                LlmProcess.llm_status = ("Summarising (round "+str(level)+"). Done "+str(batches_done)+"/"+str(len(batches))
+                                         +". Time left for this round: "+str(time_left)+" (H:mm:ss)")
+            ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+
+        with LlmProcess.lock:
+            LlmProcess.llm_status = "Summarising (round "+str(level)+"). Done 0/"+str(len(batches))+"."
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        if worker_llms and len(batches) > 1:
+            # Batches of the same round do not depend on each other, so they are summarised in parallel
+            summaries = map_parts(worker_llms, batches,
+                                  lambda llm, index, batch: summarise_analyses(batch, context_size, llm = llm), on_batch_done)
+            if summaries is None:
+                return None
+        else:
+            summaries = []
+            for batch in batches:
+                summary = summarise_analyses(batch, context_size)
+                if summary is None:
+                    return None
+                summaries.append(summary)
+                on_batch_done(len(summaries))
+        if None in summaries:
+            return None
+        if len(summaries) == 1:
+            return summaries[0]
+        texts = summaries
+        level += 1
 
 def analyse_text_file():
     context_size = int(ConfigHandler.cp["AI"]["context_size"])
 
-    gui.chat_box.insert(END, "\n---Choose a '.csv', '.log' or '.txt' file for analysis.", "tag_info")
+    ui_bridge.post_chat("\n---Choose a '.csv', '.log' or '.txt' file for analysis.", "tag_info")
 
 
-    # File size limit is based on testing. If the file size exceeds the soft limit, a single final analysis summary might not be produced.
+    # File size limit is based on testing. Larger files still get a single final analysis summary, but it is summarised over several rounds.
     # With 1024 context size, max file size is ~10kb.
+    # Run 'python main.py --benchmark --scenarios file_analysis' to measure analysis time on another computer or LLM.
     file_size_max = math.floor(10 * (context_size/1024))
 
-    gui.chat_box.insert(END, f"\nFor {context_size} token context size, ideal file size is <={file_size_max}kb. Larger fles can be used, but may not produce a single final analysis summary.---\n", "tag_info")
-    gui.chat_box.see("end")
+    ui_bridge.post_chat(f"\nFor {context_size} token context size, ideal file size is <={file_size_max}kb. Larger fles can be used, but will take longer as their analysis is summarised over several rounds.---\n", "tag_info")
        
+    import gui  # Already imported, as gui.py imports this module
+    from tkinter import filedialog as fd
     sel_file_name =  fd.askopenfilename(title = "Select a file", filetypes = (('Supported formats', '.csv .log .txt'),), parent=gui.root)
     if not sel_file_name:
         with LlmProcess.lock:
             LlmProcess.is_running = False
             LlmProcess.llm_status = "Idle"
-        gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
         return
+    analyse_file(sel_file_name)
 
-    chunk_analysis = ""
-    chunk_analysis_summ = ""
-    chunk_list = file_text_chunker(sel_file_name)   # Multi-dimensional list format: [[Line range, main text], ...]
+def analyse_file(sel_file_name):
+    # Analyses a text file in parts, then summarises the analysis of its parts. Used by analyse_text_file(), the '/f <path>' command and headless mode.
+    context_size = int(ConfigHandler.cp["AI"]["context_size"])
+    if not os.path.isfile(sel_file_name):
+        ui_bridge.post_chat("\n---File not found: "+sel_file_name+"---", "tag_info")
+        with LlmProcess.lock:
+            LlmProcess.is_running = False
+            LlmProcess.llm_status = "Idle"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        return
+
+    with LlmProcess.lock:
+        LlmProcess.llm_status = "Reading file"
+    ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+    analysis_cache.reset_stats()
+
+    # CSV files are profiled column by column, and the profile is analysed instead of every row
+    if sel_file_name.lower().endswith(".csv") and ConfigHandler.cp["AI"]["csv_profile"] == "on":
+        profile_chunks = csv_profile_chunks(sel_file_name, context_size)
+        if profile_chunks is not None:
+            ChatSession.msglist.append("user", "Analyse this file: "+sel_file_name)
+            chunks, worker_llms = prepare_workers(profile_chunks)
+            try:
+                analyse_file_chunks(chunks, lambda: len(profile_chunks), context_size, worker_llms)
+            finally:
+                parallel_analysis.close_worker_llms(worker_llms)
+            return
+
+    chunk_reader = FileChunkReader(sel_file_name)   # Yields [Line range, main text] chunks while the rest of the file is still being read
+    ChatSession.msglist.append("user", "Analyse this file: "+sel_file_name)
+    try:
+        chunks, worker_llms = prepare_workers(chunk_reader)
+    except:
+        chunk_reader.close()
+        raise
+    try:
+        analyse_file_chunks(chunks, lambda: chunk_reader.total, context_size, worker_llms)
+    finally:
+        chunk_reader.close()
+        parallel_analysis.close_worker_llms(worker_llms)
+
+def csv_profile_chunks(path, context_size):
+    # Returns the profile of a CSV file as [Label, main text] chunks, each within the file token limit (usually only one),
+    # or None if it could not be profiled (the file is then chunked row by row instead)
+    file_token_limit = int(context_size * 0.65) # Same limit as file_text_chunker()
+    try:
+        profile_texts = csv_profiler.profile_texts(path)
+    except:
+        traceback.print_exc()
+        ui_bridge.post_chat("\n---Unable to profile this CSV file. Its rows will be analysed as text instead.---", "tag_info")
+        return None
+    batches = batch_analyses(profile_texts, file_token_limit)
+    ui_bridge.post_chat("\n---CSV profiling: every row was summarised into column types, statistics, most common values and outliers, "
+                        +"which are analysed with a sample of rows in "+str(len(batches))+" part(s).---", "tag_info")
+    if len(batches) == 1:
+        return [["CSV profile", batches[0]]]
+    return [["CSV profile "+str(index)+"/"+str(len(batches)), batch] for index, batch in enumerate(batches, start = 1)]
+
+def prepare_workers(chunk_source):
+    # Returns (chunks, worker LLMs) for analysing the chunks of chunk_source (a FileChunkReader or list of chunks).
+    # Parts are analysed in parallel with worker contexts of the LLM, if set in Config. Falls back to one part at a time if they cannot be created.
+    # The first parts are read before deciding, so that no more workers are created than the file has parts.
+    chunks = iter(chunk_source)
+    worker_llms = []
+    first_chunks = []
+    for chunk in chunks:
+        first_chunks.append(chunk)
+        if len(first_chunks) >= parallel_analysis.worker_count():
+            break
+    chunks = itertools.chain(first_chunks, chunks)
+    workers = len(first_chunks)
+    if workers > 1:
+        with LlmProcess.lock:
+            LlmProcess.llm_status = "Preparing "+str(workers)+" analysis workers"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        try:
+            worker_llms = parallel_analysis.create_worker_llms(LlmProcess.llm, workers)
+        except:
+            traceback.print_exc()
+            ui_bridge.post_chat("\n---Unable to create parallel analysis workers. File parts will be analysed one at a time instead.---", "tag_info")
+    return chunks, worker_llms
+
+def analyse_chunks(chunks, count_parts, context_size, worker_llms):
+    # Returns "[PARTn]Ln x-y:\n<analysis>" of each part, in line order, or None if stopped.
+    # count_parts() returns the number of parts, or None while the rest of the file is still being read.
+    part_analyses = []
     part_counter = 0
     total_duration = 0
-    gui.root.msglist.append({"role": "user", "content": "Analyse this file: "+sel_file_name})
-    for index, chunk in enumerate(chunk_list, start = 1):
-        part_timer = time.time()    # Set start time of part analysis
-        part_num = "[PART"+str(index)+"]"
-        line_range = chunk[0]
-        chunked_text = chunk[1]            
-        chunk_analysis += "\n\n"+part_num+line_range+":\n"
-
-        # Generate analysis of text file
-        # Use llama-cpp-python's auto-detected preset prompt templates
-        llm_text_analysis = generate_text_from_prompt([
-            {"role": "system", "content": "You are a File Analysis AI.Don't reveal your role.You reply with less than "+str(context_size - count_tokens(chunked_text))+" tokens."},
-            {
-                "role": "user",
-                "content": "Explain the text within [txt] and highlight important details."
-                            +"Be direct and concise.[txt][PART"+str(index)+"]\n"+chunked_text+"[txt]"
-            }
-        ], max_tokens = context_size - count_tokens(chunked_text), temperature = 0.2)   # Set a lower temperature for more standardised and less creative replies
+    if worker_llms:
+        part_analyses = analyse_parts_parallel(worker_llms, chunks, context_size)
+        if part_analyses is None or LlmProcess.is_running == False:
+            return None
+    else:
+        for index, chunk in enumerate(chunks, start = 1):
+            part_timer = time.time()    # Set start time of part analysis
+            part_num = "[PART"+str(index)+"]"
+            line_range = chunk[0]
         
-        if part_counter != 0:        
-            # Formula for time left: (Sum of time taken for completed parts/num of completed parts) * (num of total parts - num of completed parts)
-            time_left = datetime.timedelta(seconds = int(total_duration/part_counter) * (len(chunk_list) - part_counter))
-            with LlmProcess.lock:
-                LlmProcess.llm_status = "Processing Part "+str(index)+"/"+str(len(chunk_list))+"("+line_range+"). Time left: "+str(time_left)+" (H:mm:ss)"
-        else:
-            with LlmProcess.lock:
-                LlmProcess.llm_status = "Processing Part "+str(index)+"/"+str(len(chunk_list))+"("+line_range+"). Time left: Calculating..."
-        gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+            total_parts = count_parts() # None while the rest of the file is still being read
+            if part_counter != 0 and total_parts is not None:
+                # Formula for time left: (Sum of time taken for completed parts/num of completed parts) * (num of total parts - num of completed parts)
+                time_left = datetime.timedelta(seconds = int(total_duration/part_counter) * (total_parts - part_counter))
+                with LlmProcess.lock:
+                    LlmProcess.llm_status = "Processing Part "+str(index)+"/"+str(total_parts)+"("+line_range+"). Time left: "+str(time_left)+" (H:mm:ss)"+analysis_cache.stats()
+            else:
+                with LlmProcess.lock:
+                    LlmProcess.llm_status = "Processing Part "+str(index)+"/"+str(total_parts or "?")+"("+line_range+"). Time left: Calculating..."+analysis_cache.stats()
+            ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
         
-        try:
-            for item in llm_text_analysis:
-                if LlmProcess.is_running == False:
-                    return
-                else:
-                    response_content = ""
-                    try:
-                        response_content = item['choices'][0]['delta']['content']
-                    except KeyError:
-                        # Because (1) first and last key's of the ['delta'] dict is not 'content', and (2) 'content' key only appears on second for... interation, this exception is needed
-                        pass
-                    except:
-                        traceback.print_exc()
-                    chunk_analysis += response_content
-        except KeyboardInterrupt:
-            # This is needed to catch KeyboardInterrupt in Windows CMD
-            print("\n\nYou interrupted the response.")
-            break
-        except:
-            traceback.print_exc()
+            try:
+                part_analysis = analyse_part(index, chunk, context_size)
+            except KeyboardInterrupt:
+                # This is needed to catch KeyboardInterrupt in Windows CMD
+                print("\n\nYou interrupted the response.")
+                break
+            if part_analysis is None:
+                return None
+            part_analyses.append(part_num+line_range+":\n"+part_analysis)
 
-        part_counter += 1   # Increase count by 1 when analysis of current part is complete
-        part_timer = time.time() - part_timer # Get time difference between start and end time of part analysis
-        total_duration += part_timer
+            part_counter += 1   # Increase count by 1 when analysis of current part is complete
+            part_timer = time.time() - part_timer # Get time difference between start and end time of part analysis
+            total_duration += part_timer
+    return part_analyses
+
+def analyse_file_chunks(chunks, count_parts, context_size, worker_llms):
+    chunk_analysis_summ = ""
+    part_analyses = analyse_chunks(chunks, count_parts, context_size, worker_llms)
+    if part_analyses is None:
+        return
         
-    gui.chat_box.insert(END, "\nAsst -> ", "tag_asst")
-    chunk_analysis = chunk_analysis.strip()
+    ui_bridge.post_chat("\nAsst -> ", "tag_asst")
+    chunk_analysis = "\n\n".join(part_analyses).strip()
     with LlmProcess.lock:
         LlmProcess.llm_status = "Replying (press [Esc] to stop)"
-    gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
-    gui.chat_box.insert(END, "\n==Analysis of Parts==\n" + chunk_analysis, "tag_asst")
-    gui.chat_box.see("end")
-
-    # Summarise all the chunks together if more than 1 chunk
-    if len(chunk_list) > 1:
-        if count_tokens(chunk_analysis) < context_size:            
-            # Generate summary of analysis parts
-            # Use llama-cpp-python's auto-detected preset prompt templates
-            llm_text_analysis_summ = generate_text_from_prompt([
-                {"role": "system", "content": "You are a File Analysis AI.Don't reveal your role.You reply with less than "+str(context_size - count_tokens(chunk_analysis))+" tokens."},
-                {
-                    "role": "user",
-                    "content": "Summarise the analysis within [txt].Be direct and concise.[txt]"+chunk_analysis+"[txt]"
-                }
-            ], max_tokens = context_size - count_tokens(chunk_analysis), temperature = 0.2)   # Set a lower temperature for more standardised and less creative replies
+    ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+    ui_bridge.post_chat("\n==Analysis of Parts==\n" + chunk_analysis, "tag_asst")
 
-            with LlmProcess.lock:
-                LlmProcess.llm_status = "Thinking"
-            gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
-            try:
-                for item in llm_text_analysis_summ:
-                    if LlmProcess.is_running == False:
-                        return
-                    else:
-                        response_content = ""
-                        try:
-                            response_content = item['choices'][0]['delta']['content']
-                        except KeyError:
-                            # Because (1) first and last key's of the ['delta'] dict is not 'content', and (2) 'content' key only appears on second for... interation, catchthis exception is needed
-                            pass
-                        except:
-                            traceback.print_exc()
-                        chunk_analysis_summ += response_content
-            except ValueError:
-                gui.chat_box.insert(END, "\n---Analysis Summary not available (the merged Analysis of Parts was too long). Refer to the individual Analysis of Parts above instead.---", "tag_info")
-                gui.chat_box.see("end")
-            except:
-                traceback.print_exc()
+    # Summarise all the chunks together if more than 1 chunk. If they do not fit into the context together, they are summarised over several rounds.
+    if len(part_analyses) > 1:
+        chunk_analysis_summ = reduce_analyses(part_analyses, context_size, worker_llms)
+        if chunk_analysis_summ is None:
+            return
 
-            with LlmProcess.lock:
-                LlmProcess.llm_status = "Replying (press [Esc] to stop)"
-            gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
-            gui.chat_box.insert(END, "\n\n==Analysis Summary==\n"+chunk_analysis_summ, "tag_asst")
-            gui.chat_box.see("end")
-        else:
-            chunk_analysis_summ = "I analysed the file but can't give an Analysis Summary as the text in file was too long."
-            gui.chat_box.insert(END, "\n---Analysis Summary not available (ran out of context memory when trying to summarise Analysis of Parts). Refer to the individual Analysis of Parts above instead.---", "tag_info")
-            gui.chat_box.see("end")
+        with LlmProcess.lock:
+            LlmProcess.llm_status = "Replying (press [Esc] to stop)"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        ui_bridge.post_chat("\n\n==Analysis Summary==\n"+chunk_analysis_summ, "tag_asst")
     else:
         with LlmProcess.lock:
             LlmProcess.llm_status = "Replying (press [Esc] to stop)"
-        gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
-        gui.chat_box.insert(END, "\n\n==Analysis Summary==\n"+chunk_analysis, "tag_asst")
-        gui.chat_box.see("end")
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        ui_bridge.post_chat("\n\n==Analysis Summary==\n"+chunk_analysis, "tag_asst")
         chunk_analysis_summ = chunk_analysis
     if ConfigHandler.cp["AI"]["history_option"] == "on":
-        gui.root.msglist.append({"role": "assistant", "content": chunk_analysis_summ})
+        ChatSession.msglist.append("assistant", chunk_analysis_summ)
     else:
-        gui.root.msglist = []
+        ChatSession.msglist.clear()
     
     with LlmProcess.lock:
         LlmProcess.llm_status = "Idle"
-    gui.lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+    ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
     with LlmProcess.lock:
         LlmProcess.is_running = False
-  
\ No newline at end of file
+
+def follow_log_file():
+    # Follows a growing log file: analyses the lines appended since it was last read, then checks for new lines every
+    # follow_interval_s seconds until stopped. Each update's part analyses are folded into a rolling summary.
+    # Where the file was read up to is kept in cache/follow_state.json, so following the same file again later continues from there.
+    context_size = int(ConfigHandler.cp["AI"]["context_size"])
+    import gui  # Already imported, as gui.py imports this module
+    from tkinter import filedialog as fd
+    sel_file_name =  fd.askopenfilename(title = "Select a file to follow", filetypes = (('Supported formats', '.log .txt .csv'),), parent=gui.root)
+    if not sel_file_name:
+        with LlmProcess.lock:
+            LlmProcess.is_running = False
+            LlmProcess.llm_status = "Idle"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        return
+
+    file_name = os.path.basename(sel_file_name)
+    state = log_follower.get_state(sel_file_name)
+    rolling_summary = state["summary"] if state is not None else ""
+    if state is not None:
+        ui_bridge.post_chat("\n---Following "+file_name+" from line "+str(state["line"] + 1)+", where it was last read. Press [Esc] to stop.---\n", "tag_info")
+    else:
+        ui_bridge.post_chat("\n---Following "+file_name+". New lines are analysed every "+str(log_follower.poll_interval())+"s. Press [Esc] to stop.---\n", "tag_info")
+    ChatSession.msglist.append("user", "Follow this file and summarise its new lines: "+sel_file_name)
+    summary_in_history = False  # True once this follow's rolling summary has been added to the chat history
+
+    while LlmProcess.is_running != False:
+        try:
+            segments = log_follower.pending_segments(sel_file_name)
+        except OSError:
+            segments = []   # File is missing, e.g. between being rotated and recreated. Checked again on the next poll.
+        for follow_segment in segments:
+            if follow_segment["note"]:
+                ui_bridge.post_chat("\n---"+follow_segment["note"]+"---", "tag_info")
+            with LlmProcess.lock:
+                LlmProcess.llm_status = "Reading file"
+            ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+            analysis_cache.reset_stats()
+            chunk_reader = FileChunkReader(follow_segment["path"], start = follow_segment["start"], end = follow_segment["end"],
+                                           first_line = follow_segment["first_line"])
+            worker_llms = []
+            try:
+                chunks, worker_llms = prepare_workers(chunk_reader)
+                part_analyses = analyse_chunks(chunks, lambda: chunk_reader.total, context_size, worker_llms)
+                if part_analyses is None or LlmProcess.is_running == False:
+                    return
+
+                # Fold the new parts into the rolling summary
+                new_lines = "Ln "+str(follow_segment["first_line"])+"-"+str(chunk_reader.last_line)
+                ui_bridge.post_chat("\nAsst -> ", "tag_asst")
+                ui_bridge.post_chat("\n==New Lines of "+os.path.basename(follow_segment["path"])+" ("+new_lines+")==\n"+"\n\n".join(part_analyses).strip(), "tag_asst")
+                if rolling_summary or len(part_analyses) > 1:
+                    earlier = ["[Summary of earlier lines]:\n"+rolling_summary] if rolling_summary else []
+                    rolling_summary = reduce_analyses(earlier + part_analyses, context_size, worker_llms)
+                    if rolling_summary is None:
+                        return
+                else:
+                    rolling_summary = "\n\n".join(part_analyses).strip()
+            finally:
+                chunk_reader.close()
+                parallel_analysis.close_worker_llms(worker_llms)
+            ui_bridge.post_chat("\n\n==Rolling Summary==\n"+rolling_summary, "tag_asst")
+            log_follower.advance(sel_file_name, follow_segment, chunk_reader.last_line, rolling_summary)
+
+            if ConfigHandler.cp["AI"]["history_option"] == "on":
+                if summary_in_history:
+                    ChatSession.msglist.update_last(rolling_summary)
+                else:
+                    ChatSession.msglist.append("assistant", rolling_summary)
+                    summary_in_history = True
+            else:
+                ChatSession.msglist.clear()
+
+        # Wait for new lines, checking often enough to stop promptly when [Esc] is pressed
+        with LlmProcess.lock:
+            if LlmProcess.is_running == False:
+                return
+            LlmProcess.llm_status = "Following "+file_name+" (press [Esc] to stop)"
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+        wait_until = time.time() + log_follower.poll_interval()
+        while LlmProcess.is_running != False and time.time() < wait_until:
+            time.sleep(0.2)
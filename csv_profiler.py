@@ -0,0 +1,212 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import csv, io, itertools, warnings
+
+# From custom modules
+import file_reader
+
+NULL_VALUES = ["", "na", "n/a", "nan", "null", "none", "-"]  # Compared in lower case, after stripping spaces
+BOOL_VALUES = {"true": True, "false": False, "yes": True, "no": False, "y": True, "n": False, "t": True, "f": False}
+TOP_K = 5   # Most common values shown for text columns
+Z_LIMIT = 3.0   # Numbers further than this many standard deviations from the mean are reported as outliers
+SAMPLE_ROWS = 5 # Rows from the start of the file, plus as many rows picked at random from the rest
+MAX_FIELD_CHARS = 60    # Longer values are cut short in the profile and sample rows
+BLOCK_ROWS = 50000  # Lines parsed at a time
+NUMBER_CHARS = "0123456789+-.eE"    # A value made only of these may be a number
+
+def read_columns(path, np):
+    # Reads a CSV file in one pass, BLOCK_ROWS lines at a time. Returns (header, columns (one NumPy string array per column), delimiter,
+    # rows with a different number of fields). Each block is split into fields by NumPy's C parser (np.loadtxt), and only kept as
+    # one array per column, so no Python object is created for every value.
+    with file_reader.FileReader(path) as reader:
+        lines = (line for _, line in reader.lines())
+        first_lines = []
+        for line in lines:
+            first_lines.append(line)
+            if len(first_lines) >= 50:
+                break
+        try:
+            dialect = csv.Sniffer().sniff("".join(first_lines), delimiters = ",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        header_rows = csv.reader(first_lines, dialect)
+        header = next(header_rows, [])
+        data_lines = itertools.chain(first_lines[header_rows.line_num:], lines)
+        blocks = [[] for _ in header]   # Arrays of each block of rows, for each column
+        bad_rows = 0
+        while header:
+            block = list(itertools.islice(data_lines, BLOCK_ROWS))
+            if not block:
+                break
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")     # Warns about empty lines, which are skipped the same way as by the csv module
+                    values = np.loadtxt(block, dtype = str, delimiter = dialect.delimiter, quotechar = dialect.quotechar, comments = None, ndmin = 2)
+            except ValueError:
+                # Rows in this block have a different number of fields. The csv module parses the rest of the file instead, as it can
+                # tell which rows they are. It carries on from the start of this block, which always starts with a new row.
+                bad_rows += add_csv_rows(csv.reader(itertools.chain(block, data_lines), dialect), header, blocks, np)
+                break
+            if values.size == 0:
+                continue
+            if values.shape[1] != len(header):
+                bad_rows += values.shape[0]
+                values = fit_fields(values, len(header), np)
+            add_block(blocks, values, np)
+    columns = []
+    for index in range(len(blocks)):
+        columns.append(np.concatenate(blocks[index]) if blocks[index] else np.array([], dtype = str))
+        blocks[index] = None    # Frees the blocks of each column as soon as it is joined into one array
+    return header, columns, dialect.delimiter, bad_rows
+
+def fit_fields(values, field_count, np):
+    # Pads rows with empty values, or cuts them short, to field_count fields
+    if values.shape[1] > field_count:
+        return values[:, :field_count]
+    return np.concatenate([values, np.full((values.shape[0], field_count - values.shape[1]), "", dtype = values.dtype)], axis = 1)
+
+def add_block(blocks, values, np):
+    # Adds a 2D array of rows to the arrays of each column, each only as wide as its own longest value in the block
+    for index, column_blocks in enumerate(blocks):
+        column = values[:, index]
+        width = max(1, int(np.char.str_len(column).max()))
+        column_blocks.append(column.astype("U"+str(width)))
+
+def add_csv_rows(rows, header, blocks, np):
+    # Adds rows parsed by the csv module, BLOCK_ROWS at a time. Returns the number of rows with a different number of fields.
+    bad_rows = 0
+    while True:
+        block = []
+        for row in itertools.islice(rows, BLOCK_ROWS):
+            if not row:
+                continue
+            if len(row) != len(header):
+                bad_rows += 1
+                row = (row + [""]*len(header))[:len(header)]
+            block.append(row)
+        if not block:
+            return bad_rows
+        add_block(blocks, np.array(block, dtype = str), np)
+
+def short(value):
+    value = str(value)
+    return value if len(value) <= MAX_FIELD_CHARS else value[:MAX_FIELD_CHARS]+"..."
+
+def number(value):
+    return format(float(value), ".4g")
+
+def to_numbers(present, np):
+    # Returns (float array, mask of values that are numbers), or None if less than 95% of values are numbers
+    try:
+        return present.astype(np.float64), np.ones(present.size, dtype = bool)
+    except ValueError:
+        pass
+    numbers = np.full(present.size, np.nan)
+    candidates = np.flatnonzero(np.char.str_len(np.char.strip(present, NUMBER_CHARS)) == 0)  # Other values can't be numbers
+    try:
+        numbers[candidates] = present[candidates].astype(np.float64)
+    except ValueError:
+        for index in candidates:    # Only when some of them are not numbers after all, e.g. "1-2"
+            try:
+                numbers[index] = float(present[index])
+            except ValueError:
+                pass
+    is_number = ~np.isnan(numbers)
+    if is_number.sum() < present.size*0.95:
+        return None
+    return numbers, is_number
+
+def to_datetimes(present, np):
+    # Returns a datetime64 array, or None if the values are not all ISO-8601 dates/times
+    if not all(("-" in value or ":" in value) for value in present[:20]):
+        return None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return present.astype("datetime64[s]")
+    except ValueError:
+        return None
+
+def describe_column(name, array, np):
+    # Returns one line describing a column (a NumPy string array): its type, empty values and statistics for that type
+    stripped = np.char.strip(array)
+    nulls = np.isin(np.char.lower(stripped), NULL_VALUES)
+    present = stripped[~nulls]
+    null_count = int(nulls.sum())
+    row_numbers = np.flatnonzero(~nulls) + 1   # Data row number (after the header) of each present value
+    text = "Column '"+short(name)+"'"
+    empty_text = str(null_count)+" empty"
+    if present.size == 0:
+        return text+" (empty): all "+str(array.size)+" values are empty."
+
+    parsed = to_numbers(present, np)
+    if parsed is not None:
+        numbers, is_number = parsed
+        values = numbers[is_number]
+        integers = bool(np.all(values == np.floor(values)))
+        quartiles = np.percentile(values, [25, 50, 75])
+        text += (" ("+("integer" if integers else "decimal")+"): "+empty_text+", "+str(int(np.unique(values).size))+" unique. "
+                 +"Min "+number(values.min())+", max "+number(values.max())+", mean "+number(values.mean())+", std "+number(values.std())
+                 +", quartiles "+" / ".join(number(quartile) for quartile in quartiles)+".")
+        if not is_number.all():
+            not_numbers = present[~is_number]
+            text += " "+str(not_numbers.size)+" values are not numbers, e.g. row "+str(row_numbers[~is_number][0])+": '"+short(not_numbers[0])+"'."
+        std = values.std()
+        if std > 0:
+            z_scores = (values - values.mean()) / std
+            outliers = np.flatnonzero(np.abs(z_scores) > Z_LIMIT)
+            if outliers.size:
+                worst = outliers[np.argsort(-np.abs(z_scores[outliers]))][:3]
+                value_rows = row_numbers[is_number]
+                text += (" "+str(outliers.size)+" outliers (|z| > "+number(Z_LIMIT)+"), e.g. "
+                         +", ".join("row "+str(value_rows[index])+": "+number(values[index])+" (z "+format(z_scores[index], ".1f")+")" for index in worst)+".")
+        return text
+
+    datetimes = to_datetimes(present, np)
+    if datetimes is not None:
+        return text+" (date/time): "+empty_text+". From "+str(datetimes.min())+" to "+str(datetimes.max())+"."
+
+    lowered = np.char.lower(present)
+    if np.isin(lowered, list(BOOL_VALUES)).all():
+        true_count = sum(count for value, count in zip(*np.unique(lowered, return_counts = True)) if BOOL_VALUES[str(value)])
+        return text+" (yes/no): "+empty_text+". "+str(round(100*true_count/present.size, 1))+"% true."
+
+    unique_values, counts = np.unique(present, return_counts = True)
+    text += " (text): "+empty_text+", "+str(unique_values.size)+" unique."
+    if unique_values.size == present.size:
+        lengths = np.char.str_len(present)
+        return text+" Every value is different (length "+str(int(lengths.min()))+"-"+str(int(lengths.max()))+"), e.g. '"+short(present[0])+"'."
+    order = np.argsort(-counts, kind = "stable")[:TOP_K]
+    text += " Most common: "+", ".join("'"+short(unique_values[index])+"' "+str(round(100*counts[index]/present.size, 1))+"%" for index in order)+"."
+    rare = int((counts == 1).sum())
+    if rare and unique_values.size > TOP_K:
+        text += " "+str(rare)+" values appear only once."
+    return text
+
+def sample_rows(header, columns, np):
+    # Returns the header and a few rows as CSV text: the first rows, plus rows picked at random (always the same ones for the same file)
+    row_count = len(columns[0]) if columns else 0
+    picked = list(range(min(SAMPLE_ROWS, row_count)))
+    if row_count > SAMPLE_ROWS:
+        random_rows = np.random.default_rng(0).choice(np.arange(SAMPLE_ROWS, row_count), size = min(SAMPLE_ROWS, row_count - SAMPLE_ROWS), replace = False)
+        picked += sorted(int(index) for index in random_rows)
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator = "\n")
+    writer.writerow(["row"] + [short(name) for name in header])
+    for index in picked:
+        writer.writerow([index + 1] + [short(column[index]) for column in columns])
+    return output.getvalue()
+
+def profile_texts(path):
+    # Returns a profile of a CSV file as a list of texts: an overview with sample rows, then one line per column.
+    # The whole file is summarised (types, empty values, statistics, most common values and outliers of each column),
+    # so it can be analysed in one or two parts instead of passing every row to the LLM.
+    import numpy as np  # Imported here so that numpy is only loaded when a CSV file is analysed
+    header, columns, delimiter, bad_rows = read_columns(path, np)
+    row_count = len(columns[0]) if columns else 0
+    overview = ("Profile of a CSV file with "+str(row_count)+" rows and "+str(len(header))+" columns (delimiter '"+delimiter.replace("\t", "\\t")+"')."
+                +(" "+str(bad_rows)+" rows had a different number of fields." if bad_rows else "")
+                +"\nSample rows:\n"+sample_rows(header, columns, np))
+    return [overview] + [describe_column(name, column, np) for name, column in zip(header, columns)]
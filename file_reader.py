@@ -0,0 +1,115 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import mmap, codecs, locale
+from array import array
+
+def detect_encoding(sample):
+    # Returns (encoding, BOM size in bytes) of a file from a sample of its first bytes
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8", len(codecs.BOM_UTF8)
+    if sample.startswith(codecs.BOM_UTF16_LE):
+        return "utf-16-le", len(codecs.BOM_UTF16_LE)
+    if sample.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16-be", len(codecs.BOM_UTF16_BE)
+
+    # UTF-16 without a BOM: mostly-ASCII text (e.g. logs) has a NUL byte in every other position
+    half = len(sample)//2
+    if half > 0:
+        even_nuls = sample[0::2].count(0)
+        odd_nuls = sample[1::2].count(0)
+        if odd_nuls > half*0.3 and even_nuls < half*0.05:
+            return "utf-16-le", 0
+        if even_nuls > half*0.3 and odd_nuls < half*0.05:
+            return "utf-16-be", 0
+
+    try:
+        sample.decode("utf-8")
+        return "utf-8", 0
+    except UnicodeDecodeError as e:
+        if e.start >= len(sample) - 3:
+            return "utf-8", 0   # Only a multi-byte character cut off at the end of the sample
+    return locale.getpreferredencoding(False), 0    # Same encoding that open() used before
+
+class FileReader:
+    # Reads a text file through a memory map, so multi-GB files are paged in by the OS as they are read instead of being
+    # held in memory. While lines() reads the file, the byte offset of every line is kept in an array, so lines can be read
+    # again later (e.g. a part of the file given as "Ln a-b") without scanning the file from the start.
+    def __init__(self, path, sample_size = 1 << 16):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            self.data = b""     # Empty files cannot be memory-mapped
+        self.encoding, self.bom_size = detect_encoding(self.data[:sample_size])
+        self.newline = "\n".encode(self.encoding)
+        self.unit = len(self.newline)  # 2 for UTF-16, where a newline only counts if it starts on a whole character
+        self.offsets = array("Q", [self.bom_size])  # Byte offset of the start of each line, then the end of the last line read
+        self.first_line = 1 # Line number of the first line in self.offsets
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def find_newline(self, start):
+        position = self.data.find(self.newline, start)
+        while position != -1 and (position - self.bom_size) % self.unit != 0:
+            position = self.data.find(self.newline, position + 1)
+        return position
+
+    def decode(self, start, end):
+        # Line ends are converted to "\n" like open() does in text mode
+        return self.data[start:end].decode(self.encoding, errors = "replace").replace("\r\n", "\n")
+
+    def last_line_end(self, start = None):
+        # Byte offset just after the last complete (newline-terminated) line at or after start, or start if there is none.
+        # Used to leave out a line that is still being written to a growing file.
+        start = self.bom_size if start is None else start
+        position = self.data.rfind(self.newline, start)
+        while position != -1 and (position - self.bom_size) % self.unit != 0:
+            position = self.data.rfind(self.newline, start, position + len(self.newline) - 1)
+        return start if position == -1 else position + self.unit
+
+    def lines(self, start = None, end = None, first_line = 1):
+        # Yields (line number, text) from the first line, building the line-offset index on the way.
+        # start/end (byte offsets) read only part of the file, e.g. the lines appended since it was last read. start must be
+        # the start of a line, which is numbered first_line.
+        position = self.bom_size if start is None else max(start, self.bom_size)
+        self.offsets = array("Q", [position])
+        self.first_line = first_line
+        size = len(self.data) if end is None else min(end, len(self.data))
+        line_number = first_line - 1
+        while position < size:
+            line_end = self.find_newline(position)
+            line_end = size if line_end == -1 or line_end + self.unit > size else line_end + self.unit
+            self.offsets.append(line_end)
+            line_number += 1
+            yield line_number, self.decode(position, line_end)
+            position = line_end
+
+    def line_count(self):
+        # Number of lines indexed so far (all lines once lines() has finished)
+        return len(self.offsets) - 1
+
+    def last_line(self):
+        # Line number of the last line indexed so far
+        return self.first_line + self.line_count() - 1
+
+    def byte_range(self, first, last):
+        # Byte offsets (start, end) of lines first to last (1-based, inclusive). The lines must have been read by lines() already.
+        if first < self.first_line or last > self.last_line() or first > last + 1:
+            raise IndexError("Lines "+str(first)+"-"+str(last)+" are not in the index (lines "+str(self.first_line)+"-"+str(self.last_line())+" read)")
+        return self.offsets[first - self.first_line], self.offsets[last - self.first_line + 1]
+
+    def read_lines(self, first, last):
+        # Text of lines first to last (1-based, inclusive), read straight from the index. Returns "" if last < first.
+        start, end = self.byte_range(first, last)
+        return self.decode(start, end)
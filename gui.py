@@ -9,14 +9,17 @@ from tkinter import filedialog as fd, Entry, Button, Label, Grid, Menu, scrolled
 from idlelib.tooltip import Hovertip
 import threading
 
-# From external libraries
-from llama_cpp.llama_chat_format import LlamaChatCompletionHandlerRegistry
-
 # From custom modules
 from menu_funcs import export_chat, usage_tips, check_updates, about_info
-from config_handler import ConfigHandler
-from core_funcs import LlmProcess, load_model, set_personality, evt_send
-from main import version
+import ui_bridge
+from config_handler import ConfigHandler, LLM_TUNABLES, tunable_values, tunables_error
+from core_funcs import LlmProcess, load_model, cancel_load_model, set_personality, evt_send, thread_replay_history
+from session_store import save_session, load_session, can_restore_state
+from chat_session import ChatSession
+import chat_session
+import model_pool
+from version import version
+import startup_timer
 
 def user_counter(event):
     lbl_input_counter.config(text = "Total characters: " + str(len(event.widget.get("1.0",'end-1c'))))
@@ -24,6 +27,17 @@ def user_counter(event):
 def pers_counter(event, top_config):
     top_config.pers_counter_var.set("Total characters: " + str(len(event.widget.get("1.0",'end-1c'))))    
 
+def insert_user_message(msg):
+    if chat_box.compare("end-1c", "!=", "1.0"):
+        # Insert new line 'separator' if textbox is not empty (i.e. conversation is ongoing)
+        chat_box.insert(END, "\n")
+    chat_box.insert(END, "User -> " + msg, "tag_user")
+    chat_box.see("end")
+
+def clear_user_input():
+    txt_user.delete("1.0", "end")
+    lbl_input_counter.config(text = "Total characters: 0")
+
 def insert_newline(event):
     event.widget.insert("insert", "\n")
     return "break"
@@ -31,6 +45,7 @@ def insert_newline(event):
 def close_app():
     with LlmProcess.lock:
         LlmProcess.is_running = False
+    cancel_load_model()
     root.destroy()
     for thread in threading.enumerate(): 
         print("Running threads = "+thread.name)
@@ -40,9 +55,17 @@ def model_picker(top_config):
     if path:
         top_config.path_var.set(path)
 
+def draft_model_picker(top_config):
+    path = fd.askopenfilename(title = "Select a draft LLM model", filetypes = (("Supported formats", ".gguf"),), parent=top_config)
+    if path:
+        top_config.spec_draft_path_var.set(path)
+
 def validate_number_input(P):
     return P.isdigit() and len(P) <= 6 or P == ""
 
+def validate_signed_number_input(P):
+    return P in ("", "-") or P.lstrip("-").isdigit() and len(P) <= 6
+
 def open_config():
     BG_GREY = ConfigHandler.cp["GUI"]["bg_grey"]
     BG_COLOUR = ConfigHandler.cp["GUI"]["bg_colour"]
@@ -222,6 +245,7 @@ def open_config():
     lbl_p_template = Label(top_config, text = "Prompt Template", font = MENU_FONT_BOLD)
     lbl_p_template.grid(row = 11, column = 0)
     combo_p_template = ttk.Combobox(frame_p_template, textvariable = top_config.cb_p_template_var, state = "readonly")
+    from llama_cpp.llama_chat_format import LlamaChatCompletionHandlerRegistry  # Imported here so that llama_cpp is not loaded before the window is shown
     combo_p_template["values"] = ["auto"]+sorted(list(LlamaChatCompletionHandlerRegistry._chat_handlers.keys())) # Populate values with llama-cpp-python's supported chat handlers (prompt templates)
     combo_p_template.grid(row = 0, column = 0, sticky = "w")
     top_config.cb_p_template_var.set(ConfigHandler.cp["AI"]["prompt_template"]) # Set initial combobox value based on config.ini
@@ -231,37 +255,223 @@ def open_config():
              +"\n- Other options: Manually set the prompt template. Useful if LLM produces poor/unusable replies. "
              +"\nRefer to the LLM's model card on HuggingFace website for the appropriate prompt template.")
 
+    # Token counting options
+    top_config.cb_token_counter_var = tk.StringVar()
+    frame_token_counter = tk.Frame(top_config)
+    lbl_token_counter = Label(top_config, text = "Token Counting", font = MENU_FONT_BOLD)
+    lbl_token_counter.grid(row = 12, column = 0)
+    combo_token_counter = ttk.Combobox(frame_token_counter, textvariable = top_config.cb_token_counter_var, state = "readonly")
+    combo_token_counter["values"] = ["llm", "sentencepiece"]
+    combo_token_counter.grid(row = 0, column = 0, sticky = "w")
+    top_config.cb_token_counter_var.set(ConfigHandler.cp["AI"]["token_counter"]) # Set initial combobox value based on config.ini
+    frame_token_counter.grid(row = 12, column = 1, sticky = "w")
+    Hovertip(frame_token_counter, "Set how SOLAIRIA counts tokens to keep context/memory and file parts within the Context Size."
+             +"\n- llm: Default option. Counts with the loaded LLM's own tokenizer and prompt template (exact)."
+             +"\n- sentencepiece: Estimates with the bundled Llama-2 tokenizer. Also used when no LLM is loaded."
+             +"\nEnable 'Show LLM Performance' to see how each reply's tokens are split within the Context Size.")
+
+    # Prompt cache options
+    top_config.cb_prompt_cache_var = tk.StringVar()
+    top_config.prompt_cache_size_var = tk.StringVar()
+    frame_prompt_cache = tk.Frame(top_config)
+    lbl_prompt_cache = Label(top_config, text = "Prompt Cache", font = MENU_FONT_BOLD)
+    lbl_prompt_cache.grid(row = 13, column = 0)
+    combo_prompt_cache = ttk.Combobox(frame_prompt_cache, textvariable = top_config.cb_prompt_cache_var, state = "readonly")
+    combo_prompt_cache["values"] = ["off", "ram", "disk"]
+    combo_prompt_cache.grid(row = 0, column = 0, sticky = "w")
+    top_config.cb_prompt_cache_var.set(ConfigHandler.cp["AI"]["prompt_cache"]) # Set initial combobox value based on config.ini
+    val_cmd_cache_size = (top_config.register(validate_number_input), '%P')
+    entry_prompt_cache_size = Entry(frame_prompt_cache, font = MENU_FONT, width = 6, textvariable = top_config.prompt_cache_size_var, validate="key", validatecommand = val_cmd_cache_size)
+    entry_prompt_cache_size.grid(row = 0, column = 1, sticky = "w")
+    top_config.prompt_cache_size_var.set(ConfigHandler.cp["AI"]["prompt_cache_size_mb"])
+    lbl_prompt_cache_size = Label(frame_prompt_cache, text = "MB", font = MENU_FONT_BOLD)
+    lbl_prompt_cache_size.grid(row = 0, column = 2, sticky = "w")
+    frame_prompt_cache.grid(row = 13, column = 1, sticky = "w")
+    Hovertip(frame_prompt_cache, "Keep the LLM's processed prompts (KV state) so that the chat history does not need to be processed again on every reply."
+             +"\nOnly the newly added part of the conversation is processed, which shortens the wait before the LLM starts replying."
+             +"\n- off: No prompt cache."
+             +"\n- ram: Default option. Cache is kept in RAM, up to the set size (least recently used entries are removed first)."
+             +"\n- disk: Cache is kept on disk (in the 'cache' folder, or 'prompt_cache_dir' in config.ini), up to the set size."
+             +"\nHits/misses are shown when 'Show LLM Performance' is enabled.")
+
+    # Model pool options
+    top_config.pool_max_var = tk.StringVar()
+    top_config.pool_budget_var = tk.StringVar()
+    top_config.cb_pool_pin_var = tk.BooleanVar()
+    top_config.pool_pins = ConfigHandler.cp["AI"]["pool_pin"]  # Pinned LLMs of this config, including ones other than the LLM set above
+    frame_model_pool = tk.Frame(top_config)
+    lbl_model_pool = Label(top_config, text = "Model Pool", font = MENU_FONT_BOLD)
+    lbl_model_pool.grid(row = 14, column = 0)
+    lbl_pool_max = Label(frame_model_pool, text = "Max LLMs", font = MENU_FONT)
+    lbl_pool_max.grid(row = 0, column = 0, sticky = "w")
+    val_cmd_pool = (top_config.register(validate_number_input), '%P')
+    entry_pool_max = Entry(frame_model_pool, font = MENU_FONT, width = 3, textvariable = top_config.pool_max_var, validate="key", validatecommand = val_cmd_pool)
+    entry_pool_max.grid(row = 0, column = 1, sticky = "w")
+    top_config.pool_max_var.set(ConfigHandler.cp["AI"]["pool_max_models"])
+    lbl_pool_budget = Label(frame_model_pool, text = "Budget", font = MENU_FONT)
+    lbl_pool_budget.grid(row = 0, column = 2, sticky = "w")
+    entry_pool_budget = Entry(frame_model_pool, font = MENU_FONT, width = 6, textvariable = top_config.pool_budget_var, validate="key", validatecommand = val_cmd_pool)
+    entry_pool_budget.grid(row = 0, column = 3, sticky = "w")
+    top_config.pool_budget_var.set(ConfigHandler.cp["AI"]["pool_budget_mb"])
+    lbl_pool_budget_mb = Label(frame_model_pool, text = "MB", font = MENU_FONT_BOLD)
+    lbl_pool_budget_mb.grid(row = 0, column = 4, sticky = "w")
+    cb_pool_pin = Checkbutton(frame_model_pool, text = "Pin this LLM", variable = top_config.cb_pool_pin_var, onvalue = True, offvalue = False)
+    cb_pool_pin.grid(row = 0, column = 5, sticky = "w")
+    top_config.cb_pool_pin_var.set(model_pool.is_pinned(top_config.pool_pins, ConfigHandler.cp["AI"]["model_path"]))
+    frame_model_pool.grid(row = 14, column = 1, sticky = "w")
+    Hovertip(frame_model_pool, "Keep previously loaded LLMs in memory, so that switching back to one of them is instant."
+             +"\n- Max LLMs: Number of LLMs kept loaded. Default is 1 (only the current LLM)."
+             +"\n- Budget: Total RAM/VRAM for loaded LLMs, estimated from file size and Context Size. 0 = no limit."
+             +"\nWhen either limit is reached, the least recently used LLM is unloaded first."
+             +"\n- Pin this LLM: The LLM set above is never unloaded once it has been loaded.")
+
+    # Number of file parts analysed at the same time
+    top_config.analysis_workers_var = tk.StringVar()
+    lbl_analysis_workers = Label(top_config, text = "File Analysis Workers", font = MENU_FONT_BOLD)
+    lbl_analysis_workers.grid(row = 15, column = 0)
+    val_cmd_workers = (top_config.register(validate_number_input), '%P')
+    entry_analysis_workers = Entry(top_config, font = MENU_FONT, width = 3, textvariable = top_config.analysis_workers_var, validate="key", validatecommand = val_cmd_workers)
+    entry_analysis_workers.grid(row = 15, column = 1, sticky = "w")
+    top_config.analysis_workers_var.set(ConfigHandler.cp["AI"]["analysis_workers"])
+    Hovertip(entry_analysis_workers, "Set how many parts of a file are analysed at the same time when using 'Analyse File'."
+             +"\n- 1: Default option. Parts are analysed one at a time by the loaded LLM."
+             +"\n- 2 or more: Each worker is an extra context of the loaded LLM, with the same GPU Layers and the CPU cores shared between them."
+             +"\n  Weights on the CPU are shared, so each worker only needs extra RAM for its Context Size. Each worker needs its own VRAM for GPU layers."
+             +"\nBest used with the CPU-bound version on a CPU with many cores.")
+
+    # Log deduplication option
+    top_config.cb_log_dedup_var = tk.StringVar()
+    lbl_log_dedup = Label(top_config, text = "Log Deduplication", font = MENU_FONT_BOLD)
+    lbl_log_dedup.grid(row = 16, column = 0)
+    combo_log_dedup = ttk.Combobox(top_config, textvariable = top_config.cb_log_dedup_var, state = "readonly")
+    combo_log_dedup["values"] = ["off", "on"]
+    combo_log_dedup.grid(row = 16, column = 1, sticky = "w")
+    top_config.cb_log_dedup_var.set(ConfigHandler.cp["AI"]["log_dedup"]) # Set initial combobox value based on config.ini
+    Hovertip(combo_log_dedup, "Set whether repeated lines in '.log' files are collapsed before analysis."
+             +"\n- off: Default option. Every line is sent to the LLM."
+             +"\n- on: Lines that only differ in timestamps, IDs and numbers are grouped into templates."
+             +"\n  Each template is sent once with the line range and number of lines it covers (e.g. 'Ln 5-980 x57: <*> INFO Request <*> done'),"
+             +"\n  followed by the first and last of those lines."
+             +"\nMuch less text is analysed for repetitive logs, so analysis is faster and needs fewer rounds of summarising.")
+
+    # Analysis cache options
+    top_config.cb_analysis_cache_var = tk.StringVar()
+    top_config.analysis_cache_size_var = tk.StringVar()
+    frame_analysis_cache = tk.Frame(top_config)
+    lbl_analysis_cache = Label(top_config, text = "Analysis Cache", font = MENU_FONT_BOLD)
+    lbl_analysis_cache.grid(row = 17, column = 0)
+    combo_analysis_cache = ttk.Combobox(frame_analysis_cache, textvariable = top_config.cb_analysis_cache_var, state = "readonly")
+    combo_analysis_cache["values"] = ["off", "on"]
+    combo_analysis_cache.grid(row = 0, column = 0, sticky = "w")
+    top_config.cb_analysis_cache_var.set(ConfigHandler.cp["AI"]["analysis_cache"]) # Set initial combobox value based on config.ini
+    val_cmd_analysis_cache_size = (top_config.register(validate_number_input), '%P')
+    entry_analysis_cache_size = Entry(frame_analysis_cache, font = MENU_FONT, width = 6, textvariable = top_config.analysis_cache_size_var, validate="key", validatecommand = val_cmd_analysis_cache_size)
+    entry_analysis_cache_size.grid(row = 0, column = 1, sticky = "w")
+    top_config.analysis_cache_size_var.set(ConfigHandler.cp["AI"]["analysis_cache_size_mb"])
+    lbl_analysis_cache_size = Label(frame_analysis_cache, text = "MB", font = MENU_FONT_BOLD)
+    lbl_analysis_cache_size.grid(row = 0, column = 2, sticky = "w")
+    frame_analysis_cache.grid(row = 17, column = 1, sticky = "w")
+    Hovertip(frame_analysis_cache, "Keep the analysis of each part of a file on disk (in the 'cache/analysis' folder), up to the set size."
+             +"\nWhen a file is analysed again (e.g. a log that has grown), parts that have not changed are not sent to the LLM again."
+             +"\nResults are only reused with the same LLM, Context Size and prompt template."
+             +"\n- off: No analysis cache."
+             +"\n- on: Default option. Least recently used results are removed first once the cache is full."
+             +"\nReused/new parts are shown in the status bar while a file is analysed.")
+
+    # CSV profiling option
+    top_config.cb_csv_profile_var = tk.StringVar()
+    lbl_csv_profile = Label(top_config, text = "CSV Profiling", font = MENU_FONT_BOLD)
+    lbl_csv_profile.grid(row = 18, column = 0)
+    combo_csv_profile = ttk.Combobox(top_config, textvariable = top_config.cb_csv_profile_var, state = "readonly")
+    combo_csv_profile["values"] = ["off", "on"]
+    combo_csv_profile.grid(row = 18, column = 1, sticky = "w")
+    top_config.cb_csv_profile_var.set(ConfigHandler.cp["AI"]["csv_profile"]) # Set initial combobox value based on config.ini
+    Hovertip(combo_csv_profile, "Set how '.csv' files are analysed."
+             +"\n- off: Every row is sent to the LLM as text, one part of the file at a time."
+             +"\n- on: Default option. The whole file is profiled first: each column's type, empty values, min/max/mean/quartiles,"
+             +"\n  most common values and outliers. The profile and a sample of rows are analysed instead of every row,"
+             +"\n  so large files are analysed in one or two parts.")
+
+    # Speculative decoding options
+    top_config.cb_speculative_var = tk.StringVar()
+    top_config.spec_draft_tokens_var = tk.StringVar()
+    top_config.spec_draft_path_var = tk.StringVar()
+    frame_speculative = tk.Frame(top_config)
+    lbl_speculative = Label(top_config, text = "Speculative Decoding", font = MENU_FONT_BOLD)
+    lbl_speculative.grid(row = 19, column = 0)
+    combo_speculative = ttk.Combobox(frame_speculative, textvariable = top_config.cb_speculative_var, state = "readonly")
+    combo_speculative["values"] = ["off", "prompt_lookup", "draft_model"]
+    combo_speculative.grid(row = 0, column = 0, sticky = "w")
+    top_config.cb_speculative_var.set(ConfigHandler.cp["AI"]["speculative"]) # Set initial combobox value based on config.ini
+    val_cmd_spec_draft_tokens = (top_config.register(validate_number_input), '%P')
+    entry_spec_draft_tokens = Entry(frame_speculative, font = MENU_FONT, width = 4, textvariable = top_config.spec_draft_tokens_var, validate="key", validatecommand = val_cmd_spec_draft_tokens)
+    entry_spec_draft_tokens.grid(row = 0, column = 1, sticky = "w")
+    top_config.spec_draft_tokens_var.set(ConfigHandler.cp["AI"]["spec_draft_tokens"])
+    lbl_spec_draft_tokens = Label(frame_speculative, text = "tokens", font = MENU_FONT_BOLD)
+    lbl_spec_draft_tokens.grid(row = 0, column = 2, sticky = "w")
+    entry_spec_draft_path = Entry(frame_speculative, font = MENU_FONT, width = 25, textvariable = top_config.spec_draft_path_var)
+    entry_spec_draft_path.grid(row = 0, column = 3, sticky = "w")
+    top_config.spec_draft_path_var.set(ConfigHandler.cp["AI"]["spec_draft_model_path"])
+    btn_spec_draft_path = Button(frame_speculative, text = "Draft LLM", font = MENU_FONT, bg = BG_GREY,
+                                 command = lambda: draft_model_picker(top_config))
+    btn_spec_draft_path.grid(row = 0, column = 4, sticky = "w")
+    frame_speculative.grid(row = 19, column = 1, sticky = "w")
+    Hovertip(frame_speculative, "Guess the next few tokens cheaply and let the LLM check them all in one go. Accepted guesses are tokens"
+             +"\nthe LLM did not have to generate one by one, so replies are faster but otherwise the same."
+             +"\n- off: Default option. No speculative decoding."
+             +"\n- prompt_lookup: Guess by copying what followed the last few tokens earlier in the prompt. Nearly free, and works best"
+             +"\n  when replies quote the prompt, e.g. file analysis. Also used by File Analysis Workers."
+             +"\n- draft_model: Guess with a small LLM of the same family as the loaded LLM (set with 'Draft LLM')."
+             +"\nThe number sets how many tokens are guessed at a time (default 10)."
+             +"\nThe share of guesses accepted is shown with Show LLM Performance enabled, and in headless mode. Changes reload the LLM.")
+
+    # Performance tunables. One option per entry of LLM_TUNABLES, with a combobox for a list of values and an entry box for numbers.
+    top_config.tunable_vars = {}
+    frame_performance = tk.Frame(top_config)
+    lbl_performance = Label(top_config, text = "Performance", font = MENU_FONT_BOLD)
+    lbl_performance.grid(row = 20, column = 0)
+    for index, (key, (default, label, allowed)) in enumerate(LLM_TUNABLES.items()):
+        top_config.tunable_vars[key] = tk.StringVar()
+        lbl_tunable = Label(frame_performance, text = label, font = MENU_FONT_BOLD)
+        lbl_tunable.grid(row = (index//5)*2, column = index%5)
+        if isinstance(allowed, list):
+            widget_tunable = ttk.Combobox(frame_performance, textvariable = top_config.tunable_vars[key], state = "readonly", width = 7)
+            widget_tunable["values"] = allowed
+        else:
+            val_cmd_tunable = (top_config.register(validate_signed_number_input if allowed[0] < 0 else validate_number_input), '%P')
+            widget_tunable = Entry(frame_performance, font = MENU_FONT, width = 6, textvariable = top_config.tunable_vars[key], validate="key", validatecommand = val_cmd_tunable)
+        widget_tunable.grid(row = (index//5)*2 + 1, column = index%5)
+        top_config.tunable_vars[key].set(ConfigHandler.cp["AI"][key])
+    frame_performance.grid(row = 20, column = 1, sticky = "w")
+    Hovertip(frame_performance, "Set how the LLM is loaded. Changes reload the LLM."
+             +"\n- GPU Layers: Layers offloaded to the GPU (-1 for all, 0 for none). Only used by the GPU-bound version."
+             +"\n- KV on GPU: Keep the context/memory (KV cache) on the GPU too."
+             +"\n- Threads: CPU threads used for generating replies (0 for half of the CPU cores)."
+             +"\n- Batch/Micro-batch: Tokens of a prompt evaluated at a time. Smaller values use less memory, larger ones read prompts faster."
+             +"\n- K Cache/V Cache: f16 is the default. q8_0 halves and q4_0 quarters the memory of the context/memory, so a larger"
+             +"\n  Context Size fits into the same memory (e.g. on a Raspberry Pi). A quantized V Cache needs Flash Attention."
+             +"\n- Flash Attention: Faster attention with less memory, if the LLM and hardware support it."
+             +"\n- mmap: Map the LLM file into memory instead of reading it in. Loads faster and shares memory with File Analysis Workers."
+             +"\n- mlock: Keep the LLM in RAM so that it is never swapped out (needs enough free RAM).")
+
     # Show/hide LLM stats (llm.verbose)
     top_config.cb_llm_stats_var = tk.BooleanVar()
     lbl_llm_stats = Label(top_config, text = "Show LLM Performance", font = MENU_FONT_BOLD, anchor = "n")
-    lbl_llm_stats.grid(row = 12, column = 0, sticky = "we")
+    lbl_llm_stats.grid(row = 21, column = 0, sticky = "we")
     top_config.cb_llm_stats = Checkbutton(top_config, text = "Enable", variable = top_config.cb_llm_stats_var,
                                 onvalue = True, offvalue = False)
     top_config.cb_llm_stats_var.set(ConfigHandler.cp["AI"]["llm_stats_enable"])
-    top_config.cb_llm_stats.grid(row = 12, column = 1, sticky = "w")
+    top_config.cb_llm_stats.grid(row = 21, column = 1, sticky = "w")
     Hovertip(top_config.cb_llm_stats, "Enable/disable display of LLM performance stats."
              +"\nStats vary based on your hardware specs.")
 
     # Config options
     frame_config_options = tk.Frame(top_config)
     lbl_config_options = Label(top_config, text = "Config Options", font = MENU_FONT_BOLD)
-    lbl_config_options.grid(row = 13, column = 0)
+    lbl_config_options.grid(row = 22, column = 0)
     # Export config button
     btn_export_config = Button(frame_config_options, text = "Export", font = MENU_FONT, bg = BG_GREY,
-                               command = lambda: export_config(top_config,
-                                                               entry_model_path.get(),  #model_path
-                                                               str(top_config.context_var.get()),    # context_size
-                                                               top_config.txt_personality.get("1.0", "end-1c"),    #personality
-                                                               str(top_config.font_size_var.get()), #font_size
-                                                               str(top_config.font_type_var.get()), #font_type
-                                                               str(top_config.font_colour_user_var.get()), #font_colour_user
-                                                               str(top_config.font_colour_asst_var.get()), #font_colour_asst
-                                                               str(top_config.bg_colour_var.get()), #bg_colour
-                                                               str(top_config.cb_history_option_var.get()), #history option
-                                                               str(top_config.cb_context_mgmt_var.get()),   #context management option
-                                                               str(top_config.cb_p_template_var.get()), #prompt template option
-                                                               str(top_config.cb_llm_stats_var.get())   #llm performance stats option
-                                                               ))
+                               command = lambda: export_config(top_config, config_values(top_config)))
     btn_export_config.grid(row=0, column=0)
     # Import config button
     btn_import_config = Button(frame_config_options, text = "Import", font = MENU_FONT, bg = BG_GREY,
@@ -271,37 +481,24 @@ def open_config():
     btn_default_config = Button(frame_config_options, text = "Restore defaults", font = MENU_FONT, bg = BG_GREY,
                                command = lambda: default_config(top_config))
     btn_default_config.grid(row=0, column=2)    
-    frame_config_options.grid(row = 13, column = 1, sticky = "w")
+    frame_config_options.grid(row = 22, column = 1, sticky = "w")
 
     # Save config button
     frame_btn_confirm = tk.Frame(top_config)
     btn_save_config = Button(frame_btn_confirm, text = "Ok", font = MENU_FONT_BOLD, bg = BG_GREY, width = 6,
-                             command = lambda: save_config(top_config,
-                                                           entry_model_path.get(),  #model_path
-                                                           str(top_config.context_var.get()),    # context_size
-                                                           top_config.txt_personality.get("1.0", "end-1c"),    #personality
-                                                           str(top_config.font_size_var.get()), #font_size
-                                                           str(top_config.font_type_var.get()), #font_type
-                                                           str(top_config.font_colour_user_var.get()), #font_colour_user
-                                                           str(top_config.font_colour_asst_var.get()), #font_colour_asst
-                                                           str(top_config.bg_colour_var.get()), #bg_colour
-                                                           str(top_config.cb_history_option_var.get()), #history option
-                                                           str(top_config.cb_context_mgmt_var.get()),   #context management option
-                                                           str(top_config.cb_p_template_var.get()), #prompt template option
-                                                           str(top_config.cb_llm_stats_var.get())   #llm performance stats option
-                                                           ))
+                             command = lambda: save_config(top_config, config_values(top_config)))
     btn_save_config.grid(row=0, column=0, padx = 10)
     # Cancel button
     btn_cancel_config = Button(frame_btn_confirm, text = "Cancel", font = MENU_FONT_BOLD, bg = BG_GREY,
                                command = lambda: [btn_config.config(state="normal"), top_config.destroy()])
     btn_cancel_config.grid(row=0, column=1)
-    frame_btn_confirm.grid(row = 14, column = 1, sticky = "e")
+    frame_btn_confirm.grid(row = 23, column = 1, sticky = "e")
 
     # Config status label
     top_config.lbl_config_status_var = tk.StringVar()
     top_config.lbl_config_status_var.set("Press Ok to apply changes.")
     lbl_config_status = Label(top_config, textvariable = top_config.lbl_config_status_var, borderwidth=2, relief = "ridge", anchor = "w")
-    lbl_config_status.grid(row = 15, column = 0, columnspan = 2, sticky = "we")
+    lbl_config_status.grid(row = 24, column = 0, columnspan = 2, sticky = "we")
     
     # Set only column1 weight to 1 to adapt to horizontal window adjustments
     top_config.columnconfigure(1, weight=1)
@@ -311,6 +508,7 @@ def open_config():
     for row in range(total_rows):
         top_config.rowconfigure(row, weight=1)
     top_config.protocol("WM_DELETE_WINDOW", lambda: [btn_config.config(state="normal"), top_config.destroy()])
+    return top_config
 
 def pick_colour(top_config, role):
     match(role):
@@ -332,10 +530,49 @@ def pick_colour(top_config, role):
                 top_config.lbl_font_colour_user_example.config(bg = colour)
                 top_config.lbl_font_colour_asst_example.config(bg = colour)
 
-def save_config(top_config, m_path, ct_size, pers_val, fsize_val, ftype_val, fcol_user_val, fcol_asst_val, bgcol_val, hist_setting, ct_mgmt, ptemplate_setting, llm_stats_setting):
+def config_values(top_config):
+    # Reads the Config menu's widgets into config.ini sections, keyed by config parameter name
+    values = {"AI": {}, "GUI": {}}
+    values["AI"]["model_path"] = top_config.path_var.get()
+    values["AI"]["context_size"] = str(top_config.context_var.get())
+    values["AI"]["personality"] = top_config.txt_personality.get("1.0", "end-1c")
+    values["AI"]["history_option"] = str(top_config.cb_history_option_var.get())
+    values["AI"]["context_mgmt"] = str(top_config.cb_context_mgmt_var.get())
+    values["AI"]["prompt_template"] = str(top_config.cb_p_template_var.get())
+    values["AI"]["llm_stats_enable"] = str(top_config.cb_llm_stats_var.get())
+    values["AI"]["token_counter"] = str(top_config.cb_token_counter_var.get())
+    values["AI"]["prompt_cache"] = str(top_config.cb_prompt_cache_var.get())
+    values["AI"]["prompt_cache_size_mb"] = str(top_config.prompt_cache_size_var.get())
+    values["AI"]["pool_max_models"] = str(top_config.pool_max_var.get())
+    values["AI"]["pool_budget_mb"] = str(top_config.pool_budget_var.get())
+    values["AI"]["pool_pin"] = model_pool.update_pins(top_config.pool_pins, top_config.path_var.get(), top_config.cb_pool_pin_var.get())
+    values["AI"]["analysis_workers"] = str(top_config.analysis_workers_var.get())
+    values["AI"]["log_dedup"] = str(top_config.cb_log_dedup_var.get())
+    values["AI"]["analysis_cache"] = str(top_config.cb_analysis_cache_var.get())
+    values["AI"]["analysis_cache_size_mb"] = str(top_config.analysis_cache_size_var.get())
+    values["AI"]["csv_profile"] = str(top_config.cb_csv_profile_var.get())
+    values["AI"]["speculative"] = str(top_config.cb_speculative_var.get())
+    values["AI"]["spec_draft_tokens"] = str(top_config.spec_draft_tokens_var.get())
+    values["AI"]["spec_draft_model_path"] = top_config.spec_draft_path_var.get()
+    for key, var in top_config.tunable_vars.items():
+        values["AI"][key] = var.get()
+    values["GUI"]["font_size"] = str(top_config.font_size_var.get())
+    values["GUI"]["font_type"] = str(top_config.font_type_var.get())
+    values["GUI"]["font_colour_user"] = str(top_config.font_colour_user_var.get())
+    values["GUI"]["font_colour_asst"] = str(top_config.font_colour_asst_var.get())
+    values["GUI"]["bg_colour"] = str(top_config.bg_colour_var.get())
+    return values
+
+def save_config(top_config, values):
     edit_flag = True    # If any logic checks fail/fail-equivalent, set edit_flag to False
+    ai_values = values["AI"]
+    tunables = tunable_values(ai_values)
 
-    if LlmProcess.is_running == True:
+    if LlmProcess.llm_status in ("Loading personality", "Restoring session"):
+        # Personality snapshot and session replay are evaluated in the background without setting is_running, so check them separately
+        tk.messagebox.showinfo("SOLAIRIA is still busy",  "Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.")
+        return
+    elif LlmProcess.is_running == True:
         match(LlmProcess.llm_status):
             case "Thinking":
                 tk.messagebox.showinfo("SOLAIRIA is still thinking",  "Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.")
@@ -350,83 +587,171 @@ def save_config(top_config, m_path, ct_size, pers_val, fsize_val, ftype_val, fco
                 with LlmProcess.lock:
                     LlmProcess.is_running = False
                     LlmProcess.llm_status = "Idle (reply stopped to save config settings)"
-                time.sleep(0.5) # Sleep 0.5s to allow text generation in send() function to properly stop before proceeding. This allows variables used in send() like memory/context (root.prev_prompts) to be correctly edited by subsequent code.
+                time.sleep(0.5) # Sleep 0.5s to allow text generation in send() function to properly stop before proceeding. This allows variables used in send() like memory/context (ChatSession.msglist) to be correctly edited by subsequent code.
     else:
         with LlmProcess.lock:
             LlmProcess.llm_status = "Idle"
-    lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+    ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
     old_personality = ConfigHandler.cp["AI"]["personality"]   # old_personality used for better readability of code later
 
     # Update context_char_limit, my_prompt_limit and personality_limit
-    context_size = int(ct_size)
-    root.context_char_limit = context_size*4 # Formula is with reference to context_char_limit declared near start of code
-    root.my_prompt_limit = int(root.context_char_limit*0.2)   # Formula is with reference to context_char_limit declared near start of code
-    root.personality_limit = int(root.context_char_limit*0.1) # Formula is with reference to context_char_limit declared near start of code
+    chat_session.update_limits(ai_values["context_size"])
     
+    # Check prompt cache size input
+    if len(ai_values["prompt_cache_size_mb"]) == 0 or int(ai_values["prompt_cache_size_mb"]) == 0:
+        tk.messagebox.showinfo("Error",  "Please set a Prompt Cache size of at least 1MB.")
+        edit_flag = False
+        return
+
+    # Check model pool inputs
+    if len(ai_values["pool_max_models"]) == 0 or int(ai_values["pool_max_models"]) == 0:
+        tk.messagebox.showinfo("Error",  "Please set a Model Pool of at least 1 LLM.")
+        edit_flag = False
+        return
+    if len(ai_values["pool_budget_mb"]) == 0:
+        tk.messagebox.showinfo("Error",  "Please set a Model Pool budget in MB, or 0 for no limit.")
+        edit_flag = False
+        return
+
+    # Check file analysis workers input
+    if len(ai_values["analysis_workers"]) == 0 or int(ai_values["analysis_workers"]) == 0:
+        tk.messagebox.showinfo("Error",  "Please set at least 1 File Analysis Worker.")
+        edit_flag = False
+        return
+
+    # Check analysis cache size input
+    if len(ai_values["analysis_cache_size_mb"]) == 0 or int(ai_values["analysis_cache_size_mb"]) == 0:
+        tk.messagebox.showinfo("Error",  "Please set an Analysis Cache size of at least 1MB.")
+        edit_flag = False
+        return
+
+    # Check speculative decoding inputs
+    if len(ai_values["spec_draft_tokens"]) == 0 or int(ai_values["spec_draft_tokens"]) == 0:
+        tk.messagebox.showinfo("Error",  "Please set at least 1 draft token for Speculative Decoding.")
+        edit_flag = False
+        return
+    if ai_values["speculative"] == "draft_model" and not ai_values["spec_draft_model_path"].endswith(".gguf"):
+        tk.messagebox.showinfo("Error",  "Please choose a draft LLM file (.gguf format) for Speculative Decoding.")
+        edit_flag = False
+        return
+
+    # Check performance tunables
+    tunables_invalid = tunables_error(tunables)
+    if tunables_invalid:
+        tk.messagebox.showinfo("Error",  tunables_invalid)
+        edit_flag = False
+        return
+
     # Check length of personality input
-    if len(pers_val) > root.personality_limit:
-        str_error = "Your input for Personality was "+str(len(pers_val))+" characters long. Please keep within "+str(root.personality_limit)+" characters. This limit depends on Context Size."
+    if len(ai_values["personality"]) > ChatSession.personality_limit:
+        str_error = "Your input for Personality was "+str(len(ai_values["personality"]))+" characters long. Please keep within "+str(ChatSession.personality_limit)+" characters. This limit depends on Context Size."
         tk.messagebox.showinfo("Error",  str_error)
         edit_flag = False
         return
 
     # Update config.ini only if edit_flag is True
     if edit_flag == True:
-        # Check if model path or context size is different from config.ini
-        if m_path != ConfigHandler.cp["AI"]["model_path"] or int(ct_size) != int(ConfigHandler.cp["AI"]["context_size"]) or ptemplate_setting != ConfigHandler.cp["AI"]["prompt_template"]:
-            top_config.lbl_config_status_var.set("LLM, Context Size or Prompt Template was changed. Reloading LLM, please wait...")
-            top_config.update_idletasks()
-
-            # Unload existing LLM. This step is needed for GPU-bound version, because if existing LLM + new LLM needs more VRAM than
-            # what GPU has, then loading a new LLM without unloading previous one will exceed GPU VRAM and cause new LLM to load
-            # partially in GPU VRAM, resulting in partial/full usage of CPU processing for GPU-bound version.
-            load_model("", ct_size, ptemplate_setting)
-            
-            if load_model(m_path, ct_size, ptemplate_setting): # If model loaded successfully, or unloaded successfully due to empty model path
-                ConfigHandler.cp.set("AI", "model_path", m_path)
-                ConfigHandler.cp.set("AI", "context_size", ct_size)
-                ConfigHandler.cp.set("AI", "prompt_template", ptemplate_setting)
-            else:
+        # Model pool options are set first, so that the LLM below is loaded within the new limits
+        ConfigHandler.cp.set("AI", "pool_max_models", ai_values["pool_max_models"])
+        ConfigHandler.cp.set("AI", "pool_budget_mb", ai_values["pool_budget_mb"])
+        ConfigHandler.cp.set("AI", "pool_pin", ai_values["pool_pin"])
+
+        # Speculative decoding options are also set first. The LLM is created with its draft model, so changing them loads it again.
+        old_speculative = {key: ConfigHandler.cp["AI"][key] for key in ("speculative", "spec_draft_tokens", "spec_draft_model_path")}
+        new_speculative = {"speculative": ai_values["speculative"], "spec_draft_tokens": ai_values["spec_draft_tokens"], "spec_draft_model_path": ai_values["spec_draft_model_path"]}
+        for key, value in new_speculative.items():
+            ConfigHandler.cp.set("AI", key, value)
+
+        # Check if model path, context size, prompt template, performance tunables or speculative decoding options are different from config.ini
+        if (ai_values["model_path"] != ConfigHandler.cp["AI"]["model_path"] or int(ai_values["context_size"]) != int(ConfigHandler.cp["AI"]["context_size"]) or ai_values["prompt_template"] != ConfigHandler.cp["AI"]["prompt_template"]
+            or tunables != tunable_values(ConfigHandler.cp["AI"]) or (new_speculative != old_speculative and len(ai_values["model_path"].strip()) > 0)):
+            # Switches to the LLM if it is still in the model pool. Otherwise, least recently used LLMs are unloaded to make room and it is loaded.
+            def on_model_loaded(success):
+                # Called once the LLM has been loaded in the background. Model settings are only saved if it loaded successfully.
+                if success:
+                    ConfigHandler.cp.set("AI", "model_path", ai_values["model_path"])
+                    ConfigHandler.cp.set("AI", "context_size", ai_values["context_size"])
+                    ConfigHandler.cp.set("AI", "prompt_template", ai_values["prompt_template"])
+                    for key, value in tunables.items():
+                        ConfigHandler.cp.set("AI", key, value)
+                    write_config()
+                else:
+                    for key, value in old_speculative.items():
+                        ConfigHandler.cp.set("AI", key, value)
+                    top_config_retry = open_config()
+                    top_config_retry.path_var.set(ai_values["model_path"])
+                    top_config_retry.context_var.set(ai_values["context_size"])
+                    top_config_retry.cb_p_template_var.set(ai_values["prompt_template"])
+                    for key, value in tunables.items():
+                        top_config_retry.tunable_vars[key].set(value)
+                    top_config_retry.cb_speculative_var.set(ai_values["speculative"])
+                    top_config_retry.spec_draft_tokens_var.set(ai_values["spec_draft_tokens"])
+                    top_config_retry.spec_draft_path_var.set(ai_values["spec_draft_model_path"])
+
+            # Not loaded while SOLAIRIA is replying, so the LLM (and its draft model) is never replaced in the middle of a reply
+            if not load_model(ai_values["model_path"], ai_values["context_size"], ai_values["prompt_template"], on_model_loaded, tunables):
+                for key, value in old_speculative.items():
+                    ConfigHandler.cp.set("AI", key, value)
                 return
+        else:
+            # Unload LLMs that no longer fit within the model pool's limits, except the current one
+            model_pool.make_room(0, keep = model_pool.pool_key(ai_values["model_path"], ai_values["context_size"], ai_values["prompt_template"]))
+
+        # Check if prompt cache options are different from config.ini. Replacing the cache does not need the LLM to be reloaded.
+        if ai_values["prompt_cache"] != ConfigHandler.cp["AI"]["prompt_cache"] or ai_values["prompt_cache_size_mb"] != ConfigHandler.cp["AI"]["prompt_cache_size_mb"]:
+            ConfigHandler.cp.set("AI", "prompt_cache", ai_values["prompt_cache"])
+            ConfigHandler.cp.set("AI", "prompt_cache_size_mb", ai_values["prompt_cache_size_mb"])
+            if LlmProcess.llm is not None:
+                import prompt_cache # Already loaded along with the LLM
+                LlmProcess.llm.set_cache(prompt_cache.create_prompt_cache(ConfigHandler.cp["AI"]["model_path"], ConfigHandler.cp["AI"]["context_size"]))
 
         # Check if old and new personality is different
-        if old_personality.strip() != pers_val.strip():
-            ConfigHandler.cp.set("AI", "personality", pers_val)
-            root.msglist = []
+        if old_personality.strip() != ai_values["personality"].strip():
+            ConfigHandler.cp.set("AI", "personality", ai_values["personality"])
+            ChatSession.msglist.clear()
             set_personality()
             chat_box.insert(END, "\n---Personality change detected. Memory/context has been reset.---", "tag_info")
             chat_box.see("end")
 
         # Check if chat history checkbox option is different from config.ini
-        if hist_setting != ConfigHandler.cp["AI"]["history_option"]:
-            root.msglist = []
+        if ai_values["history_option"] != ConfigHandler.cp["AI"]["history_option"]:
+            ChatSession.msglist.clear()
             chat_box.insert(END, "\n---Chat History Reference setting was changed. Memory/context has been reset.---", "tag_info")
             chat_box.see("end")
 
+        # Check if token counting option is different from config.ini. Cached token counts of chat history are from the previous tokenizer.
+        if ai_values["token_counter"] != ConfigHandler.cp["AI"]["token_counter"]:
+            ConfigHandler.cp.set("AI", "token_counter", ai_values["token_counter"])
+            ChatSession.msglist.recount()
+
         # Check if LLM has been loaded first. If not loaded, the llm.verbose setting does not exist and cannot be set   
         if LlmProcess.llm is not None:
-            LlmProcess.llm.verbose = ast.literal_eval(llm_stats_setting)   # Turns on or off display of LLM stats
+            LlmProcess.llm.verbose = ast.literal_eval(ai_values["llm_stats_enable"])   # Turns on or off display of LLM stats
 
         # Set config parameters with values that are to be written to config.ini
-        ConfigHandler.cp.set("GUI", "font_size", fsize_val)
-        ConfigHandler.cp.set("GUI", "font_type", ftype_val)
-        ConfigHandler.cp.set("GUI", "font_colour_user", fcol_user_val)
-        ConfigHandler.cp.set("GUI", "font_colour_asst", fcol_asst_val)
-        ConfigHandler.cp.set("GUI", "bg_colour", bgcol_val)
-        ConfigHandler.cp.set("AI", "history_option", hist_setting)
-        ConfigHandler.cp.set("AI", "context_mgmt", ct_mgmt)
-        ConfigHandler.cp.set("AI", "llm_stats_enable", llm_stats_setting)
-        with open("config.ini", "w", encoding = "utf-8") as cfg_file:
-           ConfigHandler.cp.write(cfg_file)
+        ConfigHandler.cp.set("GUI", "font_size", values["GUI"]["font_size"])
+        ConfigHandler.cp.set("GUI", "font_type", values["GUI"]["font_type"])
+        ConfigHandler.cp.set("GUI", "font_colour_user", values["GUI"]["font_colour_user"])
+        ConfigHandler.cp.set("GUI", "font_colour_asst", values["GUI"]["font_colour_asst"])
+        ConfigHandler.cp.set("GUI", "bg_colour", values["GUI"]["bg_colour"])
+        ConfigHandler.cp.set("AI", "history_option", ai_values["history_option"])
+        ConfigHandler.cp.set("AI", "context_mgmt", ai_values["context_mgmt"])
+        ConfigHandler.cp.set("AI", "llm_stats_enable", ai_values["llm_stats_enable"])
+        ConfigHandler.cp.set("AI", "analysis_workers", ai_values["analysis_workers"])
+        ConfigHandler.cp.set("AI", "log_dedup", ai_values["log_dedup"])
+        ConfigHandler.cp.set("AI", "analysis_cache", ai_values["analysis_cache"])
+        ConfigHandler.cp.set("AI", "analysis_cache_size_mb", ai_values["analysis_cache_size_mb"])
+        ConfigHandler.cp.set("AI", "csv_profile", ai_values["csv_profile"])
+        write_config()
            
         # Update root UI elements with new settings
-        FONT_TYPE = ftype_val
-        FONT_SIZE = fsize_val
+        FONT_TYPE = values["GUI"]["font_type"]
+        FONT_SIZE = values["GUI"]["font_size"]
         FONT = (FONT_TYPE, FONT_SIZE)
         FONT_BOLD = FONT + ("bold",)
-        FONT_COLOUR_USER = fcol_user_val
-        FONT_COLOUR_ASST = fcol_asst_val
-        BG_COLOUR = bgcol_val
+        FONT_COLOUR_USER = values["GUI"]["font_colour_user"]
+        FONT_COLOUR_ASST = values["GUI"]["font_colour_asst"]
+        BG_COLOUR = values["GUI"]["bg_colour"]
 
         chat_box.config(font = FONT, background = BG_COLOUR)
         txt_user.config(font = FONT, foreground = FONT_COLOUR_USER, background = BG_COLOUR)
@@ -438,29 +763,46 @@ def save_config(top_config, m_path, ct_size, pers_val, fsize_val, ftype_val, fco
     btn_config.config(state = "normal")
     top_config.destroy()
 
-def export_config(top_config, m_path, ct_size, pers_val, fsize_val, ftype_val, fcol_user_val, fcol_asst_val, bgcol_val, hist_setting, ct_mgmt, ptemplate_setting, llm_stats_setting):
+def write_config():
+    with open("config.ini", "w", encoding = "utf-8") as cfg_file:
+       ConfigHandler.cp.write(cfg_file)
+
+def set_model_loading(loading):
+    # Shows LLM loading progress with a Cancel button, and disables chat input until the LLM is ready
+    if loading:
+        load_progress_var.set(0)
+        lbl_llm_name_var.set("Loading LLM... 0%")
+        frame_load.grid()
+        input_state = "disabled"
+    else:
+        frame_load.grid_remove()
+        input_state = "normal"
+    txt_user.config(state = input_state)
+    btn_send.config(state = input_state)
+    btn_analyse_tf.config(state = input_state)
+    if not loading:
+        txt_user.focus_set()
+
+def set_load_progress(percent):
+    load_progress_var.set(percent)
+    lbl_llm_name_var.set("Loading LLM... "+str(percent)+"%")
+
+def set_llm_name(text):
+    lbl_llm_name_var.set(text)
+
+def export_config(top_config, values):
     cp_export = configparser.ConfigParser()
     cp_export["AI"] = {}
     cp_export["GUI"] = {}
 
-    # Set AI config parameters with values that are to be exported
-    cp_export.set("AI", "model_path", m_path)
-    cp_export.set("AI", "context_size", ct_size)
-    cp_export.set("AI", "personality", pers_val)
-    cp_export.set("AI", "history_option", hist_setting)
-    cp_export.set("AI", "context_mgmt", ct_mgmt)
-    cp_export.set("AI", "prompt_template", ptemplate_setting)
-    cp_export.set("AI", "llm_stats_enable", llm_stats_setting)
-    
-    # Initialise these GUI config parameters as they are not in Config menu
-    cp_export.set("GUI", "bg_grey", ConfigHandler.cp["GUI"]["bg_grey"])
+    # Set config parameters with values that are to be exported
+    for section, section_values in values.items():
+        for key, value in section_values.items():
+            cp_export.set(section, key, value)
 
-    # Set GUI config parameters with values that are to be exported
-    cp_export.set("GUI", "font_size",  fsize_val)
-    cp_export.set("GUI", "font_type", ftype_val)
-    cp_export.set("GUI", "font_colour_user", fcol_user_val)
-    cp_export.set("GUI", "font_colour_asst", fcol_asst_val)
-    cp_export.set("GUI", "bg_colour",  bgcol_val)
+    # Initialise these config parameters as they are not in Config menu
+    cp_export.set("AI", "spec_ngram_size", ConfigHandler.cp["AI"]["spec_ngram_size"])
+    cp_export.set("GUI", "bg_grey", ConfigHandler.cp["GUI"]["bg_grey"])
     
     file_name = fd.asksaveasfilename(initialfile = "export_config.ini", defaultextension = ".ini", filetypes=(("INI file", ".ini"), ("All Files","*.*")), parent=top_config)
     if file_name:
@@ -482,6 +824,23 @@ def import_config(top_config):
             top_config.cb_context_mgmt_var.set(cp_import["AI"]["context_mgmt"])
             top_config.cb_p_template_var.set(cp_import["AI"]["prompt_template"])
             top_config.cb_llm_stats_var.set(cp_import["AI"]["llm_stats_enable"])
+            top_config.cb_token_counter_var.set(cp_import["AI"].get("token_counter", ConfigHandler.default_cfg_ai["token_counter"]))  # Fall back to default for profiles exported before this option existed
+            top_config.cb_prompt_cache_var.set(cp_import["AI"].get("prompt_cache", ConfigHandler.default_cfg_ai["prompt_cache"]))
+            top_config.prompt_cache_size_var.set(cp_import["AI"].get("prompt_cache_size_mb", ConfigHandler.default_cfg_ai["prompt_cache_size_mb"]))
+            top_config.pool_max_var.set(cp_import["AI"].get("pool_max_models", ConfigHandler.default_cfg_ai["pool_max_models"]))
+            top_config.pool_budget_var.set(cp_import["AI"].get("pool_budget_mb", ConfigHandler.default_cfg_ai["pool_budget_mb"]))
+            top_config.pool_pins = cp_import["AI"].get("pool_pin", ConfigHandler.default_cfg_ai["pool_pin"])
+            top_config.cb_pool_pin_var.set(model_pool.is_pinned(top_config.pool_pins, cp_import["AI"]["model_path"]))
+            top_config.analysis_workers_var.set(cp_import["AI"].get("analysis_workers", ConfigHandler.default_cfg_ai["analysis_workers"]))
+            top_config.cb_log_dedup_var.set(cp_import["AI"].get("log_dedup", ConfigHandler.default_cfg_ai["log_dedup"]))
+            top_config.cb_analysis_cache_var.set(cp_import["AI"].get("analysis_cache", ConfigHandler.default_cfg_ai["analysis_cache"]))
+            top_config.analysis_cache_size_var.set(cp_import["AI"].get("analysis_cache_size_mb", ConfigHandler.default_cfg_ai["analysis_cache_size_mb"]))
+            top_config.cb_csv_profile_var.set(cp_import["AI"].get("csv_profile", ConfigHandler.default_cfg_ai["csv_profile"]))
+            top_config.cb_speculative_var.set(cp_import["AI"].get("speculative", ConfigHandler.default_cfg_ai["speculative"]))
+            top_config.spec_draft_tokens_var.set(cp_import["AI"].get("spec_draft_tokens", ConfigHandler.default_cfg_ai["spec_draft_tokens"]))
+            top_config.spec_draft_path_var.set(cp_import["AI"].get("spec_draft_model_path", ConfigHandler.default_cfg_ai["spec_draft_model_path"]))
+            for key, value in tunable_values(cp_import["AI"]).items():
+                top_config.tunable_vars[key].set(value)
 
             # GUI Settings
             top_config.font_size_var.set(cp_import["GUI"]["font_size"])
@@ -507,6 +866,23 @@ def default_config(top_config):
     top_config.cb_context_mgmt_var.set(ConfigHandler.default_cfg_ai["context_mgmt"])
     top_config.cb_p_template_var.set(ConfigHandler.default_cfg_ai["prompt_template"])
     top_config.cb_llm_stats_var.set(ConfigHandler.default_cfg_ai["llm_stats_enable"])
+    top_config.cb_token_counter_var.set(ConfigHandler.default_cfg_ai["token_counter"])
+    top_config.cb_prompt_cache_var.set(ConfigHandler.default_cfg_ai["prompt_cache"])
+    top_config.prompt_cache_size_var.set(ConfigHandler.default_cfg_ai["prompt_cache_size_mb"])
+    top_config.pool_max_var.set(ConfigHandler.default_cfg_ai["pool_max_models"])
+    top_config.pool_budget_var.set(ConfigHandler.default_cfg_ai["pool_budget_mb"])
+    top_config.pool_pins = ConfigHandler.default_cfg_ai["pool_pin"]
+    top_config.cb_pool_pin_var.set(False)
+    top_config.analysis_workers_var.set(ConfigHandler.default_cfg_ai["analysis_workers"])
+    top_config.cb_log_dedup_var.set(ConfigHandler.default_cfg_ai["log_dedup"])
+    top_config.cb_analysis_cache_var.set(ConfigHandler.default_cfg_ai["analysis_cache"])
+    top_config.analysis_cache_size_var.set(ConfigHandler.default_cfg_ai["analysis_cache_size_mb"])
+    top_config.cb_csv_profile_var.set(ConfigHandler.default_cfg_ai["csv_profile"])
+    top_config.cb_speculative_var.set(ConfigHandler.default_cfg_ai["speculative"])
+    top_config.spec_draft_tokens_var.set(ConfigHandler.default_cfg_ai["spec_draft_tokens"])
+    top_config.spec_draft_path_var.set(ConfigHandler.default_cfg_ai["spec_draft_model_path"])
+    for key, (default, label, allowed) in LLM_TUNABLES.items():
+        top_config.tunable_vars[key].set(default)
 
     # GUI settings in Config window
     top_config.font_size_var.set(ConfigHandler.default_cfg_gui["font_size"])
@@ -525,7 +901,7 @@ def clear_chat():
         chat_box.delete("1.0", END)
         with LlmProcess.lock:
             LlmProcess.llm_status = "Idle"
-        lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
     else:
         chat_box.insert(END, "\n---Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.---\n", "tag_info")
         chat_box.see("end")
@@ -535,7 +911,7 @@ def force_stop(event):
         with LlmProcess.lock:
             LlmProcess.is_running = False
             LlmProcess.llm_status = "Idle"
-        lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+        ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
     else:
         chat_box.insert(END, "\n---Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.---\n", "tag_info")
         chat_box.see("end")
@@ -545,12 +921,75 @@ def reset_memory():
         LlmProcess.is_running = False    
     answer = tk.messagebox.askyesno("Reset Memory", "Are you sure you want to reset memory? Previous conversation memory/context will be gone.")
     if answer:
-        root.msglist = []
+        ChatSession.msglist.clear()
         chat_box.insert(END, "\n---Memory/context has been reset---", "tag_info")
         chat_box.see("end")
     with LlmProcess.lock:
         LlmProcess.llm_status = "Idle"
-    lbl_status_var.set("SOLARIA is: "+LlmProcess.llm_status)
+    ui_bridge.post_status("SOLARIA is: "+LlmProcess.llm_status)
+
+def transcript_segments():
+    # Chat window content as [text, [tags]] segments, so that it can be restored with its formatting
+    segments = []
+    tags = []
+    for key, value, index in chat_box.dump("1.0", "end-1c", text = True, tag = True):
+        match(key):
+            case "tagon":
+                tags.append(value)
+            case "tagoff":
+                if value in tags:
+                    tags.remove(value)
+            case "text":
+                segments.append([value, [tag for tag in tags if tag != "sel"]])
+    return segments
+
+def session_busy():
+    if LlmProcess.is_running == True or not LlmProcess.llm_status.startswith("Idle"):
+        tk.messagebox.showinfo("SOLAIRIA is still busy",  "Please wait till SOLAIRIA is done with the '"+LlmProcess.llm_status+"' phase.")
+        return True
+    return False
+
+def save_session_file():
+    if session_busy():
+        return
+    file_name = fd.asksaveasfilename(initialfile = "session.solairia", defaultextension = ".solairia",
+                                     filetypes=(("SOLAIRIA session", ".solairia"), ("All Files","*.*")), parent=root)
+    if file_name:
+        try:
+            save_session(file_name, LlmProcess.llm, ChatSession.msglist.messages(), transcript_segments(), ChatSession.default_sys_prompt)
+            chat_box.insert(END, "\n---Session saved.---", "tag_info")
+            chat_box.see("end")
+        except:
+            traceback.print_exc()
+            tk.messagebox.showinfo("Error",  "Unable to save the session file.")
+
+def load_session_file():
+    if session_busy():
+        return
+    file_name = fd.askopenfilename(title = "Select a session file", filetypes = (("SOLAIRIA session", ".solairia"), ("All Files","*.*")), parent=root)
+    if not file_name:
+        return
+    try:
+        header, state = load_session(file_name)
+    except:
+        traceback.print_exc()
+        tk.messagebox.showinfo("Error",  "Unable to load the session file. Please try another.")
+        return
+
+    ChatSession.msglist.replace(header["msglist"])
+    chat_box.delete("1.0", END)
+    for text, tags in header["transcript"]:
+        chat_box.insert(END, text, tuple(tags))
+
+    if can_restore_state(header, state, LlmProcess.llm, ChatSession.default_sys_prompt):
+        # Same LLM, context size, prompt template and personality, so the saved KV state is used as-is without any prompt evaluation
+        LlmProcess.llm.load_state(state)
+        chat_box.insert(END, "\n---Session loaded.---", "tag_info")
+    else:
+        chat_box.insert(END, "\n---Session loaded. LLM, Context Size, Prompt Template or Personality differs from the saved session, "
+                        +"so the conversation will be re-processed.---", "tag_info")
+        thread_replay_history()
+    chat_box.see("end")
 
 # Create Tkinter object 
 root = tk.Tk()
@@ -560,7 +999,6 @@ Grid.columnconfigure(root, 0, weight=1)
 
 with LlmProcess.lock:
     LlmProcess.is_running = False
-root.msglist = []
 
 # Create GUI variables in root object
 root.BG_GREY = ConfigHandler.cp["GUI"]["bg_grey"]
@@ -574,24 +1012,17 @@ root.FONT_BOLD = root.FONT + ("bold",)
 root.MENU_FONT = ("Verdana", 11)
 root.MENU_FONT_BOLD = ("Verdana", 11, "bold")
 
-# Formula for context character limit
-# 1 token = ~4 to 4.5 characters
-# This helps inform User if their prompts are too long in terms of characters, since informing with token count is not easily understood and remedied.
-root.context_char_limit = int(ConfigHandler.cp["AI"]["context_size"])*4
-
-# Formulas for personality and prompt limit
-# Context size allocation: 0.1 to personality, 0.2 to my_prompt (user prompt), 0.25 to output (set in generate_text_from_prompt() function). Remaining in prev_prompts and buffer.
-# This gives buffer for summarisation to keep within context_size.
-root.personality_limit = int(root.context_char_limit*0.1)
-root.my_prompt_limit = int(root.context_char_limit*0.2)
-
 # Create a menu bar
 menu_bar = Menu(root)
 root.config(menu = menu_bar)
 
 # File menu
 file_menu = Menu(menu_bar, tearoff = False)
+file_menu.add_command(label = "Save session", command = save_session_file)
+file_menu.add_command(label = "Load session", command = load_session_file)
 file_menu.add_command(label = "Export chat log", command = lambda: export_chat(root, chat_box.get("1.0", END)))
+file_menu.add_command(label = "Follow log file", command = lambda: evt_send(None, "/follow"))   # Runs follow_log_file() in the 'Send' thread
+file_menu.add_command(label = "Tune performance", command = lambda: evt_send(None, "/tune"))    # Runs auto_tuner in the 'Send' thread
 file_menu.add_separator()
 file_menu.add_command(label = "Exit", command = close_app)
 menu_bar.add_cascade(label = "File", menu = file_menu)
@@ -641,6 +1072,17 @@ lbl_llm_name_var = tk.StringVar()
 lbl_llm_name_var.set("LLM Loaded: None")
 lbl_llm_name = Label(frame_status, textvariable = lbl_llm_name_var, borderwidth=2, relief="ridge", anchor = "w")
 lbl_llm_name.grid(row = 1, column = 0, columnspan = 4, sticky = "we")
+# LLM loading progress. Only shown while an LLM is being loaded.
+frame_load = tk.Frame(frame_status)
+frame_load.columnconfigure(0, weight=1)
+load_progress_var = tk.IntVar()
+load_progress = ttk.Progressbar(frame_load, variable = load_progress_var, maximum = 100, mode = "determinate")
+load_progress.grid(row = 0, column = 0, sticky = "we")
+btn_cancel_load = Button(frame_load, text = "Cancel", font = root.MENU_FONT, bg = root.BG_GREY, command = cancel_load_model)
+btn_cancel_load.grid(row = 0, column = 1, sticky = "e")
+Hovertip(btn_cancel_load, "Cancels loading of the LLM.")
+frame_load.grid(row = 2, column = 0, columnspan = 4, sticky = "we")
+frame_load.grid_remove()
 frame_status.grid(row=0, columnspan = 2, sticky = "we")
 
 # Main chat message box
@@ -685,10 +1127,11 @@ Hovertip(btn_send, "Sends your message, which will be processed offline "
 lbl_input_counter = Label(root, text = "Total characters: 0")
 lbl_input_counter.grid(row=4, sticky = "w")
 
-# Load model, and if unable to load successfully, open the config window
-if not load_model(ConfigHandler.cp["AI"]["model_path"], ConfigHandler.cp["AI"]["context_size"], ConfigHandler.cp["AI"]["prompt_template"]):
-    open_config()
+# Start draining chat/status updates posted by worker threads
+ui_bridge.start(root, chat_box, lbl_status_var)
 
-# Set llm.verbose parameter if LLM object is not None
-if LlmProcess.llm is not None:
-    LlmProcess.llm.verbose = ast.literal_eval(ConfigHandler.cp["AI"]["llm_stats_enable"])    # Turns on or off display of LLM stats
+# Load model in the background, and if unable to load successfully, open the config window
+if not load_model(ConfigHandler.cp["AI"]["model_path"], ConfigHandler.cp["AI"]["context_size"], ConfigHandler.cp["AI"]["prompt_template"],
+                  lambda success: [startup_timer.model_ready(success), None if success else open_config()]):
+    startup_timer.model_ready(False)
+    open_config()
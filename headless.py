@@ -0,0 +1,266 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import sys, json, time, argparse, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# From custom modules
+from config_handler import ConfigHandler
+import ui_bridge
+import tokenizer_service
+from chat_session import ChatSession
+import core_funcs
+from core_funcs import LlmProcess
+import session_engine
+
+# Runs SOLAIRIA without the Tk window (e.g. on servers or in cron), with the LLM and settings in config.ini:
+#   python main.py --headless [--manifest jobs.jsonl] [--jsonl] [--fresh] [--sessions]
+# Jobs are read from the manifest, or from stdin if there is none. Each line is one job:
+# - JSON: {"prompt": "..."} or {"file": "path"}, with optional "id" and "reset" (true to reset memory before the job)
+# - Text: a prompt, "/f <path>" to analyse a file, or "/r" to reset memory
+# Replies are streamed to stdout as text, or written as one JSON object per job with --jsonl.
+# With --sessions, each JSON job can name a "session" (and its "personality" on its first job). Every session has its own
+# chat history, and different sessions are replied to at the same time on session_slots contexts of the LLM (see session_engine).
+# Jobs of the same session still run in order. Replies are written whole as each one completes, as they would otherwise interleave.
+# Everything else (status, info messages, LLM loading and stats) goes to stderr.
+
+class HeadlessSink:
+    # Receives the updates that ui_bridge would otherwise post to the Tk window
+    def __init__(self, out, stream):
+        self.out = out
+        self.stream = stream    # True to write replies to out as they are generated
+        self.lock = threading.Lock()    # Parallel file analysis posts from worker threads
+        self.text = []  # Reply of the current job
+        self.notes = [] # Info messages and errors of the current job
+        self.last_status = None
+
+    def chat(self, text, tag = None):
+        with self.lock:
+            if tag == "tag_info":
+                note = text.strip("\n -")
+                self.notes.append(note)
+                print(note, file = sys.stderr)
+                return
+            if text == "\nAsst -> ":
+                return  # Label of the reply in the chat window, not part of it
+            self.text.append(text)
+            if self.stream:
+                self.out.write(text)
+                self.out.flush()
+
+    def status(self, text):
+        with self.lock:
+            if text != self.last_status:
+                self.last_status = text
+                print(text, file = sys.stderr)
+
+    def error(self, title, text):
+        with self.lock:
+            self.notes.append(title+": "+text)
+            print(title+": "+text, file = sys.stderr)
+
+    def take(self):
+        # Returns (reply, notes) of the current job, and starts collecting the next one
+        with self.lock:
+            reply = "".join(self.text).strip()
+            notes = self.notes
+            self.text = []
+            self.notes = []
+        return reply, notes
+
+def read_jobs(lines):
+    for line_number, line in enumerate(lines, start = 1):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if line.lstrip().startswith("{"):
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                job = {"error": "Line "+str(line_number)+" is not valid JSON: "+str(e)}
+        elif line.startswith("/f "):
+            job = {"file": line[3:].strip()}
+        elif line.strip() == "/r":
+            job = {"reset": True}
+        else:
+            job = {"prompt": line}
+        job.setdefault("id", line_number)
+        yield job
+
+def load_llm():
+    # Loads the LLM set in config.ini and sets the personality. Returns False if either failed.
+    llm_path = ConfigHandler.cp["AI"]["model_path"]
+    if not llm_path.endswith(".gguf"):
+        print("No LLM file (.gguf format) is set in config.ini (model_path). Set one in the Config window first.", file = sys.stderr)
+        return False
+    loaded = []
+    done = threading.Event()
+    if not core_funcs.load_model(llm_path, ConfigHandler.cp["AI"]["context_size"], ConfigHandler.cp["AI"]["prompt_template"],
+                                 lambda success: [loaded.append(success), done.set()]):
+        return False
+    done.wait()
+    if not loaded[0]:
+        return False
+    core_funcs.set_personality()
+    if ChatSession.default_sys_prompt is None:
+        return False
+    if LlmProcess.snapshot_thread is not None:
+        LlmProcess.snapshot_thread.join()   # The LLM must not be used by a prompt while the personality is being evaluated
+    return True
+
+def run_job(job, sink, fresh):
+    # Runs one job through send(), the same as the 'Send' thread of the GUI, and returns its result
+    result = {"id": job["id"]}
+    if "error" in job:
+        result.update({"type": "invalid", "status": "error", "notes": [job["error"]]})
+        return result
+    if fresh or job.get("reset"):
+        ChatSession.msglist.clear()
+    if "prompt" in job:
+        result.update({"type": "prompt", "input": job["prompt"]})
+        msg = job["prompt"]
+        if len(msg) > ChatSession.my_prompt_limit:
+            result.update({"status": "error", "notes": ["Prompt is "+str(len(msg))+" characters long. Please keep within "
+                                                        +str(ChatSession.my_prompt_limit)+" characters."]})
+            return result
+    elif "file" in job:
+        result.update({"type": "file", "input": job["file"]})
+        msg = "/f "+job["file"]
+    else:
+        result.update({"type": "reset", "status": "ok"})
+        return result
+
+    start_time = time.perf_counter()
+    try:
+        if core_funcs.send(msg) == False:
+            core_funcs.send(msg)    # Context/memory was compressed first, so the prompt still needs a reply
+    except:
+        traceback.print_exc()
+        with LlmProcess.lock:
+            LlmProcess.is_running = False
+            LlmProcess.llm_status = "Idle"
+    wall_time = time.perf_counter() - start_time
+    reply, notes = sink.take()
+    tokens = tokenizer_service.count_tokens(reply) if reply else 0  # Generated text, counted with the LLM's own tokenizer
+    result.update({"status": "ok" if reply else "error", "output": reply, "notes": notes, "wall_s": round(wall_time, 3),
+                   "tokens": tokens, "tokens_per_s": round(tokens/wall_time, 2) if wall_time > 0 else 0.0})
+    return result
+
+def run_session_job(job, fresh):
+    # Runs one job of a session through session_engine, and returns its result
+    result = {"id": job["id"], "session": str(job.get("session", "default"))}
+    if "error" in job:
+        result.update({"type": "invalid", "status": "error", "notes": [job["error"]]})
+        return result
+    session_engine.get_session(result["session"], personality = job.get("personality", ""))
+    if fresh or job.get("reset"):
+        session_engine.reset_session(result["session"])
+    if "file" in job:
+        result.update({"type": "file", "input": job["file"], "status": "error",
+                       "notes": ["Files are analysed with the chat window's LLM context. Run file jobs without --sessions."]})
+        return result
+    if "prompt" not in job:
+        result.update({"type": "reset", "status": "ok"})
+        return result
+    result.update({"type": "prompt", "input": job["prompt"]})
+    if len(job["prompt"]) > ChatSession.my_prompt_limit:
+        result.update({"status": "error", "notes": ["Prompt is "+str(len(job["prompt"]))+" characters long. Please keep within "
+                                                    +str(ChatSession.my_prompt_limit)+" characters."]})
+        return result
+    reply = session_engine.chat(result["session"], job["prompt"])
+    result.update({"status": "ok" if reply["reply"].strip() else "error", "output": reply["reply"].strip(), "notes": reply["notes"],
+                   "wall_s": reply["seconds"], "tokens": reply["tokens"], "slot": reply["slot"],
+                   "tokens_per_s": round(reply["tokens"]/reply["seconds"], 2) if reply["seconds"] > 0 else 0.0})
+    return result
+
+def run_sessions(jobs, out, args):
+    # Runs the jobs of each session in order, with different sessions in parallel. Returns (wall time, tokens, failed jobs).
+    sessions = {}
+    for job in jobs:
+        sessions.setdefault(str(job.get("session", "default")), []).append(job)
+    out_lock = threading.Lock()
+    totals = {"tokens": 0, "failed": 0}
+
+    def run_session(session_jobs):
+        for job in session_jobs:
+            try:
+                result = run_session_job(job, args.fresh)
+            except:
+                traceback.print_exc()
+                result = {"id": job["id"], "session": str(job.get("session", "default")), "status": "error", "notes": ["Job failed. See the console for details."]}
+            with out_lock:
+                if result["status"] != "ok":
+                    totals["failed"] += 1
+                totals["tokens"] += result.get("tokens", 0)
+                if args.jsonl:
+                    out.write(json.dumps(result, ensure_ascii = False)+"\n")
+                elif "output" in result:
+                    out.write("["+result["session"]+"] "+result["output"]+"\n")
+                out.flush()
+                if "wall_s" in result:
+                    print("[Job "+str(result["id"])+", session "+result["session"]+", slot "+str(result["slot"])+"] "+result["status"]+", "
+                          +str(result["wall_s"])+"s, "+str(result["tokens"])+" tokens, "+str(result["tokens_per_s"])+" tokens/s", file = sys.stderr)
+                for note in result.get("notes", []):
+                    print(note, file = sys.stderr)
+
+    if not session_engine.start():
+        return 0.0, 0, len(jobs)
+    start_time = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers = max(1, len(sessions))) as executor:
+            list(executor.map(run_session, sessions.values()))
+    finally:
+        session_engine.stop()
+    return time.perf_counter() - start_time, totals["tokens"], totals["failed"]
+
+def main(argv, out):
+    # out is the real stdout. main.py points sys.stdout at stderr before importing this module, so only results are written to out.
+    parser = argparse.ArgumentParser(prog = "main.py --headless", description = "Run prompts and file analyses without the SOLAIRIA window.")
+    parser.add_argument("--headless", action = "store_true")
+    parser.add_argument("--manifest", help = "File of jobs (JSONL or text lines). Jobs are read from stdin if not set.")
+    parser.add_argument("--jsonl", action = "store_true", help = "Write one JSON result per job, instead of streaming replies as text.")
+    parser.add_argument("--fresh", action = "store_true", help = "Reset memory before every job, so jobs do not share chat history.")
+    parser.add_argument("--sessions", action = "store_true", help = "Give each \"session\" of the jobs its own chat history, and reply to sessions in parallel.")
+    args, _ = parser.parse_known_args(argv) # Other arguments (e.g. --startup-report) are for other parts of SOLAIRIA
+
+    sink = HeadlessSink(out, stream = not args.jsonl)
+    ui_bridge.set_sink(sink)
+    with LlmProcess.lock:
+        LlmProcess.is_running = False
+    if not load_llm():
+        return 2
+
+    total_time = 0.0
+    total_tokens = 0
+    failed = 0
+    manifest = open(args.manifest, "r", encoding = "utf-8") if args.manifest else sys.stdin
+    try:
+        if args.sessions:
+            # Sessions are grouped before running, so all jobs are read first
+            total_time, total_tokens, failed = run_sessions(list(read_jobs(manifest)), out, args)
+        else:
+            for job in read_jobs(manifest):
+                result = run_job(job, sink, args.fresh)
+                if result["status"] != "ok":
+                    failed += 1
+                total_time += result.get("wall_s", 0.0)
+                total_tokens += result.get("tokens", 0)
+                if args.jsonl:
+                    out.write(json.dumps(result, ensure_ascii = False)+"\n")
+                else:
+                    out.write("\n")
+                out.flush()
+                if "wall_s" in result:
+                    print("[Job "+str(result["id"])+"] "+result["status"]+", "+str(result["wall_s"])+"s, "+str(result["tokens"])+" tokens, "
+                          +str(result["tokens_per_s"])+" tokens/s", file = sys.stderr)
+    finally:
+        if manifest is not sys.stdin:
+            manifest.close()
+    if total_time > 0:
+        print("All jobs"+(" (wall time, over all sessions)" if args.sessions else "")+": "+str(round(total_time, 3))+"s, "+str(total_tokens)+" tokens, "+str(round(total_tokens/total_time, 2))+" tokens/s"
+              +(", "+str(failed)+" failed" if failed else ""), file = sys.stderr)
+    import speculative  # Already loaded along with the LLM
+    if speculative.stats_text():
+        print(speculative.stats_text(), file = sys.stderr)
+    return 1 if failed else 0
@@ -0,0 +1,108 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, json, hashlib, threading, traceback
+
+# From custom modules
+from config_handler import ConfigHandler
+import file_reader
+
+HEAD_BYTES = 4096   # Size of the start of a file that is hashed, to tell a file that was replaced or truncated and regrown
+
+class FollowState:
+    # Where each followed file was read up to, kept in cache/follow_state.json so following can resume after a restart.
+    # Path of file: {"device", "inode", "offset" (byte after the last line read), "line" (last line read), "head", "head_size", "summary"}
+    lock = threading.Lock()
+    states = None   # Loaded from disk on first use
+
+def state_path():
+    return os.path.join(ConfigHandler.dirname, "cache", "follow_state.json")
+
+def load_states():
+    with FollowState.lock:
+        if FollowState.states is None:
+            try:
+                with open(state_path(), "r", encoding = "utf-8") as state_file:
+                    FollowState.states = json.load(state_file)
+            except FileNotFoundError:
+                FollowState.states = {}
+            except:
+                traceback.print_exc()
+                FollowState.states = {}
+        return FollowState.states
+
+def save_states():
+    with FollowState.lock:
+        path = state_path()
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        tmp_path = path+".tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as state_file:
+            json.dump(FollowState.states, state_file)
+        os.replace(tmp_path, path)  # Replace only once fully written, so a half-written file is never read
+
+def get_state(path):
+    return load_states().get(os.path.abspath(path))
+
+def poll_interval():
+    return max(1.0, float(ConfigHandler.cp["AI"]["follow_interval_s"]))
+
+def head_hash(path, size):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read(size)).hexdigest()
+
+def find_rotated(path, device, inode):
+    # Returns the file that path was rotated to (e.g. app.log.1 or app.log-20240118), found by its device and inode, or None
+    folder = os.path.dirname(os.path.abspath(path))
+    name = os.path.basename(path)
+    try:
+        for entry in os.scandir(folder):
+            if entry.name != name and entry.name.startswith(name) and entry.is_file():
+                stat = entry.stat()
+                if stat.st_dev == device and stat.st_ino == inode:
+                    return entry.path
+    except OSError:
+        traceback.print_exc()
+    return None
+
+def segment(path, start, first_line, note):
+    # Part of a file to read: from byte start (line first_line) to the end of its last complete line. None if there are no new lines.
+    stat = os.stat(path)
+    with file_reader.FileReader(path) as reader:
+        start = max(start, reader.bom_size)
+        end = reader.last_line_end(start)
+    if end <= start:
+        return None
+    return {"path": path, "device": stat.st_dev, "inode": stat.st_ino, "start": start, "end": end, "first_line": first_line, "note": note}
+
+def pending_segments(path):
+    # Returns the segments of new lines since path was last read, in the order they should be read.
+    # - Not followed before: the whole file.
+    # - Rotated (path is a different file now): the rest of the old file if it can still be found, then the new file from its first line.
+    # - Truncated or replaced in place (smaller than before, or its first bytes changed): the whole file again.
+    # - Appended: only the new lines. A last line without a newline is left until it is complete.
+    state = get_state(path)
+    stat = os.stat(path)
+    if state is None:
+        segments = [segment(path, 0, 1, None)]
+    elif (stat.st_dev, stat.st_ino) != (state["device"], state["inode"]):
+        segments = []
+        rotated_path = find_rotated(path, state["device"], state["inode"])
+        if rotated_path is not None:
+            segments.append(segment(rotated_path, state["offset"], state["line"] + 1,
+                                    os.path.basename(path)+" was rotated to "+os.path.basename(rotated_path)+". Reading its last new lines first."))
+        segments.append(segment(path, 0, 1, os.path.basename(path)+" was rotated. Following the new file from its first line."))
+    elif stat.st_size < state["offset"] or head_hash(path, state["head_size"]) != state["head"]:
+        segments = [segment(path, 0, 1, os.path.basename(path)+" was truncated or replaced. Following it again from its first line.")]
+    else:
+        segments = [segment(path, state["offset"], state["line"] + 1, None)]
+    return [follow_segment for follow_segment in segments if follow_segment is not None]
+
+def advance(path, follow_segment, last_line, summary):
+    # Records that follow_segment of path was read up to its end (line last_line), with the rolling summary so far
+    head_size = min(HEAD_BYTES, follow_segment["end"])
+    load_states()[os.path.abspath(path)] = {"device": follow_segment["device"], "inode": follow_segment["inode"],
+                                            "offset": follow_segment["end"], "line": last_line,
+                                            "head": head_hash(follow_segment["path"], head_size), "head_size": head_size,
+                                            "summary": summary}
+    save_states()
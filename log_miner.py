@@ -0,0 +1,96 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import re
+
+# Variable parts of log lines, replaced with <*> before lines are grouped into templates (most specific patterns first)
+VARIABLE_PATTERNS = re.compile("|".join([
+    r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?",   # ISO-8601 timestamp
+    r"\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b", # Time
+    r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b",  # UUID
+    r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b",    # IPv4 address (and port)
+    r"\b0[xX][0-9a-fA-F]+\b",   # Hex number
+    r"\b(?=[0-9a-fA-F]*\d)(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{8,}\b",  # Hex ID of 8+ characters (e.g. hashes)
+    r"[-+]?\d+(?:\.\d+)?",  # Number
+]))
+WILDCARD = "<*>"
+
+class LogTemplateMiner:
+    # Groups log lines into templates in the style of Drain (He et al., 2017): lines are grouped by token count and first token,
+    # then matched to the most similar template in that group. Tokens that differ between lines of a template become <*>.
+    # records() collapses each block of lines into one record per template, so repeated lines are sent to the LLM only once.
+    def __init__(self, similarity = 0.5, block_chars = 16000):
+        self.similarity = similarity    # Fraction of tokens that must match for a line to join a template
+        self.block_chars = block_chars  # Characters of records per block (about one chunk). Records keep line ranges within their block
+        self.groups = {}    # (token count, first token): list of templates, each a list of tokens
+        self.lines_in = 0
+        self.chars_in = 0
+        self.chars_out = 0
+
+    def template_for(self, line):
+        # Returns the template (list of tokens) that line belongs to, adding or generalising a template if needed
+        tokens = VARIABLE_PATTERNS.sub(WILDCARD, line).split()
+        first_token = tokens[0] if tokens and WILDCARD not in tokens[0] else WILDCARD
+        templates = self.groups.setdefault((len(tokens), first_token), [])
+
+        best_template = None
+        best_score = -1.0
+        for template in templates:
+            constant_tokens = sum(1 for token in template if token != WILDCARD)
+            same_tokens = sum(1 for template_token, token in zip(template, tokens) if template_token == token and token != WILDCARD)
+            score = same_tokens / constant_tokens if constant_tokens else 1.0
+            if score > best_score:
+                best_template, best_score = template, score
+        if best_template is None or best_score < self.similarity:
+            best_template = tokens
+            templates.append(best_template)
+        else:
+            for position, (template_token, token) in enumerate(zip(best_template, tokens)):
+                if template_token != token:
+                    best_template[position] = WILDCARD
+        return best_template
+
+    def records(self, lines):
+        # Takes (line number, text) pairs and yields (first line number, last line number, text) records in blocks.
+        # A block is flushed once its records add up to block_chars, so each block fills about one chunk and chunks are still
+        # handed to analysis while the rest of the file is read, however repetitive the lines are.
+        # A template seen once in a block is kept as its original line. Repeats become "Ln first-last xcount: template",
+        # followed by the first and last of the lines, so that their actual values are analysed too.
+        block = {}  # id of template: [template, first line number, last line number, count, first line's text, last line's text, record size]
+        block_chars = 0 # Characters of the block's records, roughly
+        for line_number, text in lines:
+            self.lines_in += 1
+            self.chars_in += len(text)
+            if text.strip():
+                template = self.template_for(text)
+                record = block.get(id(template))
+                if record is None:
+                    record = block[id(template)] = [template, line_number, line_number, 1, text, text, 0]
+                else:
+                    record[2] = line_number
+                    record[3] += 1
+                    record[5] = text
+                size = len(record[4]) + (len(record[5]) + len(text) + 30 if record[3] > 1 else 10)  # Template is about as long as a line
+                block_chars += size - record[6]
+                record[6] = size
+            if block_chars >= self.block_chars:
+                yield from self.flush(block)
+                block = {}
+                block_chars = 0
+        yield from self.flush(block)
+
+    def flush(self, block):
+        for template, first, last, count, first_text, last_text, size in sorted(block.values(), key = lambda record: record[1]):
+            if count == 1:
+                record_text = "Ln "+str(first)+": "+first_text.rstrip("\n")+"\n"
+            else:
+                record_text = ("Ln "+str(first)+"-"+str(last)+" x"+str(count)+": "+" ".join(template)+"\n"
+                               +"  First: "+first_text.rstrip("\n")+"\n"
+                               +"  Last: "+last_text.rstrip("\n")+"\n")
+            self.chars_out += len(record_text)
+            yield first, last, record_text
+
+    def reduction(self):
+        # How many times smaller the records are than the original lines (by characters, which roughly follows tokens)
+        return self.chars_in / self.chars_out if self.chars_out else 1.0
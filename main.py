@@ -1,10 +1,44 @@
 # SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
 # First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
 
-version = "2.0.3"
+# From built-in libraries
+import sys
 
 # From custom modules
-import gui
+import startup_timer    # Imported first so that startup time is measured from here
+
+if "--headless" in sys.argv:
+    # Runs prompts and file analyses without the Tk window (see headless.py). Results are written to stdout, so everything else
+    # that is printed (config.ini checks, LLM loading, LLM stats) is sent to stderr instead.
+    results_out = sys.stdout
+    sys.stdout = sys.stderr
+    import headless
+    sys.exit(headless.main(sys.argv[1:], results_out))
+
+if "--benchmark" in sys.argv:
+    # Measures the chat, summary and file analysis paths on fixed corpora, and writes the results as JSON (see benchmark.py).
+    # As with --headless, results go to stdout and everything else that is printed goes to stderr.
+    results_out = sys.stdout
+    sys.stdout = sys.stderr
+    import benchmark
+    sys.exit(benchmark.main(sys.argv[1:], results_out))
+
+if "--tune" in sys.argv:
+    # Finds the fastest thread counts and batch size for the LLM in config.ini on this computer, and saves them (see auto_tuner.py)
+    import auto_tuner
+    sys.exit(auto_tuner.main(sys.argv[1:]))
+
+if "--serve" in sys.argv:
+    # Serves the LLM to other programs on this computer with an OpenAI-compatible API, without the Tk window (see api_server.py)
+    import api_server
+    sys.exit(api_server.main(sys.argv[1:]))
+
+# Import custom modules leaf-first, so the startup report shows each module's own import time.
+# Heavy native libraries (llama_cpp, numpy, sentencepiece) are not imported here. They are loaded on demand, e.g. when the LLM is loaded.
+for module_name in ["config_handler", "tokenizer_service", "context_window", "chat_session", "ui_bridge", "model_loader", "state_store",
+                    "session_store", "menu_funcs", "core_funcs"]:
+    startup_timer.timed_import(module_name)
+gui = startup_timer.timed_import("gui")    # Creates the window and starts loading the LLM in the background
 from core_funcs import set_personality
 
 if __name__ == "__main__":
@@ -12,4 +46,5 @@ if __name__ == "__main__":
 
     gui.root.protocol("WM_DELETE_WINDOW", gui.close_app)
     gui.txt_user.focus_force()
+    gui.root.after(0, lambda: [gui.root.update_idletasks(), startup_timer.window_shown()])  # Runs once the main loop has started and the window is drawn
     gui.root.mainloop()
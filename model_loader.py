@@ -0,0 +1,60 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import threading, traceback
+from contextlib import contextmanager
+
+# From custom modules
+from config_handler import ConfigHandler, LLM_TUNABLES, tunable_values
+
+class ModelLoader:
+    lock = threading.Lock() # Only one LLM is loaded at a time, as the progress callback is attached through a module-level function
+
+def llama_kwargs(tunables = None, keys = None):
+    # Llama() arguments for the performance tunables (config.ini's if tunables is None). keys limits them to some of the tunables.
+    import llama_cpp    # Imported here so that llama_cpp is only loaded when an LLM is loaded
+    if tunables is None:
+        tunables = tunable_values(ConfigHandler.cp["AI"])
+    kwargs = {}
+    for key, value in tunables.items():
+        if keys is not None and key not in keys:
+            continue
+        if key in ("type_k", "type_v"):
+            kwargs[key] = getattr(llama_cpp, "GGML_TYPE_"+value.upper())   # e.g. q8_0 = llama_cpp.GGML_TYPE_Q8_0
+        elif isinstance(LLM_TUNABLES[key][2], list):
+            kwargs[key] = value == "True"
+        elif key in ("n_threads", "n_threads_batch") and int(value) == 0:
+            continue    # Leave it to llama.cpp
+        else:
+            kwargs[key] = int(value)
+    return kwargs
+
+@contextmanager
+def progress_callback(on_progress):
+    # Reports llama.cpp's model loading progress to on_progress(progress), where progress is 0.0 to 1.0.
+    # If on_progress() returns False, llama.cpp aborts loading and Llama() raises ValueError.
+    # Llama() has no progress_callback argument, so the default model params that it starts from are wrapped while loading.
+    import llama_cpp.llama_cpp as llama_cpp_lib  # Imported here so that llama_cpp is only loaded when an LLM is loaded
+
+    def report(progress, user_data):
+        try:
+            return bool(on_progress(progress))
+        except:
+            traceback.print_exc()
+            return True
+
+    c_callback = llama_cpp_lib.llama_progress_callback(report)   # Reference kept until loading is done, so it is not garbage collected
+    default_params = llama_cpp_lib.llama_model_default_params
+
+    def params_with_progress():
+        params = default_params()
+        params.progress_callback = c_callback
+        return params
+
+    with ModelLoader.lock:
+        llama_cpp_lib.llama_model_default_params = params_with_progress
+        try:
+            yield
+        finally:
+            llama_cpp_lib.llama_model_default_params = default_params
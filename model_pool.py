@@ -0,0 +1,130 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, threading, traceback
+from collections import OrderedDict
+
+# From custom modules
+from config_handler import ConfigHandler, tunable_values, model_tunables, speculative_settings
+
+KV_BYTES = {"f16": 2.0, "q8_0": 34/32, "q4_0": 18/32}   # Bytes per K or V value in the KV cache, for each cache type (q8_0/q4_0 blocks of 32 values)
+
+class ModelPool:
+    # Loaded LLMs that are kept resident, so switching back to one of them does not need it to be loaded again.
+    # Limited by pool_max_models and pool_budget_mb in config.ini. Least recently used LLMs are unloaded first,
+    # except LLMs listed in pool_pin, which stay loaded once they have been loaded.
+    lock = threading.Lock()
+    models = OrderedDict()  # Pool key: [Llama object, estimated size in bytes], least recently used first
+
+def pool_key(llm_path, ct_size, prompt_template, tunables = None):
+    # An LLM can only be reused with the same context size, prompt template, performance tunables and speculative decoding
+    # settings it was loaded with. tunables = None for those set in config.ini for llm_path (see config_handler.model_tunables()).
+    if tunables is None:
+        tunables = model_tunables(llm_path)
+    return (os.path.abspath(llm_path), int(ct_size), prompt_template, tuple(sorted(tunables.items())), speculative_settings(ConfigHandler.cp["AI"]))
+
+def pinned_paths(pins = None):
+    # pool_pin holds the paths of pinned LLMs, separated by "|"
+    if pins is None:
+        pins = ConfigHandler.cp["AI"]["pool_pin"]
+    return {os.path.abspath(path) for path in pins.split("|") if path.strip()}
+
+def is_pinned(pins, llm_path):
+    return len(llm_path.strip()) > 0 and os.path.abspath(llm_path) in pinned_paths(pins)
+
+def update_pins(pins, llm_path, pin):
+    # Returns pins with llm_path added (pin = True) or removed (pin = False)
+    paths = [path for path in pins.split("|") if path.strip() and os.path.abspath(path) != os.path.abspath(llm_path)]
+    if pin and len(llm_path.strip()) > 0:
+        paths.append(llm_path)
+    return "|".join(paths)
+
+def max_models():
+    return max(1, int(ConfigHandler.cp["AI"]["pool_max_models"]))
+
+def budget_bytes():
+    return int(ConfigHandler.cp["AI"]["pool_budget_mb"]) << 20   # 0 = no memory budget, only pool_max_models applies
+
+def estimate_bytes(llm_path, ct_size, llm = None, tunables = None):
+    # Weights (size of the .gguf file) + KV cache (K and V of type_k/type_v for every layer and context position).
+    # The KV cache needs the LLM's metadata, so it is only added once the LLM is loaded.
+    if tunables is None:
+        tunables = tunable_values(ConfigHandler.cp["AI"])
+    size = os.path.getsize(llm_path)
+    if llm is not None:
+        try:
+            arch = llm.metadata["general.architecture"]
+            n_layer = int(llm.metadata[arch+".block_count"])
+            n_embd = int(llm.metadata[arch+".embedding_length"])
+            n_head = int(llm.metadata[arch+".attention.head_count"])
+            n_head_kv = int(llm.metadata.get(arch+".attention.head_count_kv", n_head))
+            size += int(n_layer * int(ct_size) * (n_embd * n_head_kv // n_head) * (KV_BYTES[tunables["type_k"]] + KV_BYTES[tunables["type_v"]]))
+        except (KeyError, ValueError, ZeroDivisionError):
+            pass
+    return size
+
+def get(key):
+    # Returns the resident LLM for key and marks it as most recently used, or None if it is not resident
+    with ModelPool.lock:
+        if key not in ModelPool.models:
+            return None
+        ModelPool.models.move_to_end(key)
+        return ModelPool.models[key][0]
+
+def add(key, llm):
+    with ModelPool.lock:
+        ModelPool.models[key] = [llm, estimate_bytes(key[0], key[1], llm, dict(key[3]))]
+        ModelPool.models.move_to_end(key)
+    make_room(0, keep = key)
+
+def tunables_of(llm):
+    # Performance tunables that a resident LLM was loaded with (part of its pool key), or None if it is not in the pool
+    with ModelPool.lock:
+        for key, (model, size) in ModelPool.models.items():
+            if model is llm:
+                return dict(key[3])
+    return None
+
+def rekey(llm, key):
+    # Keeps a resident LLM under a new key, e.g. once auto_tuner has tuned it while loaded
+    with ModelPool.lock:
+        for old_key, (model, size) in list(ModelPool.models.items()):
+            if model is llm:
+                del ModelPool.models[old_key]
+                ModelPool.models[key] = [model, size]
+
+def make_room(incoming_bytes, keep = None):
+    # Unloads least recently used LLMs until another LLM of incoming_bytes fits (incoming_bytes = 0 to only enforce the limits).
+    # Pinned LLMs and keep are never unloaded, so the pool may go over its limits if they alone exceed them.
+    incoming = 1 if incoming_bytes else 0
+    pinned = pinned_paths()
+    with ModelPool.lock:
+        for key in list(ModelPool.models.keys()):
+            total_bytes = sum(size for llm, size in ModelPool.models.values())
+            over_count = len(ModelPool.models) + incoming > max_models()
+            over_budget = budget_bytes() > 0 and total_bytes + incoming_bytes > budget_bytes()
+            if not over_count and not over_budget:
+                break
+            if key != keep and key[0] not in pinned:
+                unload(key)
+
+def unload(key):
+    # ModelPool.lock must be held by the caller
+    llm = ModelPool.models.pop(key)[0]
+    print("Unloading LLM from model pool: "+os.path.basename(key[0]))
+    try:
+        llm.close()  # Frees the model weights and KV cache now, instead of whenever the object is garbage collected
+    except:
+        traceback.print_exc()
+
+def release_unpinned():
+    pinned = pinned_paths()
+    with ModelPool.lock:
+        for key in list(ModelPool.models.keys()):
+            if key[0] not in pinned:
+                unload(key)
+
+def resident_names():
+    with ModelPool.lock:
+        return [os.path.basename(key[0]) for key in ModelPool.models.keys()]
@@ -0,0 +1,99 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, queue, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# From custom modules
+from config_handler import ConfigHandler
+import config_handler
+import model_loader
+import model_pool
+
+def worker_count():
+    return max(1, int(ConfigHandler.cp["AI"]["analysis_workers"]))
+
+def create_worker_llms(llm, count):
+    # Creates count extra contexts of the loaded LLM for analysing parts of a file at the same time.
+    # Workers are loaded with the LLM's own GPU Layers and KV on GPU tunables, with the CPU cores split evenly between them.
+    # llama.cpp memory-maps the .gguf file, so the layers kept on the CPU are shared through the OS page cache and each worker
+    # only adds its own KV cache to RAM. Layers offloaded to the GPU are not shared, so each worker needs its own copy in VRAM.
+    # With prompt_lookup speculative decoding, each worker gets its own draft model (see speculative.py).
+    from llama_cpp import Llama # Imported here so that llama_cpp is only loaded when an LLM is loaded
+    import speculative
+    chat_format = None if llm.chat_format == "chat_template.default" else llm.chat_format  # None auto-detects the same template again
+    n_threads = max(1, (os.cpu_count() or 1) // count)
+    tunables = model_pool.tunables_of(llm)  # The tunables the LLM was actually loaded with, which config.ini may no longer have
+    if tunables is None:
+        tunables = config_handler.model_tunables(llm.model_path)
+
+    def create(worker_index):
+        return Llama(model_path = llm.model_path, n_ctx = llm.n_ctx(), use_mmap = True,
+                     n_threads = n_threads, n_threads_batch = n_threads, chat_format = chat_format,
+                     kv_overrides = {"add_bos_token":False}, verbose = False,
+                     draft_model = speculative.create_draft_model(llm.n_ctx(), worker = True),
+                     **model_loader.llama_kwargs(tunables,
+                                                 keys = ("n_gpu_layers", "offload_kqv", "n_batch", "n_ubatch",
+                                                         "type_k", "type_v", "flash_attn")))  # Same offload and KV cache types as the LLM
+
+    worker_llms = []
+    try:
+        # Held so that an LLM being loaded at the same time does not change llama.cpp's default model params under the workers
+        with model_loader.ModelLoader.lock, ThreadPoolExecutor(max_workers = count) as executor:
+            for worker_llm in executor.map(create, range(count)):
+                worker_llms.append(worker_llm)
+    except:
+        close_worker_llms(worker_llms)
+        raise
+    return worker_llms
+
+def close_worker_llms(worker_llms):
+    for worker_llm in worker_llms:
+        try:
+            worker_llm.close()
+        except:
+            traceback.print_exc()
+
+def map_parts(worker_llms, chunks, analyse_part, on_part_done):
+    # Runs analyse_part(llm, index, chunk) for every chunk, with each worker LLM analysing one chunk at a time.
+    # llama.cpp releases the GIL while evaluating, so the workers run in parallel on separate cores.
+    # chunks can be a generator (e.g. a file that is still being read). Each chunk is handed to a worker as soon as it is read,
+    # and reading waits while every worker already has a chunk queued, so unread parts of the file are not held in memory.
+    # on_part_done(parts done, total parts or None while still reading) is called as each part finishes.
+    # Results are returned in line order, whatever order the parts finish in.
+    free_llms = queue.SimpleQueue()
+    for worker_llm in worker_llms:
+        free_llms.put(worker_llm)
+    in_flight = threading.Semaphore(2 * len(worker_llms))
+    count_lock = threading.Lock()
+    parts_done = 0
+    parts_total = None
+
+    def run(index, chunk):
+        worker_llm = free_llms.get()
+        try:
+            return analyse_part(worker_llm, index, chunk)
+        finally:
+            free_llms.put(worker_llm)
+
+    def on_done(future):
+        nonlocal parts_done
+        in_flight.release()
+        with count_lock:
+            parts_done += 1
+            done = parts_done
+        try:
+            on_part_done(done, parts_total)
+        except:
+            traceback.print_exc()
+
+    futures = []
+    with ThreadPoolExecutor(max_workers = len(worker_llms)) as executor:
+        for index, chunk in enumerate(chunks, start = 1):
+            in_flight.acquire()
+            future = executor.submit(run, index, chunk)
+            futures.append(future)
+            future.add_done_callback(on_done)
+        parts_total = len(futures)
+    return [future.result() for future in futures]
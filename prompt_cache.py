@@ -0,0 +1,68 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, hashlib
+
+# From external libraries
+from llama_cpp import LlamaRAMCache, LlamaDiskCache
+
+# From custom modules
+from config_handler import ConfigHandler, tunable_values
+
+class PromptCacheStats:
+    hits = 0
+    misses = 0
+
+class CacheStatsMixin:
+    # Counts lookups made by Llama._create_completion(). A hit means the KV state of the longest cached prefix is restored,
+    # so only the newly appended tokens of the prompt are evaluated.
+    def __getitem__(self, key):
+        try:
+            item = super().__getitem__(key)
+        except KeyError:
+            PromptCacheStats.misses += 1
+            raise
+        PromptCacheStats.hits += 1
+        return item
+
+class CountingRAMCache(CacheStatsMixin, LlamaRAMCache):
+    pass    # LRU eviction once capacity_bytes is exceeded
+
+class CountingDiskCache(CacheStatsMixin, LlamaDiskCache):
+    pass    # Stored with diskcache. Oldest entries are evicted once capacity_bytes is exceeded
+
+def default_cache_dir():
+    return os.path.join(ConfigHandler.dirname, "cache", "prompt_cache")
+
+def model_cache_dir(cache_dir, llm_path, ct_size, tunables):
+    # KV states are only valid for the same model file, context size and KV cache types, so each gets its own sub-folder
+    stat = os.stat(llm_path)
+    key = "|".join([os.path.abspath(llm_path), str(stat.st_size), str(int(stat.st_mtime)), str(ct_size), tunables["type_k"], tunables["type_v"]])
+    return os.path.join(cache_dir, os.path.basename(llm_path)+"-"+hashlib.sha1(key.encode("utf-8")).hexdigest()[:12])
+
+def create_prompt_cache(llm_path, ct_size, tunables = None):
+    # Returns the prompt cache set in config.ini ("off", "ram" or "disk"), or None if disabled.
+    # tunables are the performance tunables the LLM was loaded with (config.ini's if None).
+    if tunables is None:
+        tunables = tunable_values(ConfigHandler.cp["AI"])
+    mode = ConfigHandler.cp["AI"]["prompt_cache"]
+    capacity_bytes = int(ConfigHandler.cp["AI"]["prompt_cache_size_mb"]) << 20
+    PromptCacheStats.hits = 0
+    PromptCacheStats.misses = 0
+    match(mode):
+        case "ram":
+            return CountingRAMCache(capacity_bytes = capacity_bytes)
+        case "disk":
+            cache_dir = ConfigHandler.cp["AI"]["prompt_cache_dir"] or default_cache_dir()
+            return CountingDiskCache(cache_dir = model_cache_dir(cache_dir, llm_path, ct_size, tunables), capacity_bytes = capacity_bytes)
+        case _:
+            return None
+
+def cache_stats(cache):
+    if cache is None:
+        return "Prompt cache: off"
+    lookups = PromptCacheStats.hits + PromptCacheStats.misses
+    hit_rate = round(100*PromptCacheStats.hits/lookups, 1) if lookups else 0.0
+    return ("Prompt cache: hits="+str(PromptCacheStats.hits)+", misses="+str(PromptCacheStats.misses)+" ("+str(hit_rate)+"% hit rate), "
+            +"size="+str(cache.cache_size >> 20)+"MB")
@@ -0,0 +1,194 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import time, threading, traceback
+
+# From custom modules
+from config_handler import ConfigHandler
+from context_window import ContextWindow
+import parallel_analysis
+import core_funcs
+from core_funcs import LlmProcess
+
+# Serves several independent conversations (sessions) from the one loaded LLM, e.g. for headless mode with --sessions.
+# Each session has its own chat history, personality and context management. The sessions share a few context slots:
+# extra contexts of the loaded .gguf file (see parallel_analysis.create_worker_llms()), each with its own KV cache.
+# The slots are a pool: a whole context is handed to one session at a time and returned once its reply is done. Decode steps of
+# different sessions are not batched together. llama.cpp releases the GIL while evaluating, so the slots generate at the same time
+# on separate cores instead of the sessions waiting for each other. Context management is the same as the chat window's (see core_funcs).
+
+class Session:
+    # One conversation, separate from the chat window's (ChatSession)
+    def __init__(self, session_id, personality = "", context_mgmt = "", history_option = ""):
+        self.session_id = session_id
+        self.msglist = ContextWindow()
+        self.sys_prompt = personality or ConfigHandler.cp["AI"]["personality"] or "You are an AI Assistant."
+        self.context_mgmt = context_mgmt or ConfigHandler.cp["AI"]["context_mgmt"]
+        self.history_option = history_option or ConfigHandler.cp["AI"]["history_option"]
+        self.lock = threading.Lock()    # Turns of a session are replied to one at a time, in order
+        self.slot = None    # Slot that last replied to this session
+
+class SessionEngine:
+    lock = threading.Lock()
+    slot_free = threading.Condition(lock)   # Notified when a slot is released
+    sessions = {}       # Session id: Session
+    llm = None          # Loaded LLM that the slots were created from
+    slots = []          # LLM context of each slot
+    busy = []           # True while a slot is replying
+    last_owner = []     # Session id (or other owner id, see acquire_slot()) that each slot last replied to
+    last_used = []      # time.monotonic() each slot was last released, so the least recently used free slot is taken first
+    tokens = 0          # Tokens generated over all sessions
+    seconds = 0.0       # Time spent generating over all sessions (overlapping, so can be more than the wall time)
+
+def slot_count():
+    return max(1, int(ConfigHandler.cp["AI"]["session_slots"]))
+
+def start():
+    # Creates the slots for the loaded LLM, unless they already exist. Returns False if no LLM is loaded.
+    with SessionEngine.lock:
+        if SessionEngine.slots and SessionEngine.llm is LlmProcess.llm:
+            return True
+    stop()  # Slots of an LLM that has since been unloaded or replaced
+    llm = LlmProcess.llm
+    if llm is None:
+        return False
+    slots = parallel_analysis.create_worker_llms(llm, slot_count())
+    with SessionEngine.lock:
+        SessionEngine.llm = llm
+        SessionEngine.slots = slots
+        SessionEngine.busy = [False]*len(slots)
+        SessionEngine.last_owner = [None]*len(slots)
+        SessionEngine.last_used = [0.0]*len(slots)
+    return True
+
+def stop():
+    # Waits for replies in progress, then frees the slots. Sessions keep their chat histories.
+    with SessionEngine.slot_free:
+        while any(SessionEngine.busy):
+            SessionEngine.slot_free.wait()
+        slots = SessionEngine.slots
+        SessionEngine.llm = None
+        SessionEngine.slots = []
+        SessionEngine.busy = []
+        SessionEngine.last_owner = []
+        SessionEngine.last_used = []
+    parallel_analysis.close_worker_llms(slots)
+
+def get_session(session_id, **settings):
+    # Returns the session, creating it with settings (personality, context_mgmt, history_option) if it does not exist yet
+    with SessionEngine.lock:
+        session = SessionEngine.sessions.get(session_id)
+        if session is None:
+            session = Session(session_id, **settings)
+            SessionEngine.sessions[session_id] = session
+        return session
+
+def close_session(session_id):
+    with SessionEngine.lock:
+        SessionEngine.sessions.pop(session_id, None)
+
+def reset_session(session_id):
+    session = get_session(session_id)
+    with session.lock:
+        session.msglist.clear()
+
+def acquire_slot(owner):
+    # Waits for a free slot for owner (a session id, or any other id of whoever is generating) and returns (index, LLM context) of it.
+    # A slot that last replied to the same owner is taken if one is free, as its KV cache still holds the owner's earlier turns
+    # and only the new turn has to be evaluated. Otherwise the least recently used free slot is taken.
+    with SessionEngine.slot_free:
+        while not SessionEngine.slots or all(SessionEngine.busy):
+            if not SessionEngine.slots:
+                raise RuntimeError("Session slots are not started. Load an LLM and call session_engine.start() first.")
+            SessionEngine.slot_free.wait()
+        free = [index for index, busy in enumerate(SessionEngine.busy) if not busy]
+        owned = [index for index in free if SessionEngine.last_owner[index] == owner]
+        index = owned[0] if owned else min(free, key = lambda free_index: SessionEngine.last_used[free_index])
+        SessionEngine.busy[index] = True
+        SessionEngine.last_owner[index] = owner
+        return index, SessionEngine.slots[index]
+
+def release_slot(index, tokens, seconds):
+    with SessionEngine.slot_free:
+        if index < len(SessionEngine.busy):
+            SessionEngine.busy[index] = False
+            SessionEngine.last_used[index] = time.monotonic()
+        SessionEngine.tokens += tokens
+        SessionEngine.seconds += seconds
+        SessionEngine.slot_free.notify_all()    # Both acquire_slot() and stop() wait on this, so one wakeup could go to the wrong one
+
+def stream_text(model_output, on_text, cancel):
+    # Returns the streamed text, or what was generated before cancel was set
+    text = ""
+    for item in model_output:
+        if cancel is not None and cancel.is_set():
+            break
+        try:
+            content = item['choices'][0]['delta']['content']
+        except KeyError:
+            # First and last items of the stream have no 'content'
+            continue
+        text += content
+        if on_text is not None:
+            on_text(content)
+    return text
+
+def summarise_history(session, llm, context_size, cancel):
+    # Compresses the session's history into one summary, the same way send() does for the chat window (periodic_summary)
+    messages, max_tokens = core_funcs.summary_prompt(session.msglist, context_size)
+    summary = stream_text(core_funcs.generate_text_from_prompt(messages, max_tokens = max_tokens, temperature = 0.2, llm = llm), None, cancel)
+    if core_funcs.is_failed_summary(summary):
+        session.msglist.clear()
+        return False
+    session.msglist.replace([{"role": "assistant", "content": summary}])
+    return True
+
+def chat(session_id, prompt, on_text = None, cancel = None):
+    # Replies to prompt in the session, with the session's own history as context. Blocks until the reply is complete.
+    # on_text(text) is called with each piece of the reply as it is generated. Setting cancel (threading.Event) stops the reply early.
+    # Returns {"reply", "tokens", "seconds", "slot", "notes"}. Turns of the same session run in order; different sessions run in parallel.
+    session = get_session(session_id)
+    notes = []
+    with session.lock:
+        index, llm = acquire_slot(session.session_id)
+        session.slot = index
+        start_time = time.perf_counter()
+        reply = ""
+        try:
+            context_size = llm.n_ctx()
+            context_size_limit, max_tokens = core_funcs.context_limits(session.msglist, session.context_mgmt, context_size)
+            if session.context_mgmt == "periodic_summary" and not session.msglist.fits(context_size_limit):
+                if summarise_history(session, llm, context_size, cancel):
+                    notes.append("Context/memory limit reached. Compressed context/memory.")
+                else:
+                    notes.append("Failed context/memory compression. Earlier parts of the conversation were dropped.")
+            session.msglist.append("user", prompt)
+            if session.context_mgmt == "sliding_window":
+                core_funcs.fit_to_context(session.msglist, session.sys_prompt, max_tokens)
+            try:
+                reply = stream_text(core_funcs.generate_text_from_prompt([{"role": "system", "content": session.sys_prompt}] + session.msglist.messages(),
+                                                                         max_tokens = max_tokens, llm = llm),
+                                    on_text, cancel)
+            except ValueError:
+                notes.append("Context/memory exceeded. Wiping context/memory of this session.")
+                session.msglist.clear()
+            else:
+                if session.history_option == "on":
+                    session.msglist.append("assistant", reply)
+                else:
+                    session.msglist.clear()
+        except:
+            traceback.print_exc()
+            session.msglist.clear()
+            notes.append("Reply failed. See the console for details.")
+        finally:
+            seconds = time.perf_counter() - start_time
+            tokens = core_funcs.count_tokens(reply) if reply else 0
+            release_slot(index, tokens, seconds)
+    return {"reply": reply, "tokens": tokens, "seconds": round(seconds, 3), "slot": index, "notes": notes}
+
+def stats():
+    with SessionEngine.lock:
+        return {"sessions": len(SessionEngine.sessions), "slots": len(SessionEngine.slots), "busy": sum(SessionEngine.busy),
+                "tokens": SessionEngine.tokens, "seconds": round(SessionEngine.seconds, 3)}
@@ -0,0 +1,41 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import hashlib
+
+# From custom modules
+import state_store
+
+SESSION_VERSION = 1
+
+def session_settings(llm, sys_prompt):
+    # Everything that must be the same for a saved llama state to be restored as-is
+    return {"model": state_store.model_fingerprint(llm.model_path),
+            "n_ctx": llm.n_ctx(),
+            "kv_cache": state_store.kv_cache_types(llm),
+            "chat_format": str(llm.chat_format),
+            "chat_template": hashlib.sha256(llm.metadata.get("tokenizer.chat_template", "").encode("utf-8")).hexdigest(),
+            "personality": sys_prompt}
+
+def save_session(path, llm, messages, transcript, sys_prompt):
+    # Saves chat history (msglist), chat window transcript and the LLM's KV state into a single session file.
+    # transcript is a list of [text, [tags]] segments so that the chat window keeps its formatting when loaded.
+    header = {"kind": "session", "version": SESSION_VERSION, "msglist": messages, "transcript": transcript,
+              "personality": sys_prompt, "settings": None}
+    state = None
+    if llm is not None:
+        header["settings"] = session_settings(llm, sys_prompt)
+        state = llm.save_state()
+    state_store.write_state(path, state, header)
+
+def load_session(path):
+    # Returns (header, LlamaState or None). The state is memory-mapped, so loading a large session file is quick.
+    header, state = state_store.read_state(path)
+    if header.get("kind") != "session":
+        raise ValueError("Not a SOLAIRIA session file: "+path)
+    return header, state
+
+def can_restore_state(header, state, llm, sys_prompt):
+    # The saved KV state can only be used with the same model, context size, prompt template and personality
+    return llm is not None and state is not None and header["settings"] == session_settings(llm, sys_prompt)
@@ -0,0 +1,154 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, threading
+
+# From external libraries
+import numpy as np
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+# From custom modules
+from config_handler import ConfigHandler
+import config_handler
+import model_loader
+
+# Speculative decoding: a cheap guess of the next few tokens (the draft) is evaluated together with the current token in one batch,
+# and the LLM keeps the guessed tokens that it would have generated anyway. Every accepted draft token is a token that did not need
+# its own pass through the LLM, and replies are the same as without it.
+# - prompt_lookup: Guesses by finding the last few generated tokens earlier in the prompt and copying what followed them.
+#   Costs nearly nothing, and works best when replies quote the prompt (e.g. file analysis, which explains the text it is given).
+# - draft_model: Guesses with a small LLM of the same family (it must have the same vocabulary). Helps any kind of reply, at the cost of
+#   running the small LLM too.
+# The draft model is passed to Llama() when the LLM is created, as only then does llama-cpp-python keep the logits of every token
+# in a batch, which checking the draft tokens needs. Changing these settings therefore loads the LLM again (they are part of its pool key).
+
+class SpeculativeStats:
+    lock = threading.Lock()
+    mode = "off"
+    drafted = 0     # Draft tokens that the LLM has checked
+    accepted = 0    # Draft tokens that the LLM kept
+
+class DraftModel:
+    # Loaded draft_model LLM, reused as long as draft_model_path does not change.
+    # LLMs in the model pool may still be using a replaced draft LLM, so it is never closed here. It is freed once none of them use it.
+    lock = threading.Lock()
+    path = ""
+    tunables = None # Performance tunables the draft LLM was loaded with
+    llm = None
+
+class GgufDraftModel(LlamaDraftModel):
+    # Guesses the next num_pred_tokens tokens by greedy generation with a small LLM.
+    # Llama.generate() reuses the KV cache of the longest matching prefix, so only the tokens accepted since the last guess are evaluated.
+    def __init__(self, llm, num_pred_tokens):
+        self.llm = llm
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, **kwargs):
+        draft = []
+        for token in self.llm.generate(input_ids.tolist(), top_k = 1, temp = 0.0, repeat_penalty = 1.0, reset = True):
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens or token == self.llm.token_eos():
+                break
+        return np.array(draft, dtype = np.intc)
+
+class TrackedDraftModel(LlamaDraftModel):
+    # Passes guesses from draft_model on to the LLM, and counts how many of them it accepted.
+    # Llama.generate() asks for the next guess with every token accepted so far, so the guess before is checked against those tokens.
+    # One per LLM context, as it remembers that context's last guess.
+    def __init__(self, draft_model):
+        self.draft_model = draft_model
+        self.last_input = None
+        self.last_draft = None
+
+    def __call__(self, input_ids, **kwargs):
+        if self.last_input is not None and len(self.last_draft) > 0:
+            prefix_size = len(self.last_input)
+            if len(input_ids) > prefix_size and np.array_equal(input_ids[:prefix_size], self.last_input):   # Same reply, not a new prompt
+                following = input_ids[prefix_size:prefix_size + len(self.last_draft)]
+                matches = following == self.last_draft[:len(following)]
+                accepted = len(following) if matches.all() else int(np.argmin(matches))
+                with SpeculativeStats.lock:
+                    SpeculativeStats.drafted += len(self.last_draft)
+                    SpeculativeStats.accepted += accepted
+        draft = self.draft_model(input_ids, **kwargs)
+        self.last_input = np.array(input_ids, copy = True)   # input_ids is a view of the LLM's token buffer, which is overwritten later
+        self.last_draft = draft
+        return draft
+
+def mode():
+    return ConfigHandler.cp["AI"]["speculative"]
+
+def draft_tokens():
+    return max(1, int(ConfigHandler.cp["AI"]["spec_draft_tokens"]))
+
+def load_draft_llm(n_ctx):
+    # Returns the draft_model LLM for an LLM with n_ctx context, loading it if draft_model_path or the performance tunables have changed.
+    # It is loaded with the same tunables as the LLM (e.g. GPU Layers, so it stays on the CPU if the LLM does). Raises ValueError if no draft LLM is set.
+    path = ConfigHandler.cp["AI"]["spec_draft_model_path"]
+    if not path.endswith(".gguf"):
+        raise ValueError("No draft LLM file (.gguf format) is set for speculative decoding.")
+    tunables = config_handler.model_tunables(path)
+    with DraftModel.lock:
+        if DraftModel.llm is None or DraftModel.path != path or DraftModel.tunables != tunables or DraftModel.llm.n_ctx() < n_ctx:
+            DraftModel.llm = Llama(model_path = path, n_ctx = n_ctx, verbose = False, **model_loader.llama_kwargs(tunables))
+            DraftModel.path = path
+            DraftModel.tunables = tunables
+        return DraftModel.llm
+
+def create_draft_model(n_ctx, worker = False):
+    # Returns the draft model set in config.ini for an LLM with n_ctx context, or None if speculative decoding is off.
+    # Worker contexts (parallel file analysis, session slots) only use prompt_lookup, as a draft LLM can only guess for one context at a time.
+    match(mode()):
+        case "prompt_lookup":
+            return TrackedDraftModel(LlamaPromptLookupDecoding(max_ngram_size = max(1, int(ConfigHandler.cp["AI"]["spec_ngram_size"])),
+                                                               num_pred_tokens = draft_tokens()))
+        case "draft_model" if not worker:
+            return TrackedDraftModel(GgufDraftModel(load_draft_llm(n_ctx), draft_tokens()))
+        case _:
+            return None
+
+def prepare(n_ctx):
+    # Returns (draft model, error message) for an LLM with n_ctx context that is about to be loaded, to pass to Llama().
+    # The draft model is None (and the error message says why) if it could not be loaded.
+    reset_stats()
+    if mode() != "draft_model":
+        release_draft_llm()
+    try:
+        return create_draft_model(n_ctx), ""
+    except ValueError as e:
+        return None, str(e)
+
+def check_draft_llm(llm):
+    # Turns off the draft model of a loaded LLM if its draft LLM has a different vocabulary. Returns an error message if so, or "".
+    if mode() != "draft_model" or llm.draft_model is None:
+        return ""
+    with DraftModel.lock:
+        draft_llm = DraftModel.llm
+    if draft_llm is not None and draft_llm.n_vocab() != llm.n_vocab():
+        llm.draft_model = None
+        return "Draft LLM "+os.path.basename(DraftModel.path)+" has a different vocabulary from the loaded LLM. Use a smaller LLM of the same family."
+    return ""
+
+def release_draft_llm():
+    # Stops reusing the draft LLM for newly loaded LLMs. It is freed once no LLM in the model pool uses it.
+    with DraftModel.lock:
+        DraftModel.llm = None
+        DraftModel.path = ""
+        DraftModel.tunables = None
+
+def reset_stats():
+    with SpeculativeStats.lock:
+        SpeculativeStats.mode = mode()
+        SpeculativeStats.drafted = 0
+        SpeculativeStats.accepted = 0
+
+def stats_text():
+    # e.g. "Speculative decoding (prompt_lookup): 412/980 draft tokens accepted (42.0%)". "" if speculative decoding is off.
+    with SpeculativeStats.lock:
+        if SpeculativeStats.mode == "off":
+            return ""
+        rate = 100*SpeculativeStats.accepted/SpeculativeStats.drafted if SpeculativeStats.drafted else 0.0
+        return ("Speculative decoding ("+SpeculativeStats.mode+"): "+str(SpeculativeStats.accepted)+"/"+str(SpeculativeStats.drafted)
+                +" draft tokens accepted ("+str(round(rate, 1))+"%)")
@@ -0,0 +1,61 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import time, sys, importlib
+
+class StartupTimer:
+    # Imported first by main.py, so start_time is as close to process start as Python allows
+    start_time = time.perf_counter()
+    enabled = "--startup-report" in sys.argv    # Run as "main.py --startup-report" to print the report
+    budget = None   # Optional target for time-to-window in seconds, set with "--startup-budget=SECONDS"
+    imports = []    # (module name, seconds)
+    marks = {}      # Label: seconds since start_time
+    reported = False
+
+for arg in sys.argv:
+    if arg.startswith("--startup-budget="):
+        StartupTimer.enabled = True
+        StartupTimer.budget = float(arg.split("=", 1)[1])
+
+def elapsed():
+    return time.perf_counter() - StartupTimer.start_time
+
+def timed_import(name):
+    # Imports a module and records how long it took. Modules it imports that are not yet loaded are counted in its time,
+    # so main.py imports modules leaf-first to get each module's own time.
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    StartupTimer.imports.append((name, time.perf_counter() - start))
+    return module
+
+def mark(label):
+    if label not in StartupTimer.marks:
+        StartupTimer.marks[label] = elapsed()
+
+def window_shown():
+    mark("Window shown")
+    print_report()
+
+def model_ready(success):
+    mark("LLM ready" if success else "LLM not loaded")
+    print_report()
+
+def print_report():
+    # Printed once both the window is shown and the LLM has finished loading (or failed to)
+    if (not StartupTimer.enabled or StartupTimer.reported or "Window shown" not in StartupTimer.marks
+            or ("LLM ready" not in StartupTimer.marks and "LLM not loaded" not in StartupTimer.marks)):
+        return
+    StartupTimer.reported = True
+    print("\n---SOLAIRIA startup report---")
+    print("Imports:")
+    for name, seconds in StartupTimer.imports:
+        print(f"  {name:<20}{seconds*1000:>9.1f}ms")
+    print("Milestones (since start):")
+    for label, seconds in sorted(StartupTimer.marks.items(), key = lambda item: item[1]):
+        print(f"  {label:<20}{seconds*1000:>9.1f}ms")
+    if StartupTimer.budget is not None:
+        window_time = StartupTimer.marks["Window shown"]
+        result = "within" if window_time <= StartupTimer.budget else "OVER"
+        print(f"Time to window is {result} the {StartupTimer.budget}s budget ({window_time:.2f}s).")
+    print("For a per-module breakdown of every import, run with: python -X importtime main.py")
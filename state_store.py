@@ -0,0 +1,96 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import os, json, mmap, struct, hashlib
+
+# State file layout: MAGIC | header length (8 bytes, little-endian) | JSON header | input_ids | scores | llama_state
+# The header holds the caller's metadata and the offset/dtype/shape of each section, so sections can be read
+# straight from a memory-mapped file without copying the whole file into memory first.
+MAGIC = b"SOLSTAT1"
+
+def model_fingerprint(llm_path):
+    # Fast stand-in for hashing a multi-GB .gguf file: file size + first and last 16MB (GGUF header, metadata and tail of tensor data).
+    chunk_size = 16 << 20
+    size = os.path.getsize(llm_path)
+    sha = hashlib.sha256(str(size).encode("utf-8"))
+    with open(llm_path, "rb") as file:
+        sha.update(file.read(chunk_size))
+        if size > chunk_size:
+            file.seek(max(chunk_size, size - chunk_size))
+            sha.update(file.read(chunk_size))
+    return sha.hexdigest()
+
+def kv_cache_types(llm):
+    # A saved KV state can only be restored into a context with the same K/V cache types (see 'Performance' config), e.g. "1/1" for f16
+    return str(llm.context_params.type_k)+"/"+str(llm.context_params.type_v)
+
+def write_state(path, state, header):
+    # state can be None to write the header only (e.g. a chat session saved while no LLM is loaded).
+    header = dict(header)
+    sections = {}
+    if state is not None:
+        sections = state_sections(state, header)
+    offset = 0
+    for name, data in sections.items():
+        header[name]["offset"] = offset
+        header[name]["size"] = len(data)
+        offset += len(data)
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    tmp_path = path+".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(struct.pack("<Q", len(header_bytes)))
+        file.write(header_bytes)
+        for data in sections.values():
+            file.write(data)
+    os.replace(tmp_path, path)  # Replace only once fully written, so a half-written file is never read
+
+def state_sections(state, header):
+    import numpy as np  # Imported here, like in read_state(), so that numpy is only loaded when a state is saved or restored
+    # Only the last row of scores (logits) is kept. It is the only row used to sample the next token, and
+    # Llama.load_state() broadcasts it over the restored rows. Full scores can be hundreds of MB for large vocabularies.
+    scores = np.ascontiguousarray(state.scores[max(0, min(state.n_tokens, len(state.scores)) - 1):][:1])
+    input_ids = np.ascontiguousarray(state.input_ids)
+    header["n_tokens"] = state.n_tokens
+    header["seed"] = state.seed
+    header["llama_state_size"] = state.llama_state_size
+    header["input_ids"] = {"dtype": input_ids.dtype.str, "shape": list(input_ids.shape)}
+    header["scores"] = {"dtype": scores.dtype.str, "shape": list(scores.shape)}
+    header["llama_state"] = {}
+    return {"input_ids": input_ids.tobytes(), "scores": scores.tobytes(), "llama_state": bytes(state.llama_state)}
+
+def read_header(path):
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a SOLAIRIA state file: "+path)
+        header_len = struct.unpack("<Q", file.read(8))[0]
+        return json.loads(file.read(header_len).decode("utf-8"))
+
+def read_state(path):
+    # Returns (header, LlamaState), or (header, None) if the file holds no llama state.
+    # Arrays and llama_state are views into the memory-mapped file; Llama.load_state() copies what it needs.
+    import numpy as np  # Imported here so that numpy and llama_cpp are not loaded before the window is shown
+    from llama_cpp import LlamaState
+    with open(path, "rb") as file:
+        mm = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+    if mm[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a SOLAIRIA state file: "+path)
+    header_len = struct.unpack("<Q", mm[len(MAGIC):len(MAGIC)+8])[0]
+    data_start = len(MAGIC) + 8 + header_len
+    header = json.loads(mm[len(MAGIC)+8:data_start].decode("utf-8"))
+    if "llama_state" not in header:
+        return header, None
+
+    def section_array(name):
+        info = header[name]
+        return np.frombuffer(mm, dtype = np.dtype(info["dtype"]), count = info["size"]//np.dtype(info["dtype"]).itemsize,
+                             offset = data_start + info["offset"]).reshape(info["shape"])
+
+    info = header["llama_state"]
+    llama_state = memoryview(mm)[data_start + info["offset"]:data_start + info["offset"] + info["size"]]
+    state = LlamaState(input_ids = section_array("input_ids"), scores = section_array("scores"), n_tokens = header["n_tokens"],
+                       llama_state = llama_state, llama_state_size = header["llama_state_size"], seed = header["seed"])
+    return header, state
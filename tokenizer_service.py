@@ -0,0 +1,132 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import hashlib
+import threading
+from collections import OrderedDict
+
+# From custom modules
+from config_handler import ConfigHandler
+
+class TokenizerService:
+    lock = threading.Lock()
+    sp = None   # SentencePieceProcessor, loaded once on first use
+    llm = None  # Loaded Llama object. When set (and token_counter is "llm"), its own tokenizer is used instead of tokenizer.model
+    mode = ""   # Tokenizer currently used for the counts in the LRU ("llm" or "sentencepiece")
+    counts = OrderedDict()  # LRU of token counts. Key = hash of text, value = token count
+    max_entries = 8192  # Bound of the LRU. Each entry is a 20-byte digest and an int, so this stays well under 1MB
+
+def get_processor():
+    # Load the tokenizer.model only once per process. Double-checked so concurrent callers don't load it twice.
+    if TokenizerService.sp is None:
+        with TokenizerService.lock:
+            if TokenizerService.sp is None:
+                # Imported here so that sentencepiece is only loaded when a token count is first needed
+                import sentencepiece
+                # Using Llama tokenizer.model from https://huggingface.co/hf-internal-testing/llama-tokenizer/blob/main/tokenizer.model , dated 30 Mar 2023
+                TokenizerService.sp = sentencepiece.SentencePieceProcessor(model_file = ConfigHandler.dirname+"/tokenizer/tokenizer.model")
+    return TokenizerService.sp
+
+def text_key(text):
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size = 20).digest()
+
+def cache_get(key):
+    with TokenizerService.lock:
+        count = TokenizerService.counts.get(key)
+        if count is not None:
+            TokenizerService.counts.move_to_end(key)    # Mark as most recently used
+        return count
+
+def cache_put(key, count):
+    with TokenizerService.lock:
+        TokenizerService.counts[key] = count
+        TokenizerService.counts.move_to_end(key)
+        while len(TokenizerService.counts) > TokenizerService.max_entries:
+            TokenizerService.counts.popitem(last = False)   # Evict least recently used
+
+def clear_cache():
+    with TokenizerService.lock:
+        TokenizerService.counts.clear()
+
+def set_model(llm):
+    # Called whenever an LLM is loaded/unloaded. Cached counts belong to the previous tokenizer, so they are dropped.
+    with TokenizerService.lock:
+        TokenizerService.llm = llm
+    clear_cache()
+
+def active_mode():
+    # Count with the loaded LLM's own tokenizer if enabled, and fall back to the bundled tokenizer.model when no LLM is loaded
+    mode = "sentencepiece"
+    if ConfigHandler.cp["AI"]["token_counter"] == "llm" and TokenizerService.llm is not None:
+        mode = "llm"
+    if mode != TokenizerService.mode:
+        clear_cache()
+        TokenizerService.mode = mode
+    return mode
+
+def encode_with_llm(text):
+    # special = True so that template tokens within text (e.g. <|im_start|>) are counted the way the LLM sees them
+    return TokenizerService.llm.tokenize(text.encode("utf-8", "ignore"), add_bos = False, special = True)
+
+def count_tokens(text):
+    mode = active_mode()
+    key = text_key(text)
+    count = cache_get(key)
+    if count is None:
+        if mode == "llm":
+            count = len(encode_with_llm(text))
+        else:
+            count = len(get_processor().encode_as_ids(text))
+        cache_put(key, count)
+    return count
+
+def count_tokens_uncached(text):
+    # For one-off texts (e.g. lines of a file being chunked), which would only push chat history counts out of the LRU
+    if active_mode() == "llm":
+        return len(encode_with_llm(text))
+    return len(get_processor().encode_as_ids(text))
+
+def count_tokens_batch(texts):
+    # Returns a list of token counts in the same order as texts. Only texts not found in the LRU are encoded, in a single batch call.
+    mode = active_mode()
+    keys = [text_key(text) for text in texts]
+    counts = [cache_get(key) for key in keys]
+    missing = [index for index, count in enumerate(counts) if count is None]
+    if missing:
+        if mode == "llm":
+            encoded = [encode_with_llm(texts[index]) for index in missing]
+        else:
+            encoded = get_processor().encode([texts[index] for index in missing])
+        for index, ids in zip(missing, encoded):
+            counts[index] = len(ids)
+            cache_put(keys[index], counts[index])
+    return counts
+
+def render_chat_prompt(messages, add_generation_prompt = True):
+    # Renders messages with the loaded LLM's own chat template (from its metadata), which is what create_chat_completion() evaluates.
+    # Returns None if the template can't be rendered here (e.g. a preset Prompt Template was selected instead of 'auto').
+    llm = TokenizerService.llm
+    if llm is None or llm.chat_format != "chat_template.default":
+        return None
+    template = llm.metadata.get("tokenizer.chat_template")
+    if not template:
+        return None
+    try:
+        # Imported here as llama_cpp is only needed once an LLM is loaded
+        from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+        eos_token = llm.detokenize([llm.token_eos()], special = True).decode("utf-8", "ignore")
+        bos_token = llm.detokenize([llm.token_bos()], special = True).decode("utf-8", "ignore")
+        formatter = Jinja2ChatFormatter(template = template, eos_token = eos_token, bos_token = bos_token, add_generation_prompt = add_generation_prompt)
+        return formatter(messages = messages).prompt
+    except Exception:
+        return None
+
+def count_chat_tokens(messages):
+    # Token count of the full prompt for a chat completion request, including the prompt template's own tokens.
+    # Without a renderable template, each message is counted separately plus a small per-message allowance for role markers.
+    if active_mode() == "llm":
+        prompt = render_chat_prompt(messages)
+        if prompt is not None:
+            return count_tokens(prompt)
+    return sum(count_tokens_batch([item["content"] for item in messages])) + 4*len(messages)
@@ -0,0 +1,98 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# From built-in libraries
+import queue, traceback
+
+class UiBridge:
+    # Worker threads (e.g. 'Send' thread) must not call Tk directly. They post updates into this queue instead,
+    # and the Tk main loop drains it every interval_ms, so many streamed tokens become one insert and one scroll.
+    updates = queue.SimpleQueue()
+    interval_ms = 25    # ~40Hz
+    root = None
+    chat_box = None
+    status_var = None
+    sink = None # Set in headless mode. Updates go straight to it (e.g. stdout) instead of the Tk window
+
+def set_sink(sink):
+    # sink has chat(text, tag), status(text) and error(title, text) methods, called from whichever thread posts the update
+    UiBridge.sink = sink
+
+def is_headless():
+    return UiBridge.sink is not None
+
+def post_chat(text, tag = None):
+    if UiBridge.sink is not None:
+        UiBridge.sink.chat(text, tag)
+        return
+    UiBridge.updates.put(("chat", text, tag))
+
+def post_status(text):
+    if UiBridge.sink is not None:
+        UiBridge.sink.status(text)
+        return
+    UiBridge.updates.put(("status", text))
+
+def post_call(func, *args):
+    # Runs func(*args) on the Tk main thread, in order with the chat/status updates posted before it.
+    # In headless mode there is no Tk main thread, so func is run straight away.
+    if UiBridge.sink is not None:
+        func(*args)
+        return
+    UiBridge.updates.put(("call", func, args))
+
+def show_error(title, text):
+    if UiBridge.sink is not None:
+        UiBridge.sink.error(title, text)
+        return
+    from tkinter import messagebox  # Imported here so that headless mode runs without tkinter
+    messagebox.showinfo(title, text)
+
+def drain():
+    from tkinter import END, TclError   # Already loaded by the GUI. Imported here so that headless mode runs without tkinter
+    pending_text = []   # Consecutive chat inserts with the same tag, merged into one insert
+    pending_tag = None
+    status = None
+    scroll = False
+
+    def flush_chat():
+        nonlocal pending_text, scroll
+        if pending_text:
+            UiBridge.chat_box.insert(END, "".join(pending_text), pending_tag)
+            pending_text = []
+            scroll = True
+
+    try:
+        while True:
+            try:
+                update = UiBridge.updates.get_nowait()
+            except queue.Empty:
+                break
+            match(update[0]):
+                case "chat":
+                    if update[2] != pending_tag:
+                        flush_chat()
+                        pending_tag = update[2]
+                    pending_text.append(update[1])
+                case "status":
+                    status = update[1]  # Only the latest status is shown
+                case "call":
+                    flush_chat()
+                    update[1](*update[2])
+        flush_chat()
+        if scroll:
+            UiBridge.chat_box.see("end")
+        if status is not None:
+            UiBridge.status_var.set(status)
+    except:
+        traceback.print_exc()
+    try:
+        UiBridge.root.after(UiBridge.interval_ms, drain)
+    except TclError:
+        pass    # Application has been destroyed
+
+def start(root, chat_box, status_var):
+    UiBridge.root = root
+    UiBridge.chat_box = chat_box
+    UiBridge.status_var = status_var
+    root.after(UiBridge.interval_ms, drain)
@@ -0,0 +1,5 @@
+# SOLAIRIA (Software for Offline Loading of AI by Russ for Interaction and Assistance)
+# First written by Russ on 18 Jan 2024 (https://github.com/rrrusst/solairia).
+
+# Kept in its own module so that other modules can import it without importing main.py (which would run it a second time)
+version = "2.0.3"